@@ -1,8 +1,18 @@
 from openai import OpenAI
+import openai
+import httpx
+import random
 import sys
+import time
 from pathlib import Path
+from threading import Lock
 import utils as U
 
+try:
+    from .Metrics import LatencyStat
+except ImportError:
+    from Metrics import LatencyStat
+
 
 class API:
     def __init__(self, config):
@@ -11,18 +21,107 @@ class API:
         self.api_key = None
         self.url = None
         self.model = None
+        self.http_client = None
+        self.latency = LatencyStat('llm_call')
+        self.outcomes = {'ok': 0, 'retried': 0, 'error': 0, 'budget_exceeded': 0}
+        self._outcome_lock = Lock()
         self.init()
 
     def init(self):
-        self.api_key = self.config['provider']['api_key']
-        self.url = self._normalize_base_url(self.config['provider']['url'])
-        self.model = self.config['provider']['model']
+        provider = self.config['provider']
+        self.api_key = provider['api_key']
+        self.url = self._normalize_base_url(provider['url'])
+        self.model = provider['model']
+
+        # 网络参数（均可选）：连接/读取超时、连接池大小、重试次数与退避、单次调用的总耗时预算
+        http = self.config.get('http', {}) or {}
+        self.connect_timeout = float(http.get('connect_timeout', 5.0))
+        self.read_timeout = float(http.get('read_timeout', 30.0))
+        self.max_retries = int(http.get('max_retries', 2))
+        self.backoff_base = float(http.get('backoff_base', 0.5))
+        self.backoff_max = float(http.get('backoff_max', 4.0))
+        self.latency_budget = float(http.get('latency_budget', 20.0))
 
+        # 一个带连接池的 httpx.Client 供所有线程共用；重试由 _call 自己控制，以便遵守耗时预算
+        self.http_client = httpx.Client(
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=int(http.get('max_connections', 8)),
+                max_keepalive_connections=int(http.get('max_keepalive', 4)),
+                keepalive_expiry=float(http.get('keepalive_expiry', 30.0)),
+            ),
+        )
         self.client = OpenAI(
             api_key=self.api_key,
             base_url=self.url,
+            http_client=self.http_client,
+            max_retries=0,
         )
 
+    def _count(self, outcome):
+        with self._outcome_lock:
+            self.outcomes[outcome] += 1
+
+    def get_stats(self):
+        '''每次模型调用的耗时统计与结果计数'''
+        with self._outcome_lock:
+            outcomes = dict(self.outcomes)
+        return {'latency': self.latency.snapshot(), 'outcomes': outcomes}
+
+    @staticmethod
+    def _retryable(e):
+        if isinstance(e, (openai.APIConnectionError, openai.RateLimitError)):
+            return True  # APITimeoutError 是 APIConnectionError 的子类
+        if isinstance(e, openai.APIStatusError):
+            return e.status_code == 429 or e.status_code >= 500
+        return False
+
+    def _call(self, payload, deadline=None):
+        '''
+        带超时、重试（429/5xx/网络错误，指数退避 + 抖动）与总耗时预算的 chat.completions.create；
+        超出预算或不可重试的错误直接抛出。
+        流式请求（payload['stream']）收到响应头就返回，成功计数与耗时由 stream_response 在读完整个流后记录，
+        deadline（time.monotonic 时刻）由它传入，读取过程同样受这个预算约束
+        '''
+        t0 = time.monotonic()
+        if deadline is None:
+            deadline = t0 + self.latency_budget
+        streaming = bool(payload.get('stream'))
+        attempt = 0
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._count('budget_exceeded')
+                    raise TimeoutError(f'模型调用超出耗时预算 {self.latency_budget}s')
+                timeout = httpx.Timeout(
+                    min(self.read_timeout, remaining),
+                    connect=min(self.connect_timeout, remaining),
+                )
+                try:
+                    res = self.client.with_options(timeout=timeout).chat.completions.create(**payload)
+                    if not streaming:
+                        self._count('ok')
+                    return res
+                except Exception as e:
+                    if not self._retryable(e) or attempt >= self.max_retries:
+                        if isinstance(e, openai.APITimeoutError) and deadline - time.monotonic() <= 0:
+                            self._count('budget_exceeded')
+                        else:
+                            self._count('error')
+                        raise
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+                    if time.monotonic() + delay >= deadline:
+                        self._count('budget_exceeded')
+                        raise TimeoutError(f'模型调用超出耗时预算 {self.latency_budget}s') from e
+                    attempt += 1
+                    self._count('retried')
+                    print(f'模型调用失败（{e}），{delay:.1f}s 后第 {attempt} 次重试')
+                    time.sleep(delay)
+        finally:
+            if not streaming:
+                self.latency.record(time.monotonic() - t0)
+
     def _normalize_base_url(self, url):
         if not url or not isinstance(url, str):
             return url
@@ -32,14 +131,7 @@ class API:
             normalized = normalized[:-len('/chat/completions')]
         return normalized
 
-    def get_response(self, msgs):
-        '''
-        无论给谁，问 msgs，返回 response
-        '''
-        if not self.client:
-            print('client 未正确初始化，无法请求模型')
-            return None
-
+    def _build_payload(self, msgs):
         model_config = self.config.get('model', {})
         payload = {
             'model': self.model,
@@ -51,9 +143,19 @@ class API:
             value = model_config.get(field)
             if value is not None:
                 payload[field] = value
+        return payload
 
+    def get_response(self, msgs):
+        '''
+        无论给谁，问 msgs，返回 response
+        '''
+        if not self.client:
+            print('client 未正确初始化，无法请求模型')
+            return None
+
+        payload = self._build_payload(msgs)
         try:
-            completion = self.client.chat.completions.create(**payload)
+            completion = self._call(payload)
             if not completion.choices:
                 return None
             response = completion.choices[0].message.content or ''
@@ -62,6 +164,42 @@ class API:
             print(f'获取回复报错：{e}')
             return None
 
+    def stream_response(self, msgs):
+        '''
+        流式请求，逐块 yield 文本增量；出错时直接抛出异常，由调用方决定如何兜底
+        '''
+        if not self.client:
+            raise RuntimeError('client 未正确初始化，无法请求模型')
+
+        payload = self._build_payload(msgs)
+        payload['stream'] = True
+        payload.pop('n', None)
+        t0 = time.monotonic()
+        deadline = t0 + self.latency_budget
+        try:
+            stream = self._call(payload, deadline)
+            try:
+                for chunk in stream:
+                    # 每次读取的超时在 _call 中已按剩余预算收紧，这里再检查整体截止时间
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f'模型流式输出超出耗时预算 {self.latency_budget}s')
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            except Exception as e:
+                timed_out = isinstance(e, (TimeoutError, openai.APITimeoutError, httpx.TimeoutException))
+                self._count('budget_exceeded' if timed_out and time.monotonic() >= deadline else 'error')
+                raise
+            finally:
+                close = getattr(stream, 'close', None)
+                if close is not None:
+                    close()
+            self._count('ok')
+        finally:
+            self.latency.record(time.monotonic() - t0)
+
 
     def sending_list(self, msgs: list):
         print(f'Model 输入：')
@@ -78,6 +216,42 @@ class API:
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['bench_stub']:
+        # 演示：python API.py bench_stub，在本地假模型服务上验证重试、退避、超时与耗时预算，不需要真实的模型
+        try:
+            from .bench.StubLLM import StubLLMServer
+        except ImportError:
+            from bench.StubLLM import StubLLMServer
+
+        def run(label, http, server_kwargs, stream=False):
+            with StubLLMServer(**server_kwargs) as server:
+                api = API({'provider': {'api_key': 'stub', 'url': server.url, 'model': 'stub'}, 'http': http})
+                msgs = [{'role': 'user', 'content': '在吗' * 30}]
+                t0 = time.perf_counter()
+                try:
+                    if stream:
+                        res = ''.join(api.stream_response(msgs))
+                    else:
+                        res = api._call(api._build_payload(msgs)).choices[0].message.content
+                    result = f'成功（{len(res)} 字）'
+                except Exception as e:
+                    result = f'{type(e).__name__}'
+                cost = time.perf_counter() - t0
+                gaps = ', '.join(f'{b - a:.2f}' for a, b in zip(server.arrivals, server.arrivals[1:])) or '-'
+                stats = api.get_stats()
+                print(f'{label:<26} {result:<22} 耗时 {cost:5.2f}s，请求 {len(server.arrivals)} 次，重试间隔 [{gaps}]s，'
+                      f'记录耗时 {stats["latency"]["avg"]:.2f}s，{stats["outcomes"]}')
+
+        backoff = {'backoff_base': 0.2, 'backoff_max': 1.0}
+        run('503、429 后成功', {'max_retries': 2, **backoff}, {'failures': [503, 429]})
+        run('400 不重试', {'max_retries': 2, **backoff}, {'failures': [400]})
+        run('重试次数用尽', {'max_retries': 2, **backoff}, {'failures': [503, 503, 503]})
+        run('读取超时后重试', {'max_retries': 1, 'read_timeout': 0.5, **backoff}, {'stall': 0.8})
+        run('退避会超出预算', {'max_retries': 5, 'backoff_base': 0.8, 'latency_budget': 1.0}, {'failures': [503] * 5})
+        run('流式：预算内读完', {'latency_budget': 3.0}, {'ttft': 0.1, 'per_char': 0.01}, stream=True)
+        run('流式：读取中超出预算', {'latency_budget': 1.0}, {'ttft': 0.1, 'per_char': 0.03}, stream=True)
+        sys.exit(0)
+
     import yaml
     def load_yaml(file_path):
         with open(file_path, 'r', encoding='utf-8') as file:
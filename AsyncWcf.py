@@ -0,0 +1,206 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+_CLOSED = object()
+
+
+class AsyncWcf:
+    """
+    Wcf 的 asyncio 包装：
+    - `async for chat, msg in wcf.messages()`：收消息线程通过 loop.call_soon_threadsafe 直接把新消息投递到事件循环，
+      不需要轮询 get_msg，也不占用额外线程
+    - `await wcf.send_text(...)` / `send_image` / `get_friends`：提交给 UI 线程，等待对应的 Future
+    - `await wcf.close()`（或 `async with`）：结束所有 messages() 迭代并停止收消息；
+      取消正在 await 的发送会一并取消还没交给 UI 线程（例如还在润色、排在同一接收者前一条后面）或还在 UI 队列里的命令，
+      已经在键入的会照常完成
+    - maxsize 限制每个订阅的缓冲，消费太慢时丢弃最旧的消息，丢弃会打印出来并计入 stats()
+
+    用法：
+        async with AsyncWcf(Wcf()) as wcf:
+            async for chat, msg in wcf.messages():
+                await wcf.send_text(reply(msg), chat)
+    """
+
+    def __init__(self, wcf, maxsize: int = 0, include_self: bool = False, owns_wcf: bool = True) -> None:
+        """
+        maxsize: 每个 messages() 迭代器的缓冲上限，0 不限；满了之后丢弃最旧的一条并计入 dropped
+        include_self: 是否也投递自己（在其他设备上）发出的消息
+        owns_wcf: close() 时是否顺带 shutdown 整个 Wcf（UI 线程等），否则只停止收消息
+        """
+        self.wcf = wcf
+        self.maxsize = int(maxsize)
+        self.include_self = include_self
+        self.owns_wcf = owns_wcf
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dropped = 0
+        self._subscribers: set[asyncio.Queue] = set()
+        self._closed = False
+
+    async def __aenter__(self) -> "AsyncWcf":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def start(self, receive: bool = True) -> None:
+        """绑定当前事件循环并注册回调；receive=True 时同时启动收消息线程。close() 之后调用不做任何事"""
+        if self.loop is not None or self._closed:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.wcf.add_msg_listener(self._on_msgs)
+        if receive:
+            self.wcf.enable_receive_msg()
+
+    def _on_msgs(self, name, msgs) -> None:
+        # 在收消息线程中调用：只做一次线程安全的投递
+        if self._closed or self.loop is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._deliver, name, list(msgs))
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _deliver(self, name, msgs) -> None:
+        # 在事件循环线程中执行；close() 之前已经排进事件循环的投递在这里丢弃
+        if self._closed:
+            return
+        for msg in msgs:
+            if not self.include_self and self.wcf.is_msg_from_me(msg):
+                continue
+            for q in self._subscribers:
+                if self.maxsize and q.qsize() >= self.maxsize:
+                    q.get_nowait()
+                    self.dropped += 1
+                    if self.dropped == 1 or self.dropped % 100 == 0:
+                        print(f'messages() 消费太慢，缓冲已满（maxsize={self.maxsize}），累计丢弃最旧的消息 {self.dropped} 条')
+                q.put_nowait((name, msg))
+
+    async def messages(self) -> AsyncIterator[tuple]:
+        """逐条产出 (chat, WxMsg)；每次调用得到一个独立的订阅，close() 后结束（close() 之后调用立即结束）"""
+        if self._closed:
+            return
+        if self.loop is None:
+            await self.start()
+        q: asyncio.Queue = asyncio.Queue()
+        self._subscribers.add(q)
+        try:
+            while not self._closed:
+                item = await q.get()
+                if item is _CLOSED:
+                    break
+                yield item
+        finally:
+            self._subscribers.discard(q)
+
+    def stats(self) -> dict:
+        """订阅数、各订阅缓冲中最多的积压条数，以及因缓冲满而丢弃的消息数"""
+        return {
+            "subscribers": len(self._subscribers),
+            "backlog": max((q.qsize() for q in self._subscribers), default=0),
+            "maxsize": self.maxsize,
+            "dropped": self.dropped,
+        }
+
+    async def send_text(self, text: str, receiver: str, need_decorate: bool = True, pacing: str | None = None) -> int:
+        return await asyncio.wrap_future(self.wcf.submit_send_text(text, receiver, need_decorate, pacing))
+
+    async def send_text_now(self, text: str, receiver: str, pacing: str | None = None) -> int:
+        return await asyncio.wrap_future(self.wcf.submit_send_text_now(text, receiver, pacing=pacing))
+
+    async def send_image(self, path: str, receiver: str, pacing: str | None = None) -> int:
+        return await asyncio.wrap_future(self.wcf.submit_send_image(path, receiver, pacing))
+
+    async def get_friends(self, pacing: str | None = None) -> list[str]:
+        return await asyncio.wrap_future(self.wcf.submit_get_friends(pacing))
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """结束所有 messages() 迭代，停止收消息（owns_wcf 时停止整个 Wcf）；可重复调用"""
+        if self._closed:
+            return
+        self._closed = True
+        self.wcf.remove_msg_listener(self._on_msgs)
+        for q in list(self._subscribers):
+            q.put_nowait(_CLOSED)
+        stop = self.wcf.shutdown if self.owns_wcf else self.wcf.disable_receive_msg
+        # join 收消息线程是阻塞调用，放到线程池里，不卡住事件循环
+        await asyncio.get_running_loop().run_in_executor(None, lambda: stop(timeout=timeout))
+
+
+if __name__ == "__main__":
+    # 基准：从“收消息线程写入缓存”到“asyncio 消费者拿到消息”的延迟，
+    # 对比 call_soon_threadsafe 投递与原来的 run_in_executor(get_msg(timeout)) 轮询
+    import queue
+    import threading
+    import time
+
+    n, gap, poll_timeout = 300, 0.002, 1.0
+
+    class _Producer:
+        """只实现 AsyncWcf 用到的接口，模拟收消息线程每隔 gap 秒写入一条新消息"""
+
+        def __init__(self):
+            self.listeners = []
+            self.new_msg_queue = queue.Queue()
+            self.stop = threading.Event()
+
+        def add_msg_listener(self, fn):
+            self.listeners.append(fn)
+
+        def remove_msg_listener(self, fn):
+            self.listeners.remove(fn)
+
+        def is_msg_from_me(self, msg):
+            return False
+
+        def enable_receive_msg(self):
+            def run():
+                for i in range(n):
+                    time.sleep(gap)
+                    sent = time.perf_counter()
+                    self.new_msg_queue.put(('bench', sent))
+                    for fn in list(self.listeners):
+                        fn('bench', [sent])
+            threading.Thread(target=run, daemon=True).start()
+
+        def disable_receive_msg(self, timeout=5.0):
+            pass
+
+        def get_msg(self, timeout=1.0):
+            try:
+                return self.new_msg_queue.get(timeout=timeout)
+            except queue.Empty:
+                return None, None
+
+    def report(name, lat, shutdown):
+        lat.sort()
+        print(f'{name:<22} 平均 {sum(lat) / len(lat) * 1e6:7.0f} us，p99 {lat[int(len(lat) * 0.99)] * 1e6:7.0f} us，'
+              f'最后一条后关闭耗时 {shutdown * 1000:7.1f} ms')
+
+    async def bench_push():
+        wcf = AsyncWcf(_Producer(), owns_wcf=False)
+        lat = []
+        async with wcf:
+            async for _, sent in wcf.messages():
+                lat.append(time.perf_counter() - sent)
+                if len(lat) == n:
+                    break
+            t0 = time.perf_counter()
+        report('call_soon_threadsafe', lat, time.perf_counter() - t0)
+
+    async def bench_poll():
+        producer = _Producer()
+        producer.enable_receive_msg()
+        loop = asyncio.get_running_loop()
+        lat = []
+        while len(lat) < n:
+            _, sent = await loop.run_in_executor(None, producer.get_msg, poll_timeout)
+            if sent is not None:
+                lat.append(time.perf_counter() - sent)
+        # 原来的模式下关闭时要等最后一次 get_msg(timeout) 超时返回
+        t0 = time.perf_counter()
+        await loop.run_in_executor(None, producer.get_msg, poll_timeout)
+        report('run_in_executor 轮询', lat, time.perf_counter() - t0)
+
+    asyncio.run(bench_push())
+    asyncio.run(bench_poll())
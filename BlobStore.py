@@ -0,0 +1,116 @@
+import base64
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+BLOB_URI_RE = re.compile(r"^blob:(?P<mime>[\w.+-]+/[\w.+-]+);sha256,(?P<digest>[0-9a-f]{64})$")
+
+MIME_EXT = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/bmp": ".bmp",
+}
+
+
+def sniff_mime(data: bytes, default: str = "application/octet-stream") -> str:
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    return default
+
+
+def is_blob_uri(content) -> bool:
+    return isinstance(content, str) and BLOB_URI_RE.match(content) is not None
+
+
+class BlobStore:
+    """
+    按内容寻址的图片存储：文件以 sha256 命名（root/ab/abcdef....png），相同图片跨聊天只存一份。
+    图片 WxMsg 的 content 只保存引用 `blob:<mime>;sha256,<hex>`，
+    需要时再用 data_url / read_bytes / open_mmap 取出内容。
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str, mime: str) -> Path:
+        return self.root / digest[:2] / (digest + MIME_EXT.get(mime, ".bin"))
+
+    def put_bytes(self, data: bytes, mime: Optional[str] = None) -> str:
+        """写入（已存在则跳过），返回 blob 引用"""
+        mime = mime or sniff_mime(data)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, mime)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except Exception:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        return f"blob:{mime};sha256,{digest}"
+
+    def put_file(self, file_path: str | Path) -> str:
+        """原样保存文件字节，不做任何重新编码"""
+        with open(file_path, "rb") as f:
+            data = f.read()
+        return self.put_bytes(data)
+
+    def resolve(self, uri: str) -> Path:
+        m = BLOB_URI_RE.match(uri or "")
+        if not m:
+            raise ValueError(f'not a blob uri: {uri!r}')
+        return self._path(m.group("digest"), m.group("mime"))
+
+    def mime_of(self, uri: str) -> str:
+        m = BLOB_URI_RE.match(uri or "")
+        if not m:
+            raise ValueError(f'not a blob uri: {uri!r}')
+        return m.group("mime")
+
+    def read_bytes(self, uri: str) -> bytes:
+        return self.resolve(uri).read_bytes()
+
+    def open_mmap(self, uri: str) -> mmap.mmap:
+        """只读内存映射，调用方负责 close()"""
+        with open(self.resolve(uri), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def link_original(self, uri: str, original_uri: str) -> None:
+        """记录 uri 是由 original_uri 转换得到的（例如缩放后的图片与原图）"""
+        if uri == original_uri:
+            return
+        self.resolve(uri).with_suffix(".orig").write_text(original_uri, encoding="utf-8")
+
+    def original_of(self, uri: str) -> Optional[str]:
+        """uri 对应的原图引用，没有保留原图时返回 None"""
+        link = self.resolve(uri).with_suffix(".orig")
+        if not link.exists():
+            return None
+        return link.read_text(encoding="utf-8").strip() or None
+
+    def data_url(self, uri: str) -> str:
+        """按需生成 data URL；content 不是 blob 引用时原样返回（例如旧的内联 data URL）"""
+        if not is_blob_uri(uri):
+            return uri
+        b64 = base64.b64encode(self.read_bytes(uri)).decode("ascii")
+        return f"data:{self.mime_of(uri)};base64,{b64}"
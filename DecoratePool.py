@@ -0,0 +1,125 @@
+import random
+import re
+import time
+from collections import OrderedDict
+from threading import Lock, Thread
+from typing import Callable, Optional
+
+
+class _Entry:
+    __slots__ = ("source", "variants", "used", "created_at", "refilling", "failed_at")
+
+    def __init__(self, source: str) -> None:
+        self.source = source  # 原文（未规范化），请求改写时用它
+        self.variants: list[str] = []
+        self.used: set[str] = set()  # 本批已经发出去的版本，补充时清空
+        self.created_at = time.monotonic()
+        self.refilling = False
+        self.failed_at: Optional[float] = None  # 上一次补充失败（出错或一个版本都没拿到）的时刻
+
+
+class VariantPool:
+    """
+    润色结果的预生成池，按规范化后的原文分组（规范化只用作分组的键，请求改写时用原文）：
+      - 第一次遇到某段原文时在后台向模型要 batch_size 个改写版本，这一次 get 返回 None，由调用方自己润色一次，
+        发送路径上最多只有一次模型调用
+      - 每次发送随机取一个本批中没用过的版本
+      - 剩余不足 low_water 个时在后台线程补充；补充失败后 retry_after 秒内不再尝试
+      - 超过 ttl 秒的分组整体作废，分组数超过 max_keys 时淘汰最久未用的
+    fetch(text, n) 负责向模型请求 n 个改写，返回字符串列表
+    """
+
+    def __init__(
+            self,
+            fetch: Callable[[str, int], list[str]],
+            batch_size: int = 5,
+            low_water: int = 2,
+            ttl: float = 6 * 3600,
+            max_keys: int = 200,
+            retry_after: float = 60.0,
+    ) -> None:
+        self.fetch = fetch
+        self.batch_size = max(1, int(batch_size))
+        self.low_water = max(0, int(low_water))
+        self.ttl = float(ttl)
+        self.max_keys = max(1, int(max_keys))
+        self.retry_after = max(0.0, float(retry_after))
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", str(text or "")).strip()
+
+    def _entry(self, key: str, source: str) -> _Entry:
+        """返回 key 对应的分组，没有（或已过期）时新建，调用方需持有锁"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.created_at > self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            entry = self._entries[key] = _Entry(source)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+            return entry
+        self._entries.move_to_end(key)
+        return entry
+
+    def _fill(self, entry: _Entry) -> None:
+        try:
+            variants = self.fetch(entry.source, self.batch_size) or []
+        except Exception as e:
+            print(f'预生成润色版本失败：{e}')
+            variants = []
+        with self._lock:
+            # 新的一批：上一批用过的版本不再排除，used 不会无限增长
+            entry.used.clear()
+            for v in variants:
+                v = str(v).strip()
+                if v and v not in entry.variants:
+                    entry.variants.append(v)
+            entry.failed_at = None if variants else time.monotonic()
+            entry.refilling = False
+
+    def _refill_async(self, entry: _Entry) -> None:
+        # 调用方需持有锁
+        if entry.refilling:
+            return
+        if entry.failed_at is not None and time.monotonic() - entry.failed_at < self.retry_after:
+            return
+        entry.refilling = True
+        Thread(target=self._fill, args=(entry,), name="DecoratePoolRefill", daemon=True).start()
+
+    def get(self, text: str) -> Optional[str]:
+        """取一个本批没用过的改写版本；池子暂时为空（第一次遇到、正在后台补充或补充失败）时返回 None，由调用方退回单次润色"""
+        key = self.normalize(text)
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entry(key, str(text))
+            if not entry.variants:
+                self.misses += 1
+                self._refill_async(entry)
+                return None
+            variant = entry.variants.pop(random.randrange(len(entry.variants)))
+            entry.used.add(variant)
+            self.hits += 1
+            if len(entry.variants) < self.low_water:
+                self._refill_async(entry)
+            return variant
+
+    def warm(self, text: str) -> None:
+        """提前为某段原文生成改写版本（后台进行）"""
+        key = self.normalize(text)
+        if not key:
+            return
+        with self._lock:
+            entry = self._entry(key, str(text))
+            if len(entry.variants) < self.batch_size:
+                self._refill_async(entry)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(e.variants) for e in self._entries.values())
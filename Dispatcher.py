@@ -0,0 +1,283 @@
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from threading import Condition, Lock
+from typing import Any, Callable, Iterable, Optional
+
+try:
+    from .Metrics import LatencyStat
+except ImportError:
+    from Metrics import LatencyStat
+
+
+def make_filter(spec) -> Callable[[str, Any], bool]:
+    """
+    把 on_message 的 filter 参数统一成 fn(chat, msg) -> bool：
+      None 全部；str 只要该聊天；list/set/tuple 其中任一聊天；callable 原样使用
+    """
+    if spec is None:
+        return lambda chat, msg: True
+    if callable(spec):
+        return spec
+    if isinstance(spec, str):
+        return lambda chat, msg: chat == spec
+    chats = frozenset(spec)
+    return lambda chat, msg: chat in chats
+
+
+@dataclass
+class Handler:
+    name: str
+    match: Callable[[str, Any], bool]
+    fn: Callable[[str, Any], Any]
+    timeout: Optional[float]
+    include_self: bool = False
+    latency: LatencyStat = field(default=None)
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    stuck: int = 0    # 已超时但仍在执行的调用数
+    refused: int = 0  # 因为卡住的调用太多而跳过的消息数
+
+    def __post_init__(self):
+        if self.latency is None:
+            self.latency = LatencyStat(f'{self.name} latency')
+
+
+class Dispatcher:
+    """
+    把新消息分发给注册的处理函数：
+      - 不同聊天的消息在 workers 个线程里并行处理，同一聊天严格按到达顺序一条条处理
+      - 每个处理函数可设超时：还没开始的调用超时后直接取消，记一次 timeout 并继续处理下一条。
+        已经在跑的无法强行中止，会继续占着一个线程跑完：这期间该聊天暂停（分发线程先去处理别的聊天），
+        等它返回后再从下一个处理函数、下一条消息继续，同一聊天的顺序不会被打乱。
+        处理函数线程池比 workers 多 spare_workers 个线程，留给这些卡住的调用；卡住的总数达到 spare_workers 后，
+        已有调用卡住的处理函数暂不再调用（记入 refused），线程数始终不超过 workers + spare_workers
+      - 在途消息数（排队 + 处理中）有上限 max_inflight：dispatch 本身从不阻塞（它运行在 UI 线程里，
+        阻塞会让处理函数里的发送永远等不到 UI 线程），由收消息循环在每轮轮询前调用 wait_capacity 等待，
+        从而把压力传回轮询
+      - 记录每个处理函数的耗时（从真正开始执行算起，超时的调用在跑完时记录），以及消息从到达到开始处理的排队时间
+    """
+
+    def __init__(
+            self,
+            workers: int = 4,
+            max_inflight: int = 64,
+            default_timeout: Optional[float] = 30.0,
+            is_self: Optional[Callable[[Any], bool]] = None,
+            spare_workers: Optional[int] = None,
+    ) -> None:
+        self.workers = max(1, int(workers))
+        self.spare_workers = self.workers if spare_workers is None else max(0, int(spare_workers))
+        self.max_inflight = max(1, int(max_inflight))
+        self.default_timeout = default_timeout
+        self.is_self = is_self or (lambda msg: False)
+        self.handlers: list[Handler] = []
+        self.queue_wait = LatencyStat('dispatch_queue_wait')
+        self.inflight = 0
+        self.high_water = 0
+        self.stuck = 0  # 已超时但仍在执行的调用数
+        self._stats_lock = Lock()  # 保护 stuck 与各 Handler 的计数
+        self._chats: dict[str, deque] = {}  # chat -> 待处理的 (msg, 到达时刻)，有 key 表示该聊天正在被某个线程处理
+        self._cv = Condition()
+        self._closed = False
+        self._drain_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Dispatch")
+        self._handler_pool = ThreadPoolExecutor(max_workers=self.workers + self.spare_workers, thread_name_prefix="Handler")
+
+    def add(self, match, fn, timeout=..., include_self: bool = False, name: Optional[str] = None) -> Handler:
+        """注册处理函数 fn(chat, msg)；timeout 省略时用 default_timeout，None 表示不限"""
+        handler = Handler(
+            name=name or getattr(fn, "__name__", f"handler{len(self.handlers)}"),
+            match=make_filter(match),
+            fn=fn,
+            timeout=self.default_timeout if timeout is ... else timeout,
+            include_self=include_self,
+        )
+        with self._cv:
+            self.handlers = self.handlers + [handler]  # 复制后替换，处理线程遍历时不用加锁
+        return handler
+
+    def remove(self, handler: Handler) -> None:
+        with self._cv:
+            self.handlers = [h for h in self.handlers if h is not handler]
+
+    def dispatch(self, chat: str, msgs: Iterable) -> None:
+        """登记 chat 的一批新消息，立即返回"""
+        now = time.perf_counter()
+        with self._cv:
+            if self._closed or not self.handlers:
+                return
+            pending = self._chats.get(chat)
+            start = pending is None
+            if start:
+                pending = self._chats[chat] = deque()
+            for msg in msgs:
+                pending.append((msg, now))
+                self.inflight += 1
+            self.high_water = max(self.high_water, self.inflight)
+            if start and not pending:
+                del self._chats[chat]
+                return
+        if start:
+            self._drain_pool.submit(self._drain, chat)
+
+    def wait_capacity(self, timeout: Optional[float] = None) -> bool:
+        """阻塞直到在途消息数低于 max_inflight；超时返回 False"""
+        with self._cv:
+            return self._cv.wait_for(lambda: self.inflight < self.max_inflight or self._closed, timeout)
+
+    def _drain(self, chat: str, resume: Optional[tuple] = None) -> None:
+        # 同一时刻每个聊天最多一个线程在跑 _drain，保证顺序；
+        # resume 为 (msg, 剩余的处理函数)：卡住的调用返回后从这里接着处理，期间该聊天不会被别的线程处理
+        while True:
+            if resume is None:
+                with self._cv:
+                    pending = self._chats[chat]
+                    if not pending:
+                        del self._chats[chat]
+                        return
+                    msg, arrived = pending.popleft()
+                self.queue_wait.record(time.perf_counter() - arrived)
+                handlers = self.handlers
+            else:
+                (msg, handlers), resume = resume, None
+            parked = None
+            try:
+                parked = self._handle(chat, msg, handlers)
+            finally:
+                if parked is None:
+                    with self._cv:
+                        self.inflight -= 1
+                        self._cv.notify_all()
+            if parked is not None:
+                fut, h, rest = parked
+                # 该聊天暂停，_chats 里保留它的 key，dispatch 不会另起线程；卡住的调用返回后再继续
+                fut.add_done_callback(lambda _: self._resume(chat, msg, h, rest))
+                return
+
+    def _resume(self, chat: str, msg, h: Handler, rest: list) -> None:
+        with self._stats_lock:
+            self.stuck -= 1
+            h.stuck -= 1
+        try:
+            self._drain_pool.submit(self._drain, chat, (msg, rest))
+        except RuntimeError:
+            pass  # 已经 shutdown
+
+    def _handle(self, chat: str, msg, handlers: list) -> Optional[tuple]:
+        """依次调用 handlers；某个调用超时且已在执行时返回 (fut, handler, 剩余的处理函数)，否则返回 None"""
+        from_self = self.is_self(msg)
+        for i, h in enumerate(handlers):
+            if from_self and not h.include_self:
+                continue
+            try:
+                if not h.match(chat, msg):
+                    continue
+            except Exception as e:
+                print(f'消息过滤函数 {h.name} 报错：{e}')
+                continue
+            fut = self._submit(h, chat, msg)
+            if fut is None:
+                print(f'[{chat}] 处理函数 {h.name} 还有 {h.stuck} 个调用卡住未返回，跳过这条消息')
+                continue
+            try:
+                fut.result(timeout=h.timeout)
+            except FutureTimeout:
+                with self._stats_lock:
+                    h.timeouts += 1
+                if not fut.cancel():
+                    # 已经在执行，只能让它跑完；跑完前一直算作卡住，该聊天的后续处理也等它返回
+                    with self._stats_lock:
+                        self.stuck += 1
+                        h.stuck += 1
+                    print(f'[{chat}] 处理函数 {h.name} 超过 {h.timeout}s 未返回，该聊天暂停到它返回为止')
+                    return fut, h, handlers[i + 1:]
+                print(f'[{chat}] 处理函数 {h.name} 超过 {h.timeout}s 未开始，跳过这条消息')
+            except Exception as e:
+                with self._stats_lock:
+                    h.errors += 1
+                print(f'[{chat}] 处理函数 {h.name} 报错：{e}')
+        return None
+
+    def _submit(self, h: Handler, chat: str, msg) -> Optional[Future]:
+        """提交到处理函数线程池；卡住的调用已占满 spare_workers 且 h 自己也有卡住的调用时拒绝，返回 None"""
+        def call():
+            t0 = time.perf_counter()
+            try:
+                return h.fn(chat, msg)
+            finally:
+                h.latency.record(time.perf_counter() - t0)
+
+        with self._stats_lock:
+            if h.stuck and self.stuck >= self.spare_workers:
+                h.refused += 1
+                return None
+            h.calls += 1
+        return self._handler_pool.submit(call)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """不再接收新消息，丢弃尚未开始处理的消息"""
+        with self._cv:
+            self._closed = True
+            for pending in self._chats.values():
+                self.inflight -= len(pending)
+                pending.clear()
+            self._cv.notify_all()
+        self._drain_pool.shutdown(wait=wait)
+        self._handler_pool.shutdown(wait=wait)
+
+    def snapshot(self) -> dict:
+        with self._cv:
+            inflight, active = self.inflight, len(self._chats)
+            handlers = list(self.handlers)
+        with self._stats_lock:
+            stuck = self.stuck
+            counts = {h.name: {"calls": h.calls, "errors": h.errors, "timeouts": h.timeouts,
+                               "stuck": h.stuck, "refused": h.refused} for h in handlers}
+        return {
+            "inflight": inflight,
+            "high_water": self.high_water,
+            "active_chats": active,
+            "stuck": stuck,
+            "queue_wait": self.queue_wait.snapshot(),
+            "handlers": {h.name: {**counts[h.name], "latency": h.latency.snapshot()} for h in handlers},
+        }
+
+
+if __name__ == "__main__":
+    # 演示：5 个聊天各 10 条消息，处理函数每条耗时 50ms；串行 get_msg 循环需要约 2.5s
+    import threading
+
+    d = Dispatcher(workers=5, max_inflight=20, default_timeout=0.2, spare_workers=2)
+    order: dict[str, list[int]] = {}
+    lock = threading.Lock()
+
+    def slow_reply(chat, msg):
+        time.sleep(0.05)
+        with lock:
+            order.setdefault(chat, []).append(msg)
+
+    def sometimes_stuck(chat, msg):
+        if msg in (3, 4, 5, 6, 7):
+            time.sleep(0.5)  # 连续卡住：chat0 暂停到它返回，别的聊天不受影响
+
+    d.add(None, slow_reply)
+    d.add('chat0', sometimes_stuck)
+    t0 = time.perf_counter()
+    for i in range(10):
+        for c in range(5):
+            d.wait_capacity()
+            d.dispatch(f'chat{c}', [i])
+    d.wait_capacity()
+    with d._cv:
+        d._cv.wait_for(lambda: d.inflight == 0)
+    cost = time.perf_counter() - t0
+    in_order = all(v == sorted(v) and len(v) == 10 for v in order.values())
+    snap = d.snapshot()
+    print(f'50 条消息 {cost:.2f}s，各聊天内顺序正确：{in_order}，在途高水位 {snap["high_water"]}，'
+          f'平均排队 {snap["queue_wait"]["avg"] * 1000:.0f} ms，仍卡住 {snap["stuck"]} 个')
+    for name, st in snap['handlers'].items():
+        print(f'  {name}: {st["calls"]} 次，超时 {st["timeouts"]} 次，跳过 {st["refused"]} 次，'
+              f'平均 {st["latency"]["avg"] * 1000:.0f} ms')
+    d.shutdown()
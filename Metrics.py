@@ -0,0 +1,48 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+
+class LatencyStat:
+    """线程安全的耗时统计：次数、总耗时、最大值、最近一次（秒）"""
+
+    def __init__(self, name: str = "") -> None:
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self._lock = Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    @contextmanager
+    def timer(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - t0)
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "avg": self.total / self.count if self.count else 0.0,
+                "max": self.max,
+                "last": self.last,
+                "total": self.total,
+            }
+
+    def __repr__(self) -> str:
+        return f"{self.name or 'LatencyStat'}(count={self.count}, avg={self.avg * 1000:.1f}ms, max={self.max * 1000:.1f}ms)"
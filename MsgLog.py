@@ -0,0 +1,145 @@
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock, local
+from typing import Optional
+
+try:
+    from .WxMsg import WxMsg
+except ImportError:
+    from WxMsg import WxMsg
+
+
+class MsgLog:
+    """
+    基于 sqlite3（WAL 模式）的持久化消息记录，可选启用：
+      - 以 (chat, seq) 为主键，(chat, hash_id) 建索引，重启后依然可以判重
+      - append 只写入内存缓冲，flush 时一个事务批量插入（由接收线程在每轮结束时调用）
+      - 读操作每个线程独立连接，WAL 下读不会阻塞写入
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS msgs (
+        chat TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        hash_id TEXT NOT NULL,
+        type INTEGER NOT NULL,
+        sender TEXT,
+        roomid TEXT,
+        content TEXT,
+        is_meaningful INTEGER NOT NULL,
+        ts REAL NOT NULL,
+        PRIMARY KEY (chat, seq)
+    );
+    CREATE INDEX IF NOT EXISTS idx_msgs_chat_hash ON msgs (chat, hash_id);
+    """
+
+    def __init__(self, path: str | Path, batch_size: int = 32) -> None:
+        self.path = str(path)
+        self.batch_size = max(1, int(batch_size))
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._pending = []
+        self._write_lock = Lock()
+        self._local = local()
+        self._readers: list[sqlite3.Connection] = []  # 各线程的读连接，close 时一并关闭
+        self._closed = False
+        self._writer = sqlite3.connect(self.path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.executescript(self.SCHEMA)
+        self._writer.commit()
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._closed:
+                raise sqlite3.ProgrammingError('MsgLog 已关闭')
+            # check_same_thread=False 只是为了 close 时能在别的线程关闭它，平时仍只由所属线程使用
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+            with self._write_lock:
+                self._readers.append(conn)
+        return conn
+
+    def append(self, chat: str, seq: int, msg: WxMsg) -> None:
+        with self._write_lock:
+            self._pending.append((
+                chat, seq, msg.hash_id, msg.type, msg.sender, msg.roomid,
+                msg.content, int(bool(msg.is_meaningful)), time.time(),
+            ))
+            if len(self._pending) < self.batch_size:
+                return
+        self.flush()
+
+    def flush(self) -> int:
+        """把缓冲中的消息一次性写入，返回写入条数"""
+        with self._write_lock:
+            if not self._pending:
+                return 0
+            rows, self._pending = self._pending, []
+            try:
+                with self._writer:
+                    self._writer.executemany(
+                        "INSERT OR REPLACE INTO msgs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+            except sqlite3.Error as e:
+                print(f'写入消息记录失败：{e}')
+                self._pending = rows + self._pending
+                return 0
+            return len(rows)
+
+    @staticmethod
+    def _row_to_msg(row) -> tuple[int, WxMsg]:
+        seq, type, sender, roomid, content, is_meaningful = row
+        return seq, WxMsg(
+            type=type,
+            sender=sender,
+            roomid=roomid,
+            content=content,
+            is_meaningful=bool(is_meaningful),
+        )
+
+    def last_n(self, chat: str, n: int) -> list[tuple[int, WxMsg]]:
+        """chat 最近 n 条消息，按 seq 升序"""
+        rows = self._reader().execute(
+            "SELECT seq, type, sender, roomid, content, is_meaningful FROM msgs "
+            "WHERE chat = ? ORDER BY seq DESC LIMIT ?", (chat, int(n))
+        ).fetchall()
+        rows.reverse()
+        return [self._row_to_msg(row) for row in rows]
+
+    def since(self, chat: str, seq: int, limit: Optional[int] = None) -> list[tuple[int, WxMsg]]:
+        """chat 中 seq 之后（不含）的消息，按 seq 升序"""
+        rows = self._reader().execute(
+            "SELECT seq, type, sender, roomid, content, is_meaningful FROM msgs "
+            "WHERE chat = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (chat, int(seq), -1 if limit is None else int(limit))
+        ).fetchall()
+        return [self._row_to_msg(row) for row in rows]
+
+    def last_seq(self, chat: str) -> int:
+        row = self._reader().execute("SELECT MAX(seq) FROM msgs WHERE chat = ?", (chat,)).fetchone()
+        return int(row[0] or 0)
+
+    def has(self, chat: str, hash_id: str, min_seq: int = 0) -> bool:
+        """chat 中 seq > min_seq 的消息里有没有 hash_id"""
+        with self._write_lock:
+            # 还在缓冲里、尚未 flush 的消息
+            if any(row[0] == chat and row[1] > min_seq and row[2] == hash_id for row in self._pending):
+                return True
+        row = self._reader().execute(
+            "SELECT 1 FROM msgs WHERE chat = ? AND hash_id = ? AND seq > ? LIMIT 1", (chat, hash_id, int(min_seq))
+        ).fetchone()
+        return row is not None
+
+    def chats(self) -> list[str]:
+        return [row[0] for row in self._reader().execute("SELECT DISTINCT chat FROM msgs")]
+
+    def close(self) -> None:
+        self.flush()
+        with self._write_lock:
+            self._closed = True
+            readers, self._readers = self._readers, []
+            for conn in readers:
+                conn.close()
+            self._writer.close()
@@ -0,0 +1,201 @@
+from collections import deque
+from itertools import islice
+from threading import RLock
+from typing import Optional
+
+try:
+    from .WxMsg import WxMsg
+    from .MsgLog import MsgLog
+except ImportError:
+    from WxMsg import WxMsg
+    from MsgLog import MsgLog
+
+
+class MsgStore:
+    """
+    按聊天缓存最近 memory_len 条消息：
+      - 每个聊天一个 deque(maxlen)，淘汰是 O(1)
+      - hash_id 计数索引与 deque 同步更新，判重是 O(1)
+      - 每个聊天的消息有单调递增的序号 seq（从 1 开始），可按序号增量读取
+      - 可选的 MsgLog：新消息同时写入持久化记录，启动时从中预热缓存，判重时兜底查询最近 dedup_window 条
+    """
+
+    def __init__(self, memory_len: int, log: Optional[MsgLog] = None, dedup_window: int = 50) -> None:
+        self.memory_len = max(0, int(memory_len))
+        self.log = log
+        self.dedup_window = max(0, int(dedup_window))
+        self._buffers: dict[str, deque] = {}   # name -> deque[(seq, WxMsg)]
+        self._hash_cnt: dict[str, dict] = {}   # name -> {hash_id: 出现次数}
+        self._last_seq: dict[str, int] = {}    # name -> 最后分配的 seq
+        self._lock = RLock()
+
+    def _buffer(self, name: str) -> deque:
+        buf = self._buffers.get(name)
+        if buf is None:
+            buf = self._buffers[name] = deque(maxlen=self.memory_len)
+            self._hash_cnt[name] = {}
+            self._last_seq[name] = 0
+        return buf
+
+    def add(self, name: str, msg: WxMsg) -> int:
+        """追加一条消息，返回分配给它的 seq"""
+        with self._lock:
+            buf = self._buffer(name)
+            hash_cnt = self._hash_cnt[name]
+            seq = self._last_seq[name] + 1
+            self._last_seq[name] = seq
+            if self.log is not None:
+                self.log.append(name, seq, msg)
+            if self.memory_len == 0:
+                return seq
+            if len(buf) == buf.maxlen:
+                _, evicted = buf[0]
+                cnt = hash_cnt.get(evicted.hash_id, 0) - 1
+                if cnt > 0:
+                    hash_cnt[evicted.hash_id] = cnt
+                else:
+                    hash_cnt.pop(evicted.hash_id, None)
+            buf.append((seq, msg))
+            hash_cnt[msg.hash_id] = hash_cnt.get(msg.hash_id, 0) + 1
+            return seq
+
+    def _load(self, name: str, seq: int, msg: WxMsg) -> None:
+        buf = self._buffer(name)
+        hash_cnt = self._hash_cnt[name]
+        if self.memory_len and len(buf) == buf.maxlen:
+            _, evicted = buf.popleft()
+            hash_cnt[evicted.hash_id] -= 1
+            if hash_cnt[evicted.hash_id] <= 0:
+                del hash_cnt[evicted.hash_id]
+        if self.memory_len:
+            buf.append((seq, msg))
+            hash_cnt[msg.hash_id] = hash_cnt.get(msg.hash_id, 0) + 1
+        self._last_seq[name] = max(self._last_seq[name], seq)
+
+    def warm_load(self) -> int:
+        """从持久化记录中载入每个聊天最近 memory_len 条消息，返回载入条数"""
+        if self.log is None:
+            return 0
+        cnt = 0
+        with self._lock:
+            for name in self.log.chats():
+                self._buffer(name)
+                for seq, msg in self.log.last_n(name, self.memory_len):
+                    self._load(name, seq, msg)
+                    cnt += 1
+                self._last_seq[name] = max(self._last_seq[name], self.log.last_seq(name))
+        return cnt
+
+    def flush(self) -> None:
+        if self.log is not None:
+            self.log.flush()
+
+    def contains(self, name: str, msg: WxMsg) -> bool:
+        """
+        先查内存索引；不在缓存中时再查 MsgLog 中该聊天最近 dedup_window 条（已被淘汰出缓存的消息，或重启前的消息）。
+        只查最近的一段：像“好的”这样反复出现的短消息，很久以前出现过不代表这次读到的是同一条
+        """
+        with self._lock:
+            hash_cnt = self._hash_cnt.get(name)
+            if hash_cnt and msg.hash_id in hash_cnt:
+                return True
+            min_seq = self._last_seq.get(name, 0) - self.dedup_window
+        if self.log is None or self.dedup_window <= self.memory_len:
+            return False  # 窗口没有超出内存缓存，缓存里没有就是没有
+        return self.log.has(name, msg.hash_id, min_seq=min_seq)
+
+    def latest(self, name: str) -> Optional[WxMsg]:
+        with self._lock:
+            buf = self._buffers.get(name)
+            if not buf:
+                return None
+            return buf[-1][1]
+
+    def last_seq(self, name: str) -> int:
+        with self._lock:
+            return self._last_seq.get(name, 0)
+
+    def snapshot(self, name: str) -> list[WxMsg]:
+        with self._lock:
+            return [msg for _, msg in self._buffers.get(name, ())]
+
+    def _since_cached(self, name: str, seq: int) -> tuple[list[tuple[int, WxMsg]], int]:
+        """调用时持有 self._lock：返回 (seq 之后仍在缓存中的消息, 缓存中最早的 seq)"""
+        buf = self._buffers.get(name)
+        if not buf:
+            return [], self._last_seq.get(name, 0) + 1
+        first_seq = buf[0][0]
+        start = max(0, seq + 1 - first_seq)
+        if start >= len(buf):
+            return [], first_seq
+        return list(islice(buf, start, None)), first_seq
+
+    def _backfill(self, name: str, seq: int, cache_start: int, upto: Optional[int] = None) -> list[tuple[int, WxMsg]]:
+        """不持锁调用：从 MsgLog 读出 (seq, cache_start) 之间已被淘汰出缓存的消息（没有 MsgLog 时为空）"""
+        if self.log is None or seq + 1 >= cache_start:
+            return []
+        return [(s, msg) for s, msg in self.log.since(name, seq, limit=cache_start - seq - 1)
+                if s < cache_start and (upto is None or s <= upto)]
+
+    def since(self, name: str, seq: int) -> list[tuple[int, WxMsg]]:
+        """返回 seq 之后（不含）的消息 [(seq, WxMsg)...]；已被淘汰出缓存的部分从 MsgLog 补齐（没有 MsgLog 时缺失）"""
+        return self.since_many([(name, seq)])[0]
+
+    def since_many(self, cursors: list[tuple[str, int]]) -> list[list[tuple[int, WxMsg]]]:
+        """
+        一次加锁读取多个聊天 seq 之后的消息，cursors: [(name, seq)...]，返回与之对应的列表；
+        游标落后于缓存起点的聊天在锁外从 MsgLog 补齐
+        """
+        with self._lock:
+            reads = [self._since_cached(name, seq) for name, seq in cursors]
+        behind = self.log is not None and any(seq + 1 < start for (_, seq), (_, start) in zip(cursors, reads))
+        if not behind:
+            return [cached for cached, _ in reads]
+        self.log.flush()
+        return [self._backfill(name, seq, start) + cached for (name, seq), (cached, start) in zip(cursors, reads)]
+
+    def range(self, name: str, first_seq: int, last_seq: int) -> list[tuple[int, WxMsg]]:
+        """返回 seq 在 [first_seq, last_seq] 内的消息；已被淘汰出缓存的部分从 MsgLog 补齐（没有 MsgLog 时缺失）"""
+        with self._lock:
+            cached, cache_start = self._since_cached(name, first_seq - 1)
+        cached = [(seq, msg) for seq, msg in cached if seq <= last_seq]
+        if self.log is None or first_seq >= cache_start:
+            return cached
+        self.log.flush()
+        return self._backfill(name, first_seq - 1, cache_start, last_seq) + cached
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return list(self._buffers)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(buf) for buf in self._buffers.values())
+
+
+if __name__ == "__main__":
+    # 微基准：与原来的 list + `in` + pop(0) 写法对比
+    import random
+    import time
+
+    def bench_list(msgs, memory_len):
+        cache = []
+        for msg in msgs:
+            if msg not in cache:
+                cache.append(msg)
+            while len(cache) > memory_len:
+                cache.pop(0)
+
+    def bench_store(msgs, memory_len):
+        store = MsgStore(memory_len)
+        for msg in msgs:
+            if not store.contains('bench', msg):
+                store.add('bench', msg)
+
+    for memory_len in (10, 100, 1000):
+        msgs = [WxMsg(type=0, sender='bench', content=f'消息 {random.randrange(10 ** 9)}') for _ in range(10000)]
+        for fn in (bench_list, bench_store):
+            t0 = time.perf_counter()
+            fn(msgs, memory_len)
+            cost = time.perf_counter() - t0
+            print(f'memory_len={memory_len:<5} {fn.__name__:<12} {cost * 1000:9.1f} ms  ({cost / len(msgs) * 1e6:.2f} us/msg)')
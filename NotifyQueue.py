@@ -0,0 +1,300 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Condition
+from typing import Optional
+
+
+@dataclass
+class Notice:
+    """chat 有新消息，序号范围 [first_seq, last_seq]（MsgStore 分配的 seq，闭区间）"""
+    chat: str
+    first_seq: int
+    last_seq: int
+
+
+class NotifyQueue:
+    """
+    合并的有界新消息通知队列：
+      - 每个聊天最多一条待处理通知，同一聊天再次有新消息时只扩展它的 last_seq，位置不变（先到先处理）
+      - 容量 capacity 指不同聊天的条数，满了之后按 overflow 处理：
+          block       生产者在登记之前调用 wait_capacity 等待空位（收消息线程在每轮轮询之前等，不会卡住 UI 线程）；
+                      put 本身从不阻塞，一轮里登记的通知可以暂时超出 capacity。连续等待 block_timeout 秒后丢掉最早的通知
+          drop_oldest 丢掉最早的一条通知（消息仍在缓存中，只是不再通知）
+          spill       新通知追加写入 spill_path，内存里有空位时再从记下的读取位置按顺序读回（不重写文件，读完后清空）
+      - depth / high_water / coalesced / dropped / spilled 计数可随时读取
+    """
+
+    OVERFLOWS = ("block", "drop_oldest", "spill")
+
+    def __init__(
+            self,
+            capacity: int = 0,
+            overflow: str = "block",
+            spill_path: Optional[str | Path] = None,
+            block_timeout: Optional[float] = 30.0,
+            resume_spill: bool = False,
+    ) -> None:
+        """
+        resume_spill: 启动时是否读回上次退出时留在 spill 文件里的通知。只有 seq 能跨重启延续（MsgStore 配了 MsgLog）时才有意义，
+        否则 seq 从 1 重新开始，旧通知指向的是别的消息，这时文件会被清掉
+        """
+        if overflow not in self.OVERFLOWS:
+            raise ValueError(f'unknown overflow policy {overflow!r}, expected one of {self.OVERFLOWS}')
+        if overflow == "spill" and not spill_path:
+            raise ValueError('overflow=spill requires spill_path')
+        self.capacity = max(0, int(capacity))  # 0 表示不限
+        self.overflow = overflow
+        # 只有 spill 策略才会用到文件，其他策略下不创建目录、不读写
+        self.spill_path = Path(spill_path) if spill_path and overflow == "spill" else None
+        self.block_timeout = block_timeout
+        self._pending: OrderedDict[str, list] = OrderedDict()  # chat -> [first_seq, last_seq]
+        self._spilled: dict[str, int] = {}  # 在 spill 文件中还有未读回记录的聊天 -> 记录条数
+        self._spill_pos = 0  # spill 文件中下一条未读回记录的字节偏移
+        self._cv = Condition()
+        self._closed = False
+        self.high_water = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.blocked_time = 0.0
+        self._blocked_since: Optional[float] = None  # block 策略下开始连续等待空位的时刻
+        if self.spill_path is not None:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            if resume_spill and self.spill_path.exists():
+                # 上次退出时没读回的通知
+                for chat, _, _ in self._read_spill():
+                    self._spilled[chat] = self._spilled.get(chat, 0) + 1
+            else:
+                self.spill_path.unlink(missing_ok=True)
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending) + len(self._spilled)
+
+    def __len__(self) -> int:
+        return self.depth
+
+    def _full(self) -> bool:
+        return bool(self.capacity) and len(self._pending) >= self.capacity
+
+    def put(self, chat: str, first_seq: int, last_seq: int) -> bool:
+        """登记 chat 的新消息范围；返回 False 表示通知被丢弃（drop_oldest 丢掉的是别的聊天时仍返回 True）"""
+        with self._cv:
+            if self._closed:
+                return False
+            # 文件里还有该聊天的记录时必须接在后面写，否则新范围会先于文件里较早的范围被取走
+            if chat in self._spilled:
+                self._append_spill(chat, first_seq, last_seq)
+                self.coalesced += 1
+                return True
+            entry = self._pending.get(chat)
+            if entry is not None:
+                entry[0] = min(entry[0], first_seq)
+                entry[1] = max(entry[1], last_seq)
+                self.coalesced += 1
+                return True
+            if self._full() or self._spilled:
+                if self.overflow == "spill":
+                    # 已有溢出时新的也写到文件里，保证先到先处理
+                    self._append_spill(chat, first_seq, last_seq)
+                    self.spilled += 1
+                    self._touch_high_water()
+                    self._cv.notify()
+                    return True
+                # block 策略不在这里等：调用方是持有 UI 的收消息线程，等待放在 wait_capacity 里
+                if self.overflow == "drop_oldest" and self._full():
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+            self._pending[chat] = [first_seq, last_seq]
+            self._touch_high_water()
+            self._cv.notify()
+            return True
+
+    def wait_capacity(self, timeout: Optional[float] = None) -> bool:
+        """
+        block 策略下，生产者在下一批 put 之前调用：阻塞直到内存中有空位；timeout 秒内没等到返回 False。
+        从第一次等待算起连续等了 block_timeout 秒时，丢掉最早的通知腾出空位（退化为 drop_oldest）。
+        其他策略、队列已关闭时直接返回 True
+        """
+        with self._cv:
+            if self.overflow != "block":
+                return True
+            t0 = time.monotonic()
+            if self._full() and self._blocked_since is None:
+                self._blocked_since = t0
+            deadline = None if timeout is None else t0 + timeout
+            while self._full() and not self._closed:
+                now = time.monotonic()
+                give_up = None if self.block_timeout is None else self._blocked_since + self.block_timeout
+                if give_up is not None and now >= give_up:
+                    while self._full():
+                        self._pending.popitem(last=False)
+                        self.dropped += 1
+                    break
+                if deadline is not None and now >= deadline:
+                    break
+                ends = [t for t in (deadline, give_up) if t is not None]
+                self._cv.wait(min(ends) - now if ends else None)
+            self.blocked_time += time.monotonic() - t0
+            if self._full() and not self._closed:
+                return False
+            self._blocked_since = None
+            return True
+
+    def _touch_high_water(self) -> None:
+        if self.depth > self.high_water:
+            self.high_water = self.depth
+
+    def _append_spill(self, chat: str, first_seq: int, last_seq: int) -> None:
+        with open(self.spill_path, "ab") as f:
+            f.write((json.dumps([chat, first_seq, last_seq], ensure_ascii=False) + "\n").encode("utf-8"))
+        self._spilled[chat] = self._spilled.get(chat, 0) + 1
+
+    @staticmethod
+    def _parse_spill_line(line: bytes) -> Optional[tuple[str, int, int]]:
+        try:
+            chat, first_seq, last_seq = json.loads(line)
+        except ValueError:
+            return None  # 写到一半的行
+        return chat, first_seq, last_seq
+
+    def _read_spill(self) -> list[tuple[str, int, int]]:
+        """从读取位置开始读出 spill 文件中剩下的全部记录（启动时用来恢复计数）"""
+        try:
+            with open(self.spill_path, "rb") as f:
+                f.seek(self._spill_pos)
+                return [item for item in map(self._parse_spill_line, f) if item is not None]
+        except FileNotFoundError:
+            return []
+
+    def _refill(self) -> None:
+        # 调用时持有 self._cv：从读取位置开始逐行读回溢出的通知，直到内存满或文件读完；
+        # 已在内存中的聊天直接合并，不占新位置。文件只追加、不重写，全部读回后清空
+        if not self._spilled or self._full():
+            return
+        with open(self.spill_path, "rb") as f:
+            f.seek(self._spill_pos)
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # 读到末尾（或末尾写到一半的行）
+                item = self._parse_spill_line(line)
+                if item is not None:
+                    chat, first_seq, last_seq = item
+                    entry = self._pending.get(chat)
+                    if entry is None:
+                        if self._full():
+                            f.seek(pos)
+                            break
+                        self._pending[chat] = [first_seq, last_seq]
+                    else:
+                        entry[0] = min(entry[0], first_seq)
+                        entry[1] = max(entry[1], last_seq)
+                    left = self._spilled.get(chat, 0) - 1
+                    if left > 0:
+                        self._spilled[chat] = left
+                    else:
+                        self._spilled.pop(chat, None)
+            self._spill_pos = f.tell()
+        if not self._spilled:
+            # 全部读回：清空文件，读取位置归零，文件不会无限增长
+            with open(self.spill_path, "wb"):
+                pass
+            self._spill_pos = 0
+
+    def _wait_nonempty(self, timeout: Optional[float]) -> bool:
+        # 调用时持有 self._cv
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._pending and not self._spilled:
+            if self._closed:
+                return False
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._cv.wait(remaining)
+        self._refill()
+        return bool(self._pending)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Notice]:
+        """取出最早的一条通知，超时或已关闭时返回 None"""
+        with self._cv:
+            if not self._wait_nonempty(timeout):
+                return None
+            chat, (first_seq, last_seq) = self._pending.popitem(last=False)
+            self._cv.notify_all()
+            return Notice(chat, first_seq, last_seq)
+
+    def get_many(self, max_items: int, timeout: Optional[float] = None) -> list[Notice]:
+        """至少等到一条通知（或超时），然后一次取出最多 max_items 条"""
+        with self._cv:
+            if not self._wait_nonempty(timeout):
+                return []
+            out = []
+            while self._pending and len(out) < max_items:
+                chat, (first_seq, last_seq) = self._pending.popitem(last=False)
+                out.append(Notice(chat, first_seq, last_seq))
+                if not self._pending:
+                    self._refill()
+            self._cv.notify_all()
+            return out
+
+    def close(self) -> None:
+        """唤醒所有等待中的 wait_capacity / get；之后 put 返回 False，get 取完剩余通知后返回 None"""
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+    def stats(self) -> dict:
+        with self._cv:
+            return {
+                "depth": self.depth,
+                "in_memory": len(self._pending),
+                "on_disk": len(self._spilled),
+                "capacity": self.capacity,
+                "overflow": self.overflow,
+                "high_water": self.high_water,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "blocked_time": self.blocked_time,
+            }
+
+
+if __name__ == "__main__":
+    # 演示：20 个聊天各来 50 批新消息，消费者较慢时队列的深度与合并情况
+    import random
+    import tempfile
+    import threading
+
+    for overflow in NotifyQueue.OVERFLOWS:
+        spill = os.path.join(tempfile.mkdtemp(), "notify.spill") if overflow == "spill" else None
+        q = NotifyQueue(capacity=8, overflow=overflow, spill_path=spill, block_timeout=None)
+        seqs = {f'chat{i}': 0 for i in range(20)}
+        seen = {}
+
+        def consume():
+            while True:
+                notice = q.get(timeout=0.5)
+                if notice is None:
+                    return
+                seen[notice.chat] = max(seen.get(notice.chat, 0), notice.last_seq)
+                time.sleep(0.0005)
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            chat = random.choice(list(seqs))
+            first = seqs[chat] + 1
+            seqs[chat] += random.randint(1, 3)
+            q.wait_capacity()
+            q.put(chat, first, seqs[chat])
+        produce = time.perf_counter() - t0
+        consumer.join()
+        missed = sum(1 for chat, last in seqs.items() if seen.get(chat, 0) < last)
+        print(f'{overflow:<12} 生产 {produce * 1000:6.1f} ms，通知未覆盖到最后一条的聊天 {missed:2d} 个，{q.stats()}')
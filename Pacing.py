@@ -0,0 +1,264 @@
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, fields, replace
+from threading import Lock, local
+from typing import Callable, Optional
+
+try:
+    from .Metrics import LatencyStat
+except ImportError:
+    from Metrics import LatencyStat
+
+
+@dataclass(frozen=True)
+class PacingProfile:
+    """
+    一套“像人”的节奏参数：
+    - eps / EPS: 一小会儿 / 一大会儿的中心值（秒），实际等待在 [x*(1-jitter), x*(1+jitter)] 内取
+    - dist: uniform（均匀，原来的行为）或 lognormal（中位数为 x、偶尔拖长的长尾分布）
+    - mouse_move_speed / type_*_interval: 鼠标速度（像素/秒）与键入间隔（秒）
+    - latency_budget: 单次操作的总耗时上限（秒），超出后后续等待按 预算/已用时间 等比缩短，0 表示不限
+    - min_scale: 缩短等待的下限比例，避免超时后完全不等待
+    """
+    name: str = "default"
+    eps: float = 0.1
+    EPS: float = 0.5
+    jitter: float = 0.5
+    dist: str = "uniform"
+    mouse_move_speed: float = 3000.0
+    type_min_interval: float = 0.05
+    type_max_interval: float = 0.1
+    latency_budget: float = 0.0
+    min_scale: float = 0.1
+
+    DISTS = ("uniform", "lognormal")
+
+    def __post_init__(self):
+        if self.dist not in self.DISTS:
+            raise ValueError(f'unknown pacing dist {self.dist!r}, expected one of {self.DISTS}')
+
+    def derive(self, name: str, overrides: dict) -> "PacingProfile":
+        """以自身为底，用 overrides 中出现的字段生成新的 profile（未写的字段沿用）"""
+        known = {f.name for f in fields(self)}
+        unknown = set(overrides) - known
+        if unknown:
+            raise ValueError(f'unknown pacing fields for {name!r}: {sorted(unknown)}')
+        values = {}
+        for key, value in overrides.items():
+            values[key] = str(value) if key == "dist" else float(value)
+        return replace(self, name=name, **values)
+
+    def sample(self, center: float) -> float:
+        center = max(0.0, float(center))
+        if center == 0.0:
+            return 0.0
+        if self.dist == "lognormal":
+            return random.lognormvariate(0.0, max(1e-6, self.jitter)) * center
+        delta = center * self.jitter
+        return random.uniform(max(0.0, center - delta), center + delta)
+
+
+class PacingSession:
+    """一次操作（发送一条文本、一轮收消息……）期间的节奏记账"""
+
+    def __init__(self, op: str, profile: PacingProfile, clock: Callable[[], float]) -> None:
+        self.op = op
+        self.profile = profile
+        self.clock = clock
+        self.started = clock()
+        self.delay = 0.0   # 实际花在刻意等待上的时间（含鼠标移动、键入）
+        self.saved = 0.0   # 因超出预算而少等的时间
+        self.wall = 0.0
+
+    def scale(self) -> float:
+        budget = self.profile.latency_budget
+        if budget <= 0:
+            return 1.0
+        elapsed = self.clock() - self.started
+        if elapsed <= budget:
+            return 1.0
+        return max(self.profile.min_scale, budget / elapsed)
+
+    def report(self) -> dict:
+        return {
+            "op": self.op,
+            "profile": self.profile.name,
+            "delay": self.delay,
+            "saved": self.saved,
+            "wall": self.wall,
+        }
+
+
+class Pacer:
+    """
+    节奏配置中心：按名字管理 PacingProfile，按 调用参数 > 接收者映射 > 默认 的顺序选用。
+    session() 在当前线程上开启一次操作的记账，期间 wait / account 都记到它上面；
+    会话可以嵌套（例如一轮轮询里逐个读取会话），内层结束时把耗时并入外层。
+    """
+
+    def __init__(
+            self,
+            profiles: dict[str, PacingProfile],
+            default: str = "default",
+            by_receiver: Optional[dict[str, str]] = None,
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Callable[[float], None] = time.sleep,
+            history: int = 50,
+    ) -> None:
+        if default not in profiles:
+            raise ValueError(f'default pacing {default!r} not in profiles {sorted(profiles)}')
+        for receiver, name in (by_receiver or {}).items():
+            if name not in profiles:
+                raise ValueError(f'pacing {name!r} for receiver {receiver!r} not in profiles {sorted(profiles)}')
+        self.profiles = dict(profiles)
+        self.default = default
+        self.by_receiver = dict(by_receiver or {})
+        self.clock = clock
+        self.sleep = sleep
+        self.recent: deque[dict] = deque(maxlen=history)
+        self.delay_stats: dict[str, LatencyStat] = {}
+        self.wall_stats: dict[str, LatencyStat] = {}
+        self._stats_lock = Lock()
+        self._local = local()
+
+    @classmethod
+    def from_config(cls, base: PacingProfile, profiles: Optional[dict], default: Optional[str] = None,
+                    by_receiver: Optional[dict] = None, **kwargs) -> "Pacer":
+        """base 为由顶层 eps/EPS/... 构成的 default；profiles: name -> 覆盖字段"""
+        built = {base.name: base}
+        for name, overrides in (profiles or {}).items():
+            built[str(name)] = base.derive(str(name), dict(overrides or {}))
+        return cls(built, default or base.name, {str(k): str(v) for k, v in (by_receiver or {}).items()}, **kwargs)
+
+    def resolve(self, pacing: Optional[str] = None, receiver: Optional[str] = None) -> PacingProfile:
+        if pacing is not None:
+            if pacing not in self.profiles:
+                raise ValueError(f'unknown pacing {pacing!r}, expected one of {sorted(self.profiles)}')
+            return self.profiles[pacing]
+        if receiver is not None and receiver in self.by_receiver:
+            return self.profiles[self.by_receiver[receiver]]
+        return self.profiles[self.default]
+
+    def _stack(self) -> list[PacingSession]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self) -> Optional[PacingSession]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def profile(self) -> PacingProfile:
+        sess = self.current()
+        return sess.profile if sess is not None else self.profiles[self.default]
+
+    def scale(self) -> float:
+        sess = self.current()
+        return sess.scale() if sess is not None else 1.0
+
+    @contextmanager
+    def session(self, op: str, pacing: Optional[str] = None, receiver: Optional[str] = None):
+        """pacing 与 receiver 都未指定且外层已有会话时，沿用外层的 profile"""
+        outer = self.current()
+        if pacing is None and outer is not None and (receiver is None or receiver not in self.by_receiver):
+            profile = outer.profile
+        else:
+            profile = self.resolve(pacing, receiver)
+        sess = PacingSession(op, profile, self.clock)
+        stack = self._stack()
+        stack.append(sess)
+        try:
+            yield sess
+        finally:
+            stack.pop()
+            sess.wall = self.clock() - sess.started
+            if outer is not None:
+                outer.delay += sess.delay
+                outer.saved += sess.saved
+            self._record(sess)
+
+    def _record(self, sess: PacingSession) -> None:
+        key = f'{sess.op}/{sess.profile.name}'
+        with self._stats_lock:
+            if key not in self.delay_stats:
+                self.delay_stats[key] = LatencyStat(f'{key} delay')
+                self.wall_stats[key] = LatencyStat(f'{key} wall')
+            self.recent.append(sess.report())
+        self.delay_stats[key].record(sess.delay)
+        self.wall_stats[key].record(sess.wall)
+
+    def wait(self, center: float) -> float:
+        """按当前 profile 的分布在 center 附近取一个等待时长并睡眠，超出预算时等比缩短；返回实际等待秒数"""
+        planned = self.profile().sample(center)
+        actual = planned * self.scale()
+        sess = self.current()
+        if sess is not None:
+            sess.delay += actual
+            sess.saved += planned - actual
+        if actual > 0:
+            self.sleep(actual)
+        return actual
+
+    def wait_little(self) -> float:
+        return self.wait(self.profile().eps)
+
+    def wait_large(self) -> float:
+        return self.wait(self.profile().EPS)
+
+    def account(self, seconds: float) -> None:
+        """把在别处完成的刻意耗时（鼠标移动、键入）记到当前会话上"""
+        sess = self.current()
+        if sess is not None and seconds > 0:
+            sess.delay += seconds
+
+    def mouse_speed(self) -> float:
+        """当前 profile 的鼠标速度，超出预算时等比加快"""
+        return self.profile().mouse_move_speed / self.scale()
+
+    def pause_range(self) -> tuple[float, float]:
+        """当前 profile 下鼠标移动中途停顿的时长范围（eps 的 0.5 到 1.5 倍），超出预算时等比缩短"""
+        p, s = self.profile(), self.scale()
+        return p.eps * 0.5 * s, p.eps * 1.5 * s
+
+    def type_intervals(self) -> tuple[float, float]:
+        """当前 profile 的键入间隔，超出预算时等比缩短"""
+        p, s = self.profile(), self.scale()
+        return p.type_min_interval * s, p.type_max_interval * s
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            keys = list(self.delay_stats)
+            recent = list(self.recent)
+        return {
+            "ops": {k: {"delay": self.delay_stats[k].snapshot(), "wall": self.wall_stats[k].snapshot()} for k in keys},
+            "recent": recent,
+        }
+
+
+if __name__ == "__main__":
+    # 演示：同一个“操作”在不同 profile 下的刻意等待，以及预算超出后的等比缩短（用假时钟，不真的睡）
+    now = [0.0]
+
+    def fake_sleep(s):
+        now[0] += s
+
+    base = PacingProfile()
+    pacer = Pacer.from_config(
+        base,
+        {"trusted": {"eps": 0.03, "EPS": 0.1, "latency_budget": 1.0}, "cautious": {"eps": 0.2, "EPS": 1.0}},
+        by_receiver={"文件传输助手": "trusted"},
+        clock=lambda: now[0], sleep=fake_sleep,
+    )
+    for receiver in ("文件传输助手", "客户群", None):
+        with pacer.session("send_text", receiver=receiver) as sess:
+            for _ in range(10):
+                pacer.wait_little()
+            pacer.wait_large()
+            now[0] += 0.8  # 模拟 UIA 调用等非刻意耗时
+            for _ in range(10):
+                pacer.wait_little()
+        r = sess.report()
+        print(f'{str(receiver):<8} profile={r["profile"]:<8} 刻意等待 {r["delay"]:.3f}s / 总耗时 {r["wall"]:.3f}s，因预算少等 {r["saved"]:.3f}s')
@@ -0,0 +1,351 @@
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Callable, Iterable, Optional
+
+try:
+    from .utils import analysis_name
+except ImportError:
+    from utils import analysis_name
+
+
+class SweepPlanner:
+    """
+    一次轮询（sweep）内处理会话列表快照中的全部未读会话。
+
+    顺序策略 order：
+      round_robin    = 每次 sweep 的起点依次后移，避免总是列表靠前的会话先被处理
+      oldest_waiting = 最早被发现未读、且一直没被处理的会话优先
+      top_first      = 按会话列表从上到下（原始行为）
+    max_hold: 单次 sweep 最多占用 wx_lock 的时间（秒），超时剩余会话留到下一轮
+    max_chats: 单次 sweep 最多处理几个会话，None 不限制
+    """
+
+    ORDERS = ("round_robin", "oldest_waiting", "top_first")
+
+    def __init__(
+            self,
+            order: str = "round_robin",
+            max_hold: float = 2.0,
+            max_chats: Optional[int] = None,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if order not in self.ORDERS:
+            raise ValueError(f'unsupported sweep order: {order!r}')
+        self.order = order
+        self.max_hold = float(max_hold)
+        self.max_chats = max_chats
+        self.clock = clock
+        self._offset = 0
+        self._waiting_since = {}  # name -> 第一次发现未读的时间
+        self.last_served = []
+        self.last_pending = []
+
+    def plan(self, unread: list[tuple[str, int]]) -> list[tuple[str, int]]:
+        """unread 为按会话列表顺序排列的 (name, new_msg_cnt)，返回处理顺序"""
+        now = self.clock()
+        names = {name for name, _ in unread}
+        for name in names:
+            self._waiting_since.setdefault(name, now)
+        # 已经不再未读的会话（例如被人手动点开）不再计入等待
+        for name in list(self._waiting_since):
+            if name not in names:
+                del self._waiting_since[name]
+
+        if not unread:
+            return []
+        if self.order == "round_robin":
+            start = self._offset % len(unread)
+            self._offset += 1
+            return unread[start:] + unread[:start]
+        if self.order == "oldest_waiting":
+            # sorted 是稳定排序，等待时间相同时保持列表顺序
+            return sorted(unread, key=lambda e: self._waiting_since[e[0]])
+        return list(unread)
+
+    def sweep(self, unread: Iterable[tuple[str, int]], handle: Callable[[str, int], Any]) -> int:
+        """
+        unread: 按会话列表顺序排列的待处理会话 (name, new_msg_cnt)
+        handle: 对单个未读会话的处理函数 handle(name, new_msg_cnt)
+        return: 本轮处理了几个会话
+        """
+        ordered = self.plan(list(unread))
+
+        deadline = self.clock() + self.max_hold
+        served = []
+        for name, new_msg_cnt in ordered:
+            if self.max_chats is not None and len(served) >= self.max_chats:
+                break
+            # 至少处理一个会话，保证每轮都有进展
+            if served and self.clock() >= deadline:
+                break
+            handle(name, new_msg_cnt)
+            self._waiting_since.pop(name, None)
+            served.append(name)
+        self.last_served = served
+        self.last_pending = [name for name, _ in ordered[len(served):]]
+        return len(served)
+
+
+@dataclass
+class ConvChange:
+    name: str
+    pos: int
+    new_msg_cnt: int
+    prev_pos: Optional[int]   # None 表示上一轮不在列表里
+    prev_cnt: int
+    moved_up: bool = False    # 越过了上一轮排在它前面的会话（被顶上来），单纯因上方会话被删除而上移不算
+
+
+class ConvListDiffer:
+    """
+    会话列表增量对比：保存上一轮每个会话的 (标题原文, 位置, 未读数)，
+    只把发生变化的会话交给后续的读取阶段。
+
+    - 与上一轮相同的开头和结尾部分直接跳过，只对中间变化的窗口解析、比较，代价与变化的会话数有关
+    - 解析结果按标题原文缓存，整体平移（例如有会话跳到顶部）时解析次数只与变化的会话数有关
+    - 按会话名而不是位置判断上移：只有越过了上一轮排在它前面的会话才算被顶上来（含新进入前 listen_cnt、
+      且下方还有老会话的会话），即使微信已经清掉了它的未读角标；中间的会话被删除或隐藏时，下面的会话整体上移不算
+    - 读取失败的会话记入 retry，按 retry_backoff 指数退避后再报告，连续失败 max_retries 次后放弃；
+      本轮没来得及处理的会话（failed=False）下一轮立即报告，不计失败次数
+    """
+
+    def __init__(
+            self,
+            max_retries: int = 5,
+            retry_backoff: float = 0.5,
+            retry_backoff_max: float = 30.0,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_retries = max(1, int(max_retries))
+        self.retry_backoff = max(0.0, float(retry_backoff))
+        self.retry_backoff_max = max(self.retry_backoff, float(retry_backoff_max))
+        self.clock = clock
+        self._prev_titles: list[str] = []
+        self._prev = {}    # name -> (pos, new_msg_cnt)
+        self._parsed = {}  # title -> (name, is_pinned, new_msg_cnt)
+        self._expected_moves = set()
+        self._retry: dict[str, tuple[int, int, float]] = {}  # name -> (可能的新消息数, 连续失败次数, 下次重试时刻)
+        self.parse_cnt = 0  # 累计调用 analysis_name 的次数，便于观察增量效果
+        self.dropped = 0  # 连续失败 max_retries 次、已放弃重试的会话数
+
+    def _parse(self, title: str) -> tuple[str, bool, int]:
+        parsed = self._parsed.get(title)
+        if parsed is None:
+            parsed = self._parsed[title] = analysis_name(title)
+            self.parse_cnt += 1
+        return parsed
+
+    def top_changed(self, titles: list[str]) -> bool:
+        """
+        只读了列表最前面几条标题时的快速检查：与上一轮快照的开头不同，说明有会话被顶上来了
+        （包括角标已被清掉的会话），此时即使未读总数没变也应完整扫描
+        """
+        prev = self._prev_titles
+        return not prev or list(titles) != prev[:len(titles)]
+
+    def diff(self, titles: list[str]) -> list[ConvChange]:
+        prev_titles = self._prev_titles
+        n, m = len(titles), len(prev_titles)
+        # 跳过相同的开头；长度不变时再跳过相同的结尾（位置没变）
+        lo = 0
+        while lo < n and lo < m and titles[lo] == prev_titles[lo]:
+            lo += 1
+        hi_n, hi_m = n, m
+        if n == m:
+            while hi_n > lo and titles[hi_n - 1] == prev_titles[hi_m - 1]:
+                hi_n -= 1
+                hi_m -= 1
+
+        prev = self._prev
+        old = {}
+        for pos in range(lo, hi_m):
+            name = self._parse(prev_titles[pos])[0]
+            if name in prev:
+                old[name] = prev.pop(name)
+
+        window = [self._parse(titles[pos]) for pos in range(lo, hi_n)]
+        # 从下往上扫描，记录下方老会话上一轮的最小位置：自己上一轮的位置比它大，说明越过了原来在它前面的会话；
+        # 新出现的会话只要下方还有老会话（含窗口之后相同的结尾）就是被顶上来的，否则只是从列表末尾补进来
+        moved = [False] * len(window)
+        below = hi_m if hi_n < n else None
+        for i in range(len(window) - 1, -1, -1):
+            prev_pos = old.get(window[i][0], (None, 0))[0]
+            if prev_pos is None:
+                moved[i] = below is not None
+            else:
+                moved[i] = below is not None and below < prev_pos
+                below = prev_pos if below is None else min(below, prev_pos)
+
+        changes = []
+        for i, (name, _, new_msg_cnt) in enumerate(window):
+            pos = lo + i
+            prev[name] = (pos, new_msg_cnt)
+            prev_pos, prev_cnt = old.get(name, (None, 0))
+            # 第一轮没有可比较的快照，不算上移
+            moved_up = moved[i] and bool(prev_titles)
+            if not moved_up and prev_cnt == new_msg_cnt:
+                # 只是被别的会话挤下去了，或上方有会话被删除
+                continue
+            changes.append(ConvChange(name, pos, new_msg_cnt, prev_pos, prev_cnt, moved_up))
+        self._prev_titles = list(titles)
+        if len(self._parsed) > 4 * n + 16:
+            self._parsed = {t: self._parsed[t] for t in titles if t in self._parsed}
+        return changes
+
+    def pending_fetch(self, changes: list[ConvChange]) -> list[tuple[str, int]]:
+        """
+        从变化中挑出需要读取消息的会话：有未读，或者被顶上来（新消息但角标已被清掉），
+        再加上 retry 中已到重试时刻的会话。只能紧跟在对应的 diff 之后调用
+        """
+        out = []
+        for c in changes:
+            if c.new_msg_cnt > 0:
+                self._expected_moves.discard(c.name)
+                out.append((c.name, c.new_msg_cnt))
+            elif c.moved_up:
+                if c.name in self._expected_moves:
+                    # 自己刚发过消息导致的置顶，不需要读取
+                    self._expected_moves.discard(c.name)
+                    continue
+                out.append((c.name, 1))
+        if self._retry:
+            now = self.clock()
+            listed = {name: i for i, (name, _) in enumerate(out)}
+            for name, (cnt, _, due) in self._retry.items():
+                if name in listed:
+                    i = listed[name]
+                    out[i] = (name, max(out[i][1], cnt))
+                elif due <= now:
+                    out.append((name, cnt))
+        return out
+
+    def retry(self, name: str, new_msg_cnt: int = 1, failed: bool = True) -> None:
+        """
+        name 本轮读取失败（failed=True）或没来得及读取（failed=False），之后由 pending_fetch 再次报告，直到 fetched。
+        读取失败按 retry_backoff * 2^(n-1) 退避，连续失败 max_retries 次后放弃，之后只有再次出现未读或被顶上来才会读取
+        """
+        cnt, attempts, _ = self._retry.get(name, (0, 0, 0.0))
+        cnt = max(cnt, int(new_msg_cnt) or 1)
+        delay = 0.0
+        if failed:
+            attempts += 1
+            if attempts >= self.max_retries:
+                self._retry.pop(name, None)
+                self.dropped += 1
+                print(f'[{name}] 连续 {attempts} 次读取失败，放弃重试')
+                return
+            delay = min(self.retry_backoff * 2 ** (attempts - 1), self.retry_backoff_max)
+        self._retry[name] = (cnt, attempts, self.clock() + delay)
+
+    def fetched(self, name: str) -> None:
+        self._retry.pop(name, None)
+
+    @property
+    def has_retry(self) -> bool:
+        """是否有已到重试时刻的会话；还在退避中的会话不会让接收线程放弃快速路径"""
+        if not self._retry:
+            return False
+        now = self.clock()
+        return any(due <= now for _, _, due in self._retry.values())
+
+    def expect_move(self, name: str) -> None:
+        """自己给 name 发送消息后调用，下一次该会话上移时不当作新消息"""
+        self._expected_moves.add(name)
+
+    def reset(self) -> None:
+        """忘记快照（出错后重新开始）；retry 中的会话保留，仍会被重新读取"""
+        self._prev_titles = []
+        self._prev = {}
+        self._expected_moves.clear()
+
+
+class PollGovernor:
+    """
+    接收线程的轮询节奏调节器：
+      - 连续 idle_ticks 轮没有未读时，间隔按 decay 倍数指数退避，直到 ceiling
+      - 一旦发现未读或刚发送过消息，立即回到 floor
+    current_interval 为当前的轮询间隔（秒），可用于观察 CPU 占用与延迟的取舍
+    """
+
+    def __init__(
+            self,
+            floor: float = 0.1,
+            ceiling: float = 2.0,
+            decay: float = 1.5,
+            idle_ticks: int = 3,
+    ) -> None:
+        self.floor = max(0.0, float(floor))
+        self.ceiling = max(self.floor, float(ceiling))
+        self.decay = max(1.0, float(decay))
+        self.idle_ticks = max(1, int(idle_ticks))
+        self._interval = self.floor
+        self._idle_cnt = 0
+        self._lock = Lock()
+
+    @property
+    def current_interval(self) -> float:
+        return self._interval
+
+    def on_tick(self, res: int) -> float:
+        """res 为 Wcf.get_new_msg 的返回码，返回下一轮应等待的间隔"""
+        with self._lock:
+            if res > 0:
+                self._idle_cnt = 0
+                self._interval = self.floor
+            elif res == 0:
+                self._idle_cnt += 1
+                if self._idle_cnt >= self.idle_ticks:
+                    self._interval = min(self.ceiling, max(self._interval, 1e-3) * self.decay)
+            # res < 0：出错时保持当前节奏
+            return self._interval
+
+    def notify_activity(self) -> None:
+        """有发送等主动操作时调用，对方很可能马上回复"""
+        with self._lock:
+            self._idle_cnt = 0
+            self._interval = self.floor
+
+
+@dataclass(frozen=True)
+class MsgAnchor:
+    """
+    某个聊天中“已经读到哪一条”的锚点：
+      runtime_id: 最后一条已读 ListItem 的 UIA runtime id（控件被回收重建后可能失效）
+      tail: 截至该条为止最后若干条消息的文本签名，runtime id 失效时按序列匹配
+    """
+    runtime_id: Optional[tuple]
+    tail: tuple[str, ...]
+
+
+def make_anchor(key_at: Callable[[int], tuple], idx: int, tail_len: int = 3) -> MsgAnchor:
+    """key_at(i) 返回第 i 条消息的 (runtime_id, signature)"""
+    start = max(0, idx - tail_len + 1)
+    tail = tuple(key_at(i)[1] for i in range(start, idx + 1))
+    return MsgAnchor(runtime_id=key_at(idx)[0], tail=tail)
+
+
+def locate_anchor(n: int, key_at: Callable[[int], tuple], anchor: MsgAnchor) -> Optional[int]:
+    """
+    从列表底部往上找锚点所在的下标，找不到返回 None。
+    key_at 应当自带缓存：找到锚点即停止，代价只与锚点之后的新消息条数有关。
+    """
+    if not anchor.tail:
+        return None
+    last_sig = anchor.tail[-1]
+    k = len(anchor.tail)
+    # 1) runtime id + 签名，同时命中才算，防止 id 被复用
+    if anchor.runtime_id is not None:
+        for i in range(n - 1, -1, -1):
+            rid, sig = key_at(i)
+            if rid == anchor.runtime_id and sig == last_sig:
+                return i
+            if rid is None:
+                break
+    # 2) 最后 k 条签名序列完全一致；连续相同的消息需要序列才能区分
+    for i in range(n - 1, k - 2, -1):
+        if key_at(i)[1] != last_sig:
+            continue
+        if all(key_at(i - j)[1] == anchor.tail[k - 1 - j] for j in range(1, k)):
+            return i
+    return None
@@ -0,0 +1,219 @@
+import math
+import random
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@dataclass
+class Trajectory:
+    """一次鼠标移动：整数坐标点与每个点相对开始的时刻（秒），已去掉连续重复的点"""
+    points: list[tuple[int, int]]
+    times: list[float]
+
+    @property
+    def duration(self) -> float:
+        return self.times[-1] if self.times else 0.0
+
+
+class TrajectoryEngine:
+    """
+    预先生成整条鼠标轨迹（带随机弯曲的三次贝塞尔 + 逐渐衰减的抖动 + 随机加减速 + 偶尔的短暂停顿），
+    再按绝对时刻回放，计算本身不会插进每一步的 sleep 里，误差也不会累积。
+    装了 numpy 时整条轨迹一次向量化计算，否则退回纯 Python。
+    """
+
+    def __init__(
+            self,
+            target_hz: float = 90.0,
+            pause_range: tuple[float, float] = (0.05, 0.15),
+            use_numpy: Optional[bool] = None,
+    ) -> None:
+        self.target_hz = float(target_hz)
+        self.pause_range = pause_range
+        self.use_numpy = (np is not None) if use_numpy is None else (use_numpy and np is not None)
+
+    def _shape(self, dist: float, speed: float):
+        duration = max(0.04, dist / speed)
+        # 步数：以 90Hz 左右为目标，但限制上限防止极端距离过慢造成卡顿
+        steps = int(max(12, min(900, math.ceil(duration * self.target_hz))))
+        amp_base = min(28.0, max(3.0, dist * 0.12))
+        return duration, steps, amp_base
+
+    def _pauses(self, steps: int, pause_range: Optional[tuple[float, float]] = None) -> list[tuple[int, float]]:
+        # 偶尔出现极短暂停（更像手在微调）；pause_range 为 None 时用构造时的默认值
+        pause_range = self.pause_range if pause_range is None else pause_range
+        out = []
+        for at in (int(steps * 0.35), int(steps * 0.62)):
+            if random.random() < 0.18:
+                out.append((at, random.uniform(*pause_range)))
+        return out
+
+    def plan(self, start: tuple[int, int], end: tuple[int, int], speed: float,
+             pause_range: Optional[tuple[float, float]] = None) -> Trajectory:
+        """pause_range: 本次移动中途停顿的时长范围（秒），通常取自当前的节奏配置"""
+        raw = self.plan_raw(start, end, speed, pause_range)
+        if raw is None:
+            return Trajectory([], [])
+        xs, ys, times = raw
+        xs = [int(round(x)) for x in xs]
+        ys = [int(round(y)) for y in ys]
+        # 最后对齐到终点（此时距离极小，不会形成“瞬移到目标点”的观感）
+        xs[-1], ys[-1] = int(end[0]), int(end[1])
+        return self._dedup(xs, ys, times)
+
+    def plan_raw(self, start, end, speed: float, pause_range: Optional[tuple[float, float]] = None):
+        """返回未取整的 (xs, ys, times)，起终点几乎重合时返回 None"""
+        sx, sy = start
+        tx, ty = end
+        dx, dy = tx - sx, ty - sy
+        dist = math.hypot(dx, dy)
+        if dist <= 0.5:
+            return None
+        duration, steps, amp_base = self._shape(dist, speed)
+        px, py = -dy / dist, dx / dist
+        ux, uy = dx / dist, dy / dist
+        amp1 = random.uniform(-amp_base, amp_base)
+        amp2 = random.uniform(-amp_base, amp_base)
+        c1x, c1y = sx + dx * 0.33 + px * amp1, sy + dy * 0.33 + py * amp1
+        c2x, c2y = sx + dx * 0.72 + px * amp2, sy + dy * 0.72 + py * amp2
+        dt = duration / steps
+        pauses = self._pauses(steps, pause_range)
+
+        if self.use_numpy:
+            t = np.arange(1, steps + 1) / steps
+            u = 1.0 - t
+            b0, b1, b2, b3 = u * u * u, 3 * u * u * t, 3 * u * t * t, t * t * t
+            j_perp = np.random.normal(0.0, amp_base * 0.18, steps) * u
+            j_along = np.random.normal(0.0, 1.5, steps) * u
+            xs = b0 * sx + b1 * c1x + b2 * c2x + b3 * tx + px * j_perp + ux * j_along
+            ys = b0 * sy + b1 * c1y + b2 * c2y + b3 * ty + py * j_perp + uy * j_along
+            # 轻微的随机加减速：第 i 个点在前 i 个随机间隔之后到达
+            gaps = np.maximum(0.001, dt * np.random.uniform(0.7, 1.35, steps))
+            for at, extra in pauses:
+                if at < steps:
+                    gaps[at] += extra
+            times = (np.cumsum(gaps) - gaps[0]).tolist()
+            return xs.tolist(), ys.tolist(), times
+        else:
+            xs, ys, times = [], [], []
+            gauss, uniform = random.gauss, random.uniform
+            pause_at = dict(pauses)
+            now = 0.0
+            for i in range(1, steps + 1):
+                t = i / steps
+                u = 1.0 - t
+                b0, b1, b2, b3 = u * u * u, 3 * u * u * t, 3 * u * t * t, t * t * t
+                j_perp = gauss(0.0, amp_base * 0.18) * u
+                j_along = gauss(0.0, 1.5) * u
+                xs.append(b0 * sx + b1 * c1x + b2 * c2x + b3 * tx + px * j_perp + ux * j_along)
+                ys.append(b0 * sy + b1 * c1y + b2 * c2y + b3 * ty + py * j_perp + uy * j_along)
+                times.append(now)
+                now += max(0.001, dt * uniform(0.7, 1.35)) + pause_at.get(i, 0.0)
+            return xs, ys, times
+
+    @staticmethod
+    def _dedup(xs, ys, times) -> Trajectory:
+        # 避免重复设置同一位置，减少抖动时的无意义调用
+        points, out_times = [], []
+        last = None
+        for x, y, t in zip(xs, ys, times):
+            if (x, y) != last:
+                points.append((x, y))
+                out_times.append(t)
+                last = (x, y)
+        return Trajectory(points, out_times)
+
+    @staticmethod
+    def replay(
+            traj: Trajectory,
+            set_pos: Callable[[int, int], None],
+            clock: Callable[[], float] = time.perf_counter,
+            sleep: Callable[[float], None] = time.sleep,
+    ) -> float:
+        """按绝对时刻回放轨迹，返回最大的滞后（秒），用于观察时间误差"""
+        start = clock()
+        worst = 0.0
+        for (x, y), at in zip(traj.points, traj.times):
+            delay = start + at - clock()
+            if delay > 0:
+                sleep(delay)
+            else:
+                worst = max(worst, -delay)
+            set_pos(x, y)
+        return worst
+
+
+class TrajectoryCache:
+    """
+    预生成的轨迹模板：在标准坐标系（起点 (0,0)，终点 (base,0)）下生成，
+    使用时旋转、缩放到新的起终点，时间按新的距离/速度等比缩放。
+    抖动幅度与距离有关，所以模板按距离分档（log2），同档内缩放比例在 2/3 到 4/3 之间。
+    模板本身不带停顿，中途停顿在每次 get 时按当时的 pause_range 另外插入，不同节奏配置可以共用模板。
+    """
+
+    def __init__(self, engine: TrajectoryEngine, per_bucket: int = 8) -> None:
+        self.engine = engine
+        self.per_bucket = max(1, int(per_bucket))
+        self._templates: dict[int, list[tuple]] = {}  # bucket -> [(base, speed, xs, ys, times)]
+        self._lock = Lock()
+
+    def get(self, start: tuple[int, int], end: tuple[int, int], speed: float,
+            pause_range: Optional[tuple[float, float]] = None) -> Trajectory:
+        sx, sy = start
+        dx, dy = end[0] - sx, end[1] - sy
+        dist = math.hypot(dx, dy)
+        if dist <= 0.5:
+            return Trajectory([], [])
+        bucket = int(math.floor(math.log2(max(1.0, dist))))
+        with self._lock:
+            pool = self._templates.setdefault(bucket, [])
+            template = random.choice(pool) if len(pool) >= self.per_bucket else None
+        if template is None:
+            base = 1.5 * (2 ** bucket)
+            template = (base, speed) + tuple(self.engine.plan_raw((0.0, 0.0), (base, 0.0), speed, (0.0, 0.0)))
+            with self._lock:
+                pool.append(template)
+        base, base_speed, txs, tys, ttimes = template
+        scale = dist / base
+        cos_a, sin_a = dx / dist, dy / dist
+        time_scale = (dist / speed) / (base / base_speed)
+        xs = [int(round(sx + (x * cos_a - y * sin_a) * scale)) for x, y in zip(txs, tys)]
+        ys = [int(round(sy + (x * sin_a + y * cos_a) * scale)) for x, y in zip(txs, tys)]
+        xs[-1], ys[-1] = int(end[0]), int(end[1])
+        times = [t * time_scale for t in ttimes]
+        for at, extra in self.engine._pauses(len(times), pause_range):
+            for i in range(at, len(times)):
+                times[i] += extra
+        return TrajectoryEngine._dedup(xs, ys, times)
+
+
+if __name__ == "__main__":
+    # 基准：轨迹生成耗时与回放的时间误差
+    rounds = 200
+    moves = [((random.randint(0, 1920), random.randint(0, 1080)), (random.randint(0, 1920), random.randint(0, 1080)))
+             for _ in range(rounds)]
+    speed = 3000.0
+    engines = [('python', TrajectoryEngine(use_numpy=False))]
+    if np is not None:
+        engines.append(('numpy', TrajectoryEngine(use_numpy=True)))
+    cache = TrajectoryCache(TrajectoryEngine(use_numpy=False))
+    for s, e in moves:
+        cache.get(s, e, speed)  # 预热模板
+    engines.append(('template', cache))
+    for name, engine in engines:
+        gen = engine.get if isinstance(engine, TrajectoryCache) else engine.plan
+        t0 = time.perf_counter()
+        trajs = [gen(s, e, speed) for s, e in moves]
+        cost = (time.perf_counter() - t0) / rounds
+        print(f'{name:<9} 生成 {cost * 1e6:8.1f} us/次，平均 {sum(len(t.points) for t in trajs) / rounds:.0f} 点')
+
+    traj = TrajectoryEngine(use_numpy=False).plan((0, 0), (1500, 800), 1500.0)
+    worst = TrajectoryEngine.replay(traj, lambda x, y: None)
+    print(f'回放 {len(traj.points)} 点，计划 {traj.duration * 1000:.1f} ms，最大滞后 {worst * 1000:.2f} ms')
@@ -0,0 +1,253 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from threading import Condition, Lock, Thread, current_thread
+from typing import Any, Callable, Optional
+
+try:
+    from .Metrics import LatencyStat
+except ImportError:
+    from Metrics import LatencyStat
+
+
+# 数字越小越先执行；同一优先级按提交顺序
+PRIORITY_RECV = 0
+PRIORITY_SEND = 10
+PRIORITY_BULK = 20
+
+
+def chain_future(src: Future, dst: Future) -> None:
+    """src 完成后把结果或异常转交给 dst；dst 被取消时也取消 src（src 已经开始执行时取消不了，照常完成）"""
+    def cancel(f: Future) -> None:
+        if f.cancelled():
+            src.cancel()
+    dst.add_done_callback(cancel)
+
+    def done(f: Future) -> None:
+        if dst.done():
+            return
+        if f.cancelled():
+            dst.cancel()
+        elif f.exception() is not None:
+            dst.set_exception(f.exception())
+        else:
+            dst.set_result(f.result())
+    src.add_done_callback(done)
+
+
+@dataclass(order=True)
+class UiCommand:
+    """
+    提交给 UiActor 的一次 UI 操作。
+    chat: 操作所在的会话（None 表示与具体会话无关，例如轮询、读通讯录）
+    coalesce: 允许与前一条同会话的命令合并，即不再重新切换会话
+    """
+    priority: int
+    seq: int
+    kind: str = field(compare=False)
+    fn: Callable[[], Any] = field(compare=False)
+    chat: Optional[str] = field(default=None, compare=False)
+    coalesce: bool = field(default=False, compare=False)
+    future: Future = field(default_factory=Future, compare=False)
+    submitted: float = field(default_factory=time.perf_counter, compare=False)
+    coalesced: bool = field(default=False, compare=False)
+
+
+class UiActor:
+    """
+    独占微信窗口的 UI 线程：所有 UI 操作都作为命令放进优先队列，由这一个线程依次执行，
+    调用方拿到 Future，不必自己抢锁；同一优先级严格按提交顺序（不会像 Lock 那样不公平）。
+
+    合并：上一条命令停在会话 X（由 note_chat 记录），队列里有允许合并的 X 会话命令时，
+    只要它的优先级不低于队首 coalesce_slack 以上，就先执行它（最多连续 max_coalesce 次，避免饿死别人），
+    并标记为 coalesced，执行时可以跳过 switch_to_sb。
+    """
+
+    def __init__(
+            self,
+            lock: Optional[Lock] = None,
+            coalesce_slack: int = PRIORITY_SEND - PRIORITY_RECV,
+            max_coalesce: int = 4,
+            name: str = "UiActor",
+    ) -> None:
+        self.lock = lock if lock is not None else Lock()  # 执行每条命令时持有，兼容仍直接使用 wx_lock 的代码
+        self.coalesce_slack = int(coalesce_slack)
+        self.max_coalesce = max(0, int(max_coalesce))
+        self.name = name
+        self._heap: list[UiCommand] = []
+        self._cv = Condition()
+        self._seq = itertools.count()
+        self._stopping = False
+        self._thread: Optional[Thread] = None
+        self._streak = 0
+        self.current: Optional[UiCommand] = None
+        self.current_chat: Optional[str] = None  # 最近一条命令结束时窗口停留的会话，不确定时为 None
+        self.queue_wait: dict[str, LatencyStat] = {}
+        self.run_time: dict[str, LatencyStat] = {}
+        self.coalesced_cnt = 0
+        self.high_water = 0
+
+    def start(self) -> None:
+        with self._cv:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0, cancel_pending: bool = True) -> bool:
+        """停止 UI 线程；cancel_pending=True 时取消尚未执行的命令，否则执行完再停。返回线程是否已退出"""
+        with self._cv:
+            self._stopping = True
+            if cancel_pending:
+                pending, self._heap = self._heap, []
+                for cmd in pending:
+                    cmd.future.cancel()
+            self._cv.notify_all()
+            thread = self._thread
+        if thread is None or thread is current_thread():
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def in_actor(self) -> bool:
+        return self._thread is not None and current_thread() is self._thread
+
+    def submit(
+            self,
+            fn: Callable[[], Any],
+            *,
+            kind: str = "",
+            priority: int = PRIORITY_SEND,
+            chat: Optional[str] = None,
+            coalesce: bool = False,
+    ) -> Future:
+        cmd = UiCommand(priority, next(self._seq), kind or getattr(fn, "__name__", "cmd"), fn, chat, coalesce)
+        if self.in_actor():
+            # 命令里再提交命令（例如 get_friends 里调用了公开方法）时直接执行，避免自己等自己
+            self._execute(cmd)
+            return cmd.future
+        with self._cv:
+            if self._stopping:
+                raise RuntimeError('UI 线程已停止')
+            heapq.heappush(self._heap, cmd)
+            self.high_water = max(self.high_water, len(self._heap))
+            self._cv.notify()
+        return cmd.future
+
+    def call(self, fn: Callable[[], Any], **kwargs) -> Any:
+        """阻塞版 submit：等待命令执行完并返回结果"""
+        return self.submit(fn, **kwargs).result()
+
+    def note_chat(self, name: Optional[str]) -> None:
+        """由执行中的命令告知窗口现在停在哪个会话（None 表示不确定）"""
+        self.current_chat = name
+
+    def can_skip_switch(self, name: str) -> bool:
+        """当前命令是与上一条同会话的合并命令，且窗口仍停在该会话"""
+        cmd = self.current
+        return cmd is not None and cmd.coalesced and self.current_chat == name
+
+    def depth(self) -> int:
+        with self._cv:
+            return len(self._heap)
+
+    def _pick(self) -> UiCommand:
+        # 调用时持有 self._cv 且队列非空
+        top = self._heap[0]
+        chat = self.current_chat
+        if chat is not None:
+            best = None
+            for cmd in self._heap:
+                if (cmd.coalesce and cmd.chat == chat and cmd.priority <= top.priority + self.coalesce_slack
+                        and (best is None or cmd < best)):
+                    best = cmd
+            # 本来就轮到它时不算插队；插队连续超过 max_coalesce 次后按正常顺序执行
+            if best is top:
+                self._streak = 0
+                best.coalesced = True
+                return heapq.heappop(self._heap)
+            if best is not None and self._streak < self.max_coalesce:
+                self._heap.remove(best)
+                heapq.heapify(self._heap)
+                best.coalesced = True
+                self._streak += 1
+                return best
+        self._streak = 0
+        return heapq.heappop(self._heap)
+
+    def _run(self) -> None:
+        while True:
+            with self._cv:
+                while not self._heap and not self._stopping:
+                    self._cv.wait()
+                if not self._heap:
+                    return
+                cmd = self._pick()
+            self._execute(cmd)
+
+    def _stat(self, table: dict, kind: str, suffix: str) -> LatencyStat:
+        stat = table.get(kind)
+        if stat is None:
+            stat = table.setdefault(kind, LatencyStat(f'{kind} {suffix}'))
+        return stat
+
+    def _execute(self, cmd: UiCommand) -> None:
+        if not cmd.future.set_running_or_notify_cancel():
+            return
+        nested = self.current is not None
+        self._stat(self.queue_wait, cmd.kind, 'queue_wait').record(time.perf_counter() - cmd.submitted)
+        if cmd.coalesced:
+            self.coalesced_cnt += 1
+        prev, self.current = self.current, cmd
+        t0 = time.perf_counter()
+        try:
+            if nested:
+                res = cmd.fn()
+            else:
+                with self.lock:
+                    res = cmd.fn()
+        except BaseException as e:
+            self.current_chat = None
+            cmd.future.set_exception(e)
+        else:
+            cmd.future.set_result(res)
+        finally:
+            self.current = prev
+            self._stat(self.run_time, cmd.kind, 'run').record(time.perf_counter() - t0)
+
+    def snapshot(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "high_water": self.high_water,
+            "coalesced": self.coalesced_cnt,
+            "queue_wait": {k: v.snapshot() for k, v in list(self.queue_wait.items())},
+            "run": {k: v.snapshot() for k, v in list(self.run_time.items())},
+        }
+
+
+if __name__ == "__main__":
+    # 演示：一个连续发送的“话痨”与轮询同时提交时，轮询不会被饿死；收到消息后对同一会话的回复被合并
+    actor = UiActor()
+    actor.start()
+    log = []
+
+    def op(tag, chat=None, cost=0.002):
+        def fn():
+            time.sleep(cost)
+            log.append(tag + ('*' if actor.current.coalesced else ''))
+            if chat is not None:
+                actor.note_chat(chat)
+        fn.__name__ = tag.split(':')[0]
+        return fn
+
+    futures = [actor.submit(op(f'send:B{i}', 'B'), priority=PRIORITY_SEND, chat='B', coalesce=True) for i in range(5)]
+    futures.append(actor.submit(op('recv:A', 'A'), priority=PRIORITY_RECV))
+    futures.append(actor.submit(op('send:A', 'A'), priority=PRIORITY_SEND, chat='A', coalesce=True))
+    for f in futures:
+        f.result()
+    print(' -> '.join(log))
+    print(actor.snapshot()['queue_wait'])
+    actor.stop()
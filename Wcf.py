@@ -1,4 +1,6 @@
-import queue
+import json
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pywinauto.application import Application
 import os
 import random
@@ -23,11 +25,189 @@ except Exception:
 try:
     from .utils import *
     from .WxMsg import WxMsg
-    from .WxMsgParser import WxMsgParser
+    from .WxMsgParser import WxMsgParser, ImagePipeline
+    from .MsgStore import MsgStore
+    from .MsgLog import MsgLog
+    from .BlobStore import BlobStore
+    from .DecoratePool import VariantPool
+    from .Metrics import LatencyStat
+    from .Pacing import Pacer, PacingProfile
+    from .NotifyQueue import NotifyQueue
+    from .MsgBatcher import MsgBatcher
+    from .Dispatcher import Dispatcher
+    from .UiActor import UiActor, chain_future, PRIORITY_RECV, PRIORITY_SEND, PRIORITY_BULK
+    from .Trajectory import TrajectoryEngine, TrajectoryCache
+    from .Poller import SweepPlanner, PollGovernor, ConvListDiffer, MsgAnchor, make_anchor, locate_anchor
 except ImportError:
     from utils import *
     from WxMsg import WxMsg
-    from WxMsgParser import WxMsgParser
+    from WxMsgParser import WxMsgParser, ImagePipeline
+    from MsgStore import MsgStore
+    from MsgLog import MsgLog
+    from BlobStore import BlobStore
+    from DecoratePool import VariantPool
+    from Metrics import LatencyStat
+    from Pacing import Pacer, PacingProfile
+    from NotifyQueue import NotifyQueue
+    from MsgBatcher import MsgBatcher
+    from Dispatcher import Dispatcher
+    from UiActor import UiActor, chain_future, PRIORITY_RECV, PRIORITY_SEND, PRIORITY_BULK
+    from Trajectory import TrajectoryEngine, TrajectoryCache
+    from Poller import SweepPlanner, PollGovernor, ConvListDiffer, MsgAnchor, make_anchor, locate_anchor
+
+DECORATE_SYSTEM_PROMPT = '''
+你是一位精通社交媒体沟通的语言风格大师。你的核心任务是接收一段由程序提供的固定文本，并对其进行润色和改写，使其看起来更像是真人在微信聊天中发出的消息，而不是由机器人自动生成的。最终目标是帮助微信机器人规避因发送重复、模式化消息而被平台限制的风险。
+
+在执行任务时，请严格遵守以下核心原则：
+
+1. 保持原意（Highest Priority）
+这是最高优先级的要求。无论你如何调整句式、语气或用词，改写后的文本必须尽可能准确地传达原始文本的全部核心信息。绝不能增加、删减或扭曲原文的意图。
+
+2. 字数限制（Highest Priority）
+改写后的文本必须严格控制在 100 字以内，且必须有且仅有一个自然段。如果原文超过这个长度，请务必进行必要的删减和浓缩，但前提是不能改变原意。
+
+3. 风格自然口语化
+
+拒绝列表式的表达，总结成连贯的表达。
+拒绝华丽的修辞，拒绝 AI 式的给出选项，拒绝过于正式或书面化的语言。改写后的文本应该听起来像是一个普通人在微信聊天中会说的话，具有自然、流畅的口语风格。
+
+模拟真人对话：使用自然、流畅的口语，就像朋友之间聊天一样。
+避免书面语：避免使用过于正式、僵硬或充满“程序感”的词汇和句式。
+语气友好：除非原文带有特殊情绪，否则整体基调应保持友好、礼貌和乐于助人。
+4. 创造表达多样性
+
+拒绝模板化：对于同一个输入，你的每一次输出都应该力求不同。请主动变换句式结构、使用同义词、调整语序。
+随机性：在保持自然的前提下，引入一定的随机性，让每次生成的结果都有细微差别。
+5. 恰当使用辅助元素
+
+Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地加入 1-2 个通用且符合情境的 Emoji，这能极大地提升消息的“真人感”。请注意不要过度使用或使用不恰当的表情。
+6. 简洁清晰
+在追求口语化和自然风格的同时，确保信息传达的清晰度。改写后的句子应言简意赅、易于理解，避免使用过于复杂或生僻的词汇。
+
+7. 注意表情必须使用微信的表情代码，把对应的代码嵌入你的回答中，发送后将会自动表现为表情。列表如下：
+[Aaagh!]
+[Angry]
+[Awesome]
+[Awkward]
+[Bah！R]
+[Bah！L]
+[Beckon]
+[Beer]
+[Blessing]
+[Blush]
+[Bomb]
+[Boring]
+[Broken]
+[BrokenHeart]
+[Bye]
+[Cake]
+[Chuckle]
+[Clap]
+[Cleaver]
+[Coffee]
+[Commando]
+[Concerned]
+[CoolGuy]
+[Cry]
+[Determined]
+[Dizzy]
+[Doge]
+[Drool]
+[Drowsy]
+[Duh]
+[Emm]
+[Facepalm]
+[Fireworks]
+[Fist]
+[Flushed]
+[Frown]
+[Gift]
+[GoForIt]
+[Grimace]
+[Grin]
+[Hammer]
+[Happy]
+[Heart]
+[Hey]
+[Hug]
+[Hurt]
+[Joyful]
+[KeepFighting]
+[Kiss]
+[Laugh]
+[Let Down]
+[LetMeSee]
+[Lips]
+[Lol]
+[Moon]
+[MyBad]
+[NoProb]
+[NosePick]
+[OK]
+[OMG]
+[Onlooker]
+[Packet]
+[Panic]
+[Party]
+[Peace]
+[Pig]
+[Pooh-pooh]
+[Poop]
+[Puke]
+[Respect]
+[Rose]
+[Salute]
+[Scold]
+[Scowl]
+[Scream]
+[Shake]
+[Shhh]
+[Shocked]
+[Shrunken]
+[Shy]
+[Sick]
+[Sigh]
+[Silent]
+[Skull]
+[Sleep]
+[Slight]
+[Sly]
+[Smart]
+[Smirk]
+[Smug]
+[Sob]
+[Speechless]
+[Sun]
+[Surprise]
+[Sweat]
+[Sweats]
+[TearingUp]
+[Terror]
+[ThumbsDown]
+[ThumbsUp]
+[Toasted]
+[Tongue]
+[Tremble]
+[Trick]
+[Twirl]
+[Watermelon]
+[Waddle]
+[Whimper]
+[Wilt]
+[Worship]
+[Wow]
+[Yawn]
+[Yeah!]
+
+8. 尽可能简短
+在保持信息完整和清晰的前提下，尽量使改写后的文本简洁明了。避免冗长的句子和不必要的修饰词。
+因为微信上很少出现大段的文字，过长的消息反而会显得不自然。简洁才是微信聊天的常态。
+
+输出要求：你的回答必须且仅能包含润色后的文本内容。
+
+不要包含任何解释、分析、或前缀，例如“好的，这是改写后的版本：”、“这里有几个选项：”等。直接输出最终结果即可。
+'''
+
 
 class Wcf:
     def __init__(self):
@@ -46,10 +226,33 @@ class Wcf:
         self._GROUP_RE = re.compile(r"^(?P<name>.*?)(?:\s*\((?P<count>\d+)\))?$")
 
         print("Other compositions")
+        self.trajectory_engine = TrajectoryEngine() # 停顿时长每次移动时按当前节奏配置给出（pacer.pause_range）
+        self.mouse_template_cache = TrajectoryCache(self.trajectory_engine) if self.mouse_use_templates else None
+        self.decorate_pool = VariantPool(
+            self.decorate_variants,
+            batch_size=self.decorate_pool_size,
+            low_water=max(1, self.decorate_pool_size // 3),
+            ttl=self.decorate_pool_ttl,
+            max_keys=self.decorate_pool_max_keys,
+        ) if self.decorate_pool_size > 0 else None
         self.chat = self.win.child_window(title="聊天", control_type="Button").wrapper_object()
         self.friend_list = self.win.child_window(title="通讯录", control_type="Button").wrapper_object()
         self.search = self.win.child_window(title="搜索", control_type="Edit").wrapper_object()
-        self.message_parser = WxMsgParser()
+        self.blob_store = BlobStore(self.image_store_dir) if self.image_store_dir else None
+        self.image_executor = (
+            ThreadPoolExecutor(max_workers=self.image_workers, thread_name_prefix="ImageEncode")
+            if self.image_workers > 0 else None
+        )
+        self.message_parser = WxMsgParser(
+            blob_store=self.blob_store,
+            executor=self.image_executor,
+            image_pipeline=ImagePipeline(
+                max_side=self.image_max_side,
+                format=self.image_format,
+                quality=self.image_quality,
+                keep_original=self.image_keep_original,
+            ),
+        )
         self.conv_list = self.win.child_window(title="会话", control_type="List")
         self.msg_list = self.win.child_window(title="消息", control_type="List")
 
@@ -59,14 +262,58 @@ class Wcf:
 
 
         print("Runtime elements")
-        self.wx_lock = Lock()
+        self.wx_lock = Lock() # UI 线程执行每条命令时持有
         self.current_chat_name, self.is_room, self.room_member_cnt = self.get_current_chat_and_is_group()
         print(f'初始会话对象：{self.current_chat_name}, 是否为群聊：{self.is_room}, 有几人：{self.room_member_cnt}')
-        self.msg_cache = {} # name -> [WxMsg]
-        self.new_msg_queue = queue.Queue()
-        self.new_msg_queue_lock = Lock()
+        self.msg_log = MsgLog(self.msg_db_path, batch_size=self.msg_db_batch) if self.msg_db_path else None
+        self.msg_store = MsgStore(self.memory_len, log=self.msg_log, dedup_window=self.msg_dedup_window) # name -> 最近 memory_len 条 WxMsg
+        if self.msg_log is not None:
+            print(f'从 {self.msg_db_path} 载入历史消息 {self.msg_store.warm_load()} 条')
+        self.msg_anchors: dict[str, MsgAnchor] = {} # name -> 已读到的最后一条消息
+        self.commit_tails: dict[str, Future] = {} # name -> 该聊天最后一批等待图片编码完成的消息，完成后移除
+        self.commit_lock = Lock()
+        self.send_lanes: dict[str, deque] = {} # receiver -> 按调用顺序排队、还没交给 UI 线程的文本，保证同一接收者按调用顺序发送
+        self.send_order_lock = Lock()
+        self.send_lock_stat = LatencyStat('send_lock_hold') # 每次发送文本占用 UI 线程的时间
+        self.send_prepare_executor = ThreadPoolExecutor(max_workers=self.send_prepare_workers, thread_name_prefix="SendPrepare")
+        self.new_msg_queue = NotifyQueue( # 每个聊天最多一条待处理通知，带新消息的 seq 范围
+            capacity=self.notify_capacity,
+            overflow=self.notify_overflow,
+            spill_path=self.notify_spill_path,
+            block_timeout=self.notify_block_timeout,
+            resume_spill=self.msg_log is not None, # 没有 MsgLog 时 seq 重启后从 1 开始，上次留下的通知已无意义
+        )
+        self.msg_batcher = MsgBatcher(self.msg_store, self.new_msg_queue)
+        self.msg_listeners: list = [] # fn(name, msgs)，新消息写入缓存后回调
+        self.dispatcher = Dispatcher(
+            workers=self.dispatch_workers,
+            max_inflight=self.dispatch_max_inflight,
+            default_timeout=self.handler_timeout,
+            is_self=self.is_msg_from_me,
+        )
         self.recv_stop_event = Event()
         self.recv_thread: Thread | None = None
+        self.last_unread_total: int | None = None # 上一轮读到的未读总数角标
+        self.skipped_scans = 0 # 因角标未变连续跳过会话列表扫描的轮数
+        self.badge_empty = False # 最近一次读到的角标值是否为空
+        self.empty_badge_is_zero = False # 已由完整扫描确认过：角标为空时会话列表里确实没有未读
+        self.sweep_planner = SweepPlanner(
+            order=self.sweep_order,
+            max_hold=self.sweep_max_hold,
+            max_chats=None if self.enable_sweep else 1,
+        )
+        self.conv_differ = ConvListDiffer(
+            max_retries=self.listen_retry_max,
+            retry_backoff=self.listen_retry_backoff,
+        )
+        self.poll_governor = PollGovernor(
+            floor=self.listen_msg_interval,
+            ceiling=self.listen_msg_interval_max,
+            decay=self.listen_msg_backoff,
+            idle_ticks=self.listen_msg_idle_ticks,
+        )
+        self.ui_actor = UiActor(lock=self.wx_lock, max_coalesce=self.ui_max_coalesce)
+        self.ui_actor.start()
 
         print("Init finished")
 
@@ -87,17 +334,80 @@ class Wcf:
             self.EPS = float(cfg['EPS'])
             self.square_eps = float(cfg['square_eps'])
             self.mouse_move_speed = float(cfg['mouse_move_speed'])
+            self.mouse_use_templates = bool(cfg.get('mouse_use_templates', False))
             self.memory_len = int(cfg['memory_len'])
             self.max_new_msg_cnt = int(cfg['max_new_msg_cnt'])
+            self.anchor_max_scroll = int(cfg.get('anchor_max_scroll', 5))
+            self.msg_db_path = cfg.get('msg_db_path') or None
+            if self.msg_db_path and not Path(self.msg_db_path).is_absolute():
+                self.msg_db_path = str(cfg_path.parent.parent / self.msg_db_path)
+            self.msg_db_batch = int(cfg.get('msg_db_batch', 32))
+            self.msg_dedup_window = int(cfg.get('msg_dedup_window', 50))
+            self.notify_capacity = int(cfg.get('notify_capacity', 0))
+            self.notify_overflow = str(cfg.get('notify_overflow', 'block'))
+            self.notify_spill_path = cfg.get('notify_spill_path') or None
+            if self.notify_spill_path and not Path(self.notify_spill_path).is_absolute():
+                self.notify_spill_path = str(cfg_path.parent.parent / self.notify_spill_path)
+            block_timeout = cfg.get('notify_block_timeout', 30.0)
+            self.notify_block_timeout = None if block_timeout is None else float(block_timeout)
             self.listen_msg_interval = float(cfg['listen_msg_interval'])
+            self.listen_msg_interval_max = float(cfg.get('listen_msg_interval_max', self.listen_msg_interval))
+            self.listen_msg_backoff = float(cfg.get('listen_msg_backoff', 1.5))
+            self.listen_msg_idle_ticks = int(cfg.get('listen_msg_idle_ticks', 3))
+            self.listen_full_scan_ticks = int(cfg.get('listen_full_scan_ticks', 10))
+            self.listen_top_check = int(cfg.get('listen_top_check', 2))
+            self.listen_top_check_ticks = int(cfg.get('listen_top_check_ticks', 3))
+            self.listen_retry_max = int(cfg.get('listen_retry_max', 5))
+            self.listen_retry_backoff = float(cfg.get('listen_retry_backoff', 0.5))
             self.type_min_interval = float(cfg['type_min_interval'])
             self.type_max_interval = float(cfg['type_max_interval'])
+            self.type_burst_gap = float(cfg.get('type_burst_gap', 0.015))
+            self.type_paste_threshold = int(cfg.get('type_paste_threshold', 0))
+            self.ui_max_coalesce = int(cfg.get('ui_max_coalesce', 4))
+            self.send_prepare_workers = max(1, int(cfg.get('send_prepare_workers', 4)))
+            self.dispatch_workers = int(cfg.get('dispatch_workers', 4))
+            self.dispatch_max_inflight = int(cfg.get('dispatch_max_inflight', 64))
+            handler_timeout = cfg.get('handler_timeout', 30)
+            self.handler_timeout = None if handler_timeout is None else float(handler_timeout)
+            # 节奏配置：顶层的 eps/EPS/鼠标/键入参数构成 default，pacing_profiles 中的各项在其基础上覆盖
+            self.pacer = Pacer.from_config(
+                PacingProfile(
+                    eps=self.eps,
+                    EPS=self.EPS,
+                    mouse_move_speed=self.mouse_move_speed,
+                    type_min_interval=self.type_min_interval,
+                    type_max_interval=self.type_max_interval,
+                ),
+                cfg.get('pacing_profiles') or {},
+                default=cfg.get('default_pacing') or None,
+                by_receiver=cfg.get('receiver_pacing') or {},
+            )
+            dib_cache.budget = int(float(cfg.get('dib_cache_mb', 64)) * 1024 * 1024)
             self.enable_image_parse = bool(cfg['enable_image_parse'])
+            self.image_store_dir = cfg.get('image_store_dir') or None
+            self.image_workers = int(cfg.get('image_workers', 2))
+            self.image_max_side = int(cfg.get('image_max_side', 0))
+            self.image_format = str(cfg.get('image_format', 'original')).lower()
+            self.image_quality = int(cfg.get('image_quality', 85))
+            self.image_keep_original = bool(cfg.get('image_keep_original', False))
+            if self.image_store_dir and not Path(self.image_store_dir).is_absolute():
+                self.image_store_dir = str(cfg_path.parent.parent / self.image_store_dir)
+            self.enable_sweep = bool(cfg.get('enable_sweep', True))
+            self.sweep_order = str(cfg.get('sweep_order', 'round_robin'))
+            self.sweep_max_hold = float(cfg.get('sweep_max_hold', 2.0))
             self.llm = dict(cfg['llm'])
+            self.decorate_stream = bool(cfg.get('decorate_stream', False))
+            self.decorate_stream_stall = float(cfg.get('decorate_stream_stall', 5.0))
+            self.decorate_pool_size = int(cfg.get('decorate_pool_size', 0))
+            self.decorate_pool_ttl = float(cfg.get('decorate_pool_ttl', 6 * 3600))
+            self.decorate_pool_max_keys = int(cfg.get('decorate_pool_max_keys', 200))
             self.api = API(config=self.llm)
         except KeyError as e:
             print(f'错误：配置缺少字段 {e}，请检查 ./config/config.yaml')
             raise SystemExit(1)
+        except ValueError as e:
+            print(f'错误：节奏配置有误：{e}，请检查 ./config/config.yaml')
+            raise SystemExit(1)
 
     def get_cursor_pos(self) -> tuple[int, int]:
         x, y = win32api.GetCursorPos()
@@ -107,10 +417,10 @@ class Wcf:
         win32api.SetCursorPos((int(x), int(y)))
 
     def mouse_move(self, target_xy: tuple[int, int], *, speed: float | None = None) -> None:
-        """模拟人的鼠标移动：从当前位置出发，用随机、不平滑但整体朝向正确的曲线逐步移动到目标点。
+        """模拟人的鼠标移动：从当前位置出发，用随机、不平滑但整体朝向正确的曲线逐步移动到目标点（轨迹见 Trajectory.py）。
 
         - 禁止瞬间跳到目标点：不会在一步内 SetCursorPos 到终点（除非起终点极近）。
-        - speed: 像素/秒，越大越快；None 时使用配置 mouse_move_speed。
+        - speed: 像素/秒，越大越快；None 时使用当前节奏配置的 mouse_move_speed。
         """
         if not isinstance(target_xy, (tuple, list)) or len(target_xy) != 2:
             raise TypeError(f'expected (x, y) tuple, got: {target_xy!r}')
@@ -124,7 +434,7 @@ class Wcf:
         if dist <= 0.5:
             return
 
-        use_speed = self.mouse_move_speed if speed is None else speed
+        use_speed = self.pacer.mouse_speed() if speed is None else speed
         try:
             use_speed = float(use_speed)
         except Exception:
@@ -132,66 +442,14 @@ class Wcf:
         if use_speed <= 0:
             use_speed = 1200.0
 
-        # 总时长由距离和速度决定；每步 sleep = duration / steps
-        duration = max(0.04, dist / use_speed)
-
-        # 生成两段随机的“弯曲”控制：沿垂直方向偏移，形成整体正确的曲线
-        # 幅度随距离增长，但有上下限，避免太夸张或太直。
-        if dist > 1:
-            perp_len = dist
-            px = -dy / perp_len
-            py = dx / perp_len
+        # 整条轨迹（坐标 + 时间表）一次算好，再按绝对时刻回放
+        pause_range = self.pacer.pause_range()
+        if self.mouse_template_cache is not None:
+            traj = self.mouse_template_cache.get((sx, sy), (tx, ty), use_speed, pause_range)
         else:
-            px, py = 0.0, 0.0
-
-        amp_base = min(28.0, max(3.0, dist * 0.12))
-        amp1 = random.uniform(-amp_base, amp_base)
-        amp2 = random.uniform(-amp_base, amp_base)
-
-        c1x = sx + dx * 0.33 + px * amp1
-        c1y = sy + dy * 0.33 + py * amp1
-        c2x = sx + dx * 0.72 + px * amp2
-        c2y = sy + dy * 0.72 + py * amp2
-
-        # 步数：以 90Hz 左右为目标，但限制上限防止极端距离过慢造成卡顿
-        target_hz = 90.0
-        steps = int(max(12, min(900, math.ceil(duration * target_hz))))
-        dt = duration / steps
-
-        def bezier(t: float) -> tuple[float, float]:
-            u = 1.0 - t
-            x = (u * u * u) * sx + 3 * (u * u) * t * c1x + 3 * u * (t * t) * c2x + (t * t * t) * tx
-            y = (u * u * u) * sy + 3 * (u * u) * t * c1y + 3 * u * (t * t) * c2y + (t * t * t) * ty
-            return x, y
-
-        last_x, last_y = sx, sy
-        for i in range(1, steps + 1):
-            t = i / steps
-
-            bx, by = bezier(t)
-
-            # “不平滑”：加入逐渐衰减的抖动（沿方向+垂直方向）
-            jitter_scale = (1.0 - t)
-            j_perp = random.gauss(0.0, amp_base * 0.18) * jitter_scale
-            j_along = random.gauss(0.0, 1.5) * jitter_scale
-
-            nx = bx + px * j_perp + (dx / dist) * j_along
-            ny = by + py * j_perp + (dy / dist) * j_along
-
-            ix, iy = int(round(nx)), int(round(ny))
-
-            # 避免重复设置同一位置，减少抖动时的无意义调用
-            if ix != last_x or iy != last_y:
-                self.set_cursor_pos(ix, iy)
-                last_x, last_y = ix, iy
-
-            # 轻微的随机加减速（保持总体 duration 不变的同时让节奏更“人”）
-            sleep_dt = max(0.001, dt * random.uniform(0.7, 1.35))
-            time.sleep(sleep_dt)
-
-            # 偶尔出现极短暂停（更像手在微调）
-            if i in (int(steps * 0.35), int(steps * 0.62)) and random.random() < 0.18:
-                self.wait_a_little_while()
+            traj = self.trajectory_engine.plan((sx, sy), (tx, ty), use_speed, pause_range)
+        self.trajectory_engine.replay(traj, self.set_cursor_pos)
+        self.pacer.account(traj.duration)
 
         # 最后对齐到终点（此时距离极小，不会形成“瞬移到目标点”的观感）
         self.set_cursor_pos(tx, ty)
@@ -250,166 +508,39 @@ class Wcf:
         self.mouse_move((int(x), int(y)))
         self.mouse_click_current_pos(button=button)
 
+    def decorate_variants(self, text: str, n: int) -> list[str]:
+        '''一次请求 n 个不同的润色版本'''
+        msgs = [
+            {'role': 'system', 'content': DECORATE_SYSTEM_PROMPT},
+            {'role': 'user', 'content': (
+                f'请针对下面这段文本给出 {n} 个互不相同的润色版本。'
+                f'本次只输出一个 JSON 字符串数组，数组中每个元素是一个版本，不要输出其他任何内容。\n\n{text}'
+            )},
+        ]
+        res = self.api.get_response(msgs)
+        variants = parse_json_array(res)
+        if variants is None:
+            print(f'润色版本解析失败：{res}')
+            return []
+        return [str(v).strip() for v in variants if str(v).strip()]
+
+    def decorate_messages(self, text: str) -> list[dict]:
+        return [
+            {'role': 'system', 'content': DECORATE_SYSTEM_PROMPT},
+            {'role': 'user', 'content': str(text)},
+        ]
+
     def decorate_text(self, text: str) -> str:
         if text is None:
             return None
 
-        system_prompt = '''
-你是一位精通社交媒体沟通的语言风格大师。你的核心任务是接收一段由程序提供的固定文本，并对其进行润色和改写，使其看起来更像是真人在微信聊天中发出的消息，而不是由机器人自动生成的。最终目标是帮助微信机器人规避因发送重复、模式化消息而被平台限制的风险。
-
-在执行任务时，请严格遵守以下核心原则：
-
-1. 保持原意（Highest Priority）
-这是最高优先级的要求。无论你如何调整句式、语气或用词，改写后的文本必须尽可能准确地传达原始文本的全部核心信息。绝不能增加、删减或扭曲原文的意图。
-
-2. 字数限制（Highest Priority）
-改写后的文本必须严格控制在 100 字以内，且必须有且仅有一个自然段。如果原文超过这个长度，请务必进行必要的删减和浓缩，但前提是不能改变原意。
-
-3. 风格自然口语化
-
-拒绝列表式的表达，总结成连贯的表达。
-拒绝华丽的修辞，拒绝 AI 式的给出选项，拒绝过于正式或书面化的语言。改写后的文本应该听起来像是一个普通人在微信聊天中会说的话，具有自然、流畅的口语风格。
-
-模拟真人对话：使用自然、流畅的口语，就像朋友之间聊天一样。
-避免书面语：避免使用过于正式、僵硬或充满“程序感”的词汇和句式。
-语气友好：除非原文带有特殊情绪，否则整体基调应保持友好、礼貌和乐于助人。
-4. 创造表达多样性
-
-拒绝模板化：对于同一个输入，你的每一次输出都应该力求不同。请主动变换句式结构、使用同义词、调整语序。
-随机性：在保持自然的前提下，引入一定的随机性，让每次生成的结果都有细微差别。
-5. 恰当使用辅助元素
-
-Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地加入 1-2 个通用且符合情境的 Emoji，这能极大地提升消息的“真人感”。请注意不要过度使用或使用不恰当的表情。
-6. 简洁清晰
-在追求口语化和自然风格的同时，确保信息传达的清晰度。改写后的句子应言简意赅、易于理解，避免使用过于复杂或生僻的词汇。
-
-7. 注意表情必须使用微信的表情代码，把对应的代码嵌入你的回答中，发送后将会自动表现为表情。列表如下：
-[Aaagh!]
-[Angry]
-[Awesome]
-[Awkward]
-[Bah！R]
-[Bah！L]
-[Beckon]
-[Beer]
-[Blessing]
-[Blush]
-[Bomb]
-[Boring]
-[Broken]
-[BrokenHeart]
-[Bye]
-[Cake]
-[Chuckle]
-[Clap]
-[Cleaver]
-[Coffee]
-[Commando]
-[Concerned]
-[CoolGuy]
-[Cry]
-[Determined]
-[Dizzy]
-[Doge]
-[Drool]
-[Drowsy]
-[Duh]
-[Emm]
-[Facepalm]
-[Fireworks]
-[Fist]
-[Flushed]
-[Frown]
-[Gift]
-[GoForIt]
-[Grimace]
-[Grin]
-[Hammer]
-[Happy]
-[Heart]
-[Hey]
-[Hug]
-[Hurt]
-[Joyful]
-[KeepFighting]
-[Kiss]
-[Laugh]
-[Let Down]
-[LetMeSee]
-[Lips]
-[Lol]
-[Moon]
-[MyBad]
-[NoProb]
-[NosePick]
-[OK]
-[OMG]
-[Onlooker]
-[Packet]
-[Panic]
-[Party]
-[Peace]
-[Pig]
-[Pooh-pooh]
-[Poop]
-[Puke]
-[Respect]
-[Rose]
-[Salute]
-[Scold]
-[Scowl]
-[Scream]
-[Shake]
-[Shhh]
-[Shocked]
-[Shrunken]
-[Shy]
-[Sick]
-[Sigh]
-[Silent]
-[Skull]
-[Sleep]
-[Slight]
-[Sly]
-[Smart]
-[Smirk]
-[Smug]
-[Sob]
-[Speechless]
-[Sun]
-[Surprise]
-[Sweat]
-[Sweats]
-[TearingUp]
-[Terror]
-[ThumbsDown]
-[ThumbsUp]
-[Toasted]
-[Tongue]
-[Tremble]
-[Trick]
-[Twirl]
-[Watermelon]
-[Waddle]
-[Whimper]
-[Wilt]
-[Worship]
-[Wow]
-[Yawn]
-[Yeah!]
-
-8. 尽可能简短
-在保持信息完整和清晰的前提下，尽量使改写后的文本简洁明了。避免冗长的句子和不必要的修饰词。
-因为微信上很少出现大段的文字，过长的消息反而会显得不自然。简洁才是微信聊天的常态。
-
-输出要求：你的回答必须且仅能包含润色后的文本内容。
+        if self.decorate_pool is not None:
+            res = self.decorate_pool.get(text)
+            if res:
+                print(f'润色（预生成）: {text} -> {res}')
+                return res
 
-不要包含任何解释、分析、或前缀，例如“好的，这是改写后的版本：”、“这里有几个选项：”等。直接输出最终结果即可。
-'''
-        msgs = [
-            {'role': 'system', 'content': system_prompt},
-            {'role': 'user', 'content': str(text)},
-        ]
+        msgs = self.decorate_messages(text)
         try:
             print(f'正在润色文本: {text}\n')
             res = self.api.get_response(msgs)
@@ -422,17 +553,67 @@ Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地
             return None
         return str(res).strip()
 
+    def decorate_many(self, texts: list[str]) -> list[str | None]:
+        '''
+        一次请求润色多段文本（共用一份系统提示词），要求模型按顺序返回等长的 JSON 数组；
+        数量不符时整体退回逐条润色，个别条目为空时只对这些条目单独润色。
+        return: 与 texts 等长，润色失败的位置为 None
+        '''
+        texts = [None if t is None else str(t) for t in texts]
+        todo = [i for i, t in enumerate(texts) if t is not None and t.strip()]
+        results: list[str | None] = [None] * len(texts)
+        if not todo:
+            return results
+        if len(todo) == 1:
+            results[todo[0]] = self.decorate_text(texts[todo[0]])
+            return results
+
+        batch = [texts[i] for i in todo]
+        msgs = [
+            {'role': 'system', 'content': DECORATE_SYSTEM_PROMPT},
+            {'role': 'user', 'content': (
+                f'下面是一个包含 {len(batch)} 段文本的 JSON 字符串数组，请对每一段分别润色。'
+                f'本次只输出一个长度为 {len(batch)} 的 JSON 字符串数组，顺序与输入一一对应，不要输出其他任何内容。\n\n'
+                + json.dumps(batch, ensure_ascii=False)
+            )},
+        ]
+        print(f'正在批量润色 {len(batch)} 段文本')
+        decorated = parse_json_array(self.api.get_response(msgs))
+        if decorated is None or len(decorated) != len(batch):
+            print(f'批量润色结果数量不符（期望 {len(batch)}，得到 {None if decorated is None else len(decorated)}），改为逐条润色')
+            decorated = [None] * len(batch)
+        for i, res in zip(todo, decorated):
+            res = str(res).strip() if isinstance(res, str) else ''
+            results[i] = res if res else self.decorate_text(texts[i])
+        return results
+
+    def send_texts(self, texts: list[str], receiver: str, need_decorate: bool = True, pacing: str | None = None) -> list[int]:
+        '''给同一接收者连续发送多条文本，润色合并为一次模型请求；返回每条的发送结果'''
+        receiver = clean_name(receiver)
+        if need_decorate:
+            decorated = self.decorate_many(texts)
+            texts = [d if d is not None else t for t, d in zip(texts, decorated)]
+        return [self.send_text(text, receiver, need_decorate=False, pacing=pacing) for text in texts]
+
     def wait_a_little_while(self):
-        delta = self.eps / 2
-        low = max(0.0, self.eps - delta)
-        high = max(low, self.eps + delta)
-        time.sleep(random.uniform(low, high))
+        self.pacer.wait_little()
 
     def wait_a_large_while(self):
-        delta = self.EPS / 2
-        low = max(0.0, self.EPS - delta)
-        high = max(low, self.EPS + delta)
-        time.sleep(random.uniform(low, high))
+        self.pacer.wait_large()
+
+    def type_text(self, text: str, with_enter: bool = True, paste_threshold: int = 0) -> None:
+        '''按当前节奏配置的键入间隔模拟人类键入，耗时计入当前操作的刻意等待'''
+        low, high = self.pacer.type_intervals()
+        t0 = time.monotonic()
+        type_text_humanlike(
+            text,
+            with_enter=with_enter,
+            min_interval=low,
+            max_interval=high,
+            burst_gap=self.type_burst_gap,
+            paste_threshold=paste_threshold,
+        )
+        self.pacer.account(time.monotonic() - t0)
 
     def stay_focus(self):
         self.win.set_focus()
@@ -482,6 +663,9 @@ Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地
         name = clean_name(name)
         # if self.current_chat_name == name: # 牺牲一点效率，换来把小红点点掉
         #     return
+        # 例外：UI 线程把紧挨着的同会话命令（如收到消息后立即回复）合并执行时，窗口本来就停在这里
+        if self.ui_actor.can_skip_switch(name):
+            return
         exist_names = self.conv_list.children(control_type="ListItem")[:self.listen_cnt]
         for exist_name in exist_names:
             cln_name, _, _ = analysis_name(exist_name.window_text())
@@ -489,24 +673,29 @@ Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地
                 self.click(exist_name)
                 self.wait_a_little_while()
                 self.current_chat_name, self.is_room, self.room_member_cnt = self.get_current_chat_and_is_group()
+                self.ui_actor.note_chat(name)
                 return
         self.click(self.search)
         self.wait_a_little_while()
-        type_text_humanlike(
-            name,
-            with_enter=True,
-            min_interval=self.type_min_interval,
-            max_interval=self.type_max_interval
-        )
+        self.type_text(name, with_enter=True)
         self.wait_a_little_while()
         search_result = self.win.child_window(title="@str:IDS_FAV_SEARCH_RESULT:3780", control_type="List")
         first_result = search_result.child_window(title=name, control_type="ListItem", found_index=0).wrapper_object()
         self.click(first_result)
         self.wait_a_little_while()
         self.current_chat_name, self.is_room, self.room_member_cnt = self.get_current_chat_and_is_group()
+        self.ui_actor.note_chat(name)
 
-    def get_friends(self):
-        with self.wx_lock:
+    def submit_get_friends(self, pacing: str | None = None) -> Future:
+        '''提交读取通讯录的 UI 命令（低优先级），返回 Future[list[str]]'''
+        return self.ui_actor.submit(lambda: self._get_friends(pacing), kind='get_friends', priority=PRIORITY_BULK)
+
+    def get_friends(self, pacing: str | None = None):
+        return self.submit_get_friends(pacing).result()
+
+    def _get_friends(self, pacing: str | None = None):
+        with self.pacer.session('get_friends', pacing=pacing):
+            self.ui_actor.note_chat(None)
             self.stay_focus()
             self.click(self.friend_list)
             self.wait_a_little_while()
@@ -575,39 +764,179 @@ Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地
         return # TODO: 被动接受消息时，理论上一直会在最上面呆着，所以暂时不做处理，如果您不放心，就设置好唯一置顶，并 switch 过去
         self.switch_to_sb(self.default_chat_name)
 
-    def send_text(self, text: str, receiver: str, need_decorate: bool = True) -> int:
-        with self.wx_lock:
+    def send_text(self, text: str, receiver: str, need_decorate: bool = True, pacing: str | None = None) -> int:
+        '''
+        润色（网络请求，可能要几秒）在 UI 线程外完成，期间接收线程和其他发送者照常工作；
+        只有切换会话和键入时才占用 UI 线程。同一接收者的多条消息按调用顺序发出。
+        pacing: 节奏配置名，None 时按 receiver_pacing 或 default_pacing 选用
+        '''
+        receiver = clean_name(receiver)
+        fut = Future()
+        self._enqueue_text(text, receiver, need_decorate, pacing, self._reserve_send_turn(receiver), fut)
+        return fut.result()
+
+    def submit_send_text(self, text: str, receiver: str, need_decorate: bool = True, pacing: str | None = None) -> Future:
+        '''send_text 的非阻塞版本：润色在后台线程进行，立即返回 Future[int]'''
+        receiver = clean_name(receiver)
+        # 在调用线程里占好顺序，后台线程谁先润色完都不会打乱同一接收者的发送顺序
+        slot = self._reserve_send_turn(receiver)
+        fut = Future()
+        try:
+            self.send_prepare_executor.submit(self._enqueue_text, text, receiver, need_decorate, pacing, slot, fut)
+        except Exception:
+            self._fill_send_turn(receiver, slot, lambda: None)
+            raise
+        return fut
+
+    def _reserve_send_turn(self, receiver: str) -> list:
+        '''为 receiver 的下一条文本排队占位，返回的 slot 准备好之后交给 _fill_send_turn'''
+        slot = [None]  # 准备好之后放入提交函数
+        with self.send_order_lock:
+            self.send_lanes.setdefault(receiver, deque()).append(slot)
+        return slot
+
+    def _fill_send_turn(self, receiver: str, slot: list, submit) -> None:
+        '''
+        slot 已准备好，submit() 负责把它交给 UI 线程（不抛异常）。从队头开始依次提交所有已准备好的，
+        前面还有没准备好的就先留在队列里，由前一条准备好时顺带提交；不等待，不占用润色线程
+        '''
+        with self.send_order_lock:
+            slot[0] = submit
+            lane = self.send_lanes[receiver]
+            while lane and lane[0][0] is not None:
+                lane.popleft()[0]()
+            if not lane:
+                del self.send_lanes[receiver]
+
+    def _prepare_text(self, text: str, need_decorate: bool) -> tuple[str, StreamPrefetch | None]:
+        '''在当前线程润色，返回 (要发送的文本, 流式润色)'''
+        stream = None
+        if need_decorate and self.decorate_stream:
+            # 预生成池命中时不需要等模型；否则在这里（UI 线程外）等到模型吐出第一块内容，再交给 UI 线程边收边键入
+            pooled = self.decorate_pool.get(text) if self.decorate_pool is not None else None
+            if pooled:
+                text = pooled
+            else:
+                stream = self.start_decorate_stream(text)
+                stream.wait_first()
+        elif need_decorate:
+            decorated = self.decorate_text(text)
+            if decorated is not None:
+                text = decorated
+        return text, stream
+
+    def _enqueue_text(self, text: str, receiver: str, need_decorate: bool, pacing: str | None, slot, fut: Future) -> None:
+        '''
+        在当前线程润色，然后把“提交发送命令”放进 slot：轮到它时（前一条已交给 UI 线程）才提交，结果转交给 fut。
+        fut 在提交前已被取消时不再提交。slot: _reserve_send_turn 在调用时预留的位置
+        '''
+        try:
+            prepared, error = self._prepare_text(text, need_decorate), None
+        except Exception as e:
+            prepared, error = None, e
+
+        def submit():
+            try:
+                if error is not None:
+                    raise error
+                if fut.cancelled():
+                    return
+                send, stream = prepared
+                chain_future(self.submit_send_text_now(send, receiver, decorate_stream=stream, pacing=pacing), fut)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+        self._fill_send_turn(receiver, slot, submit)
+
+    def start_decorate_stream(self, text: str) -> StreamPrefetch:
+        '''在后台线程开始流式润色 text，返回的 StreamPrefetch 可先等第一块内容，再交给 submit_send_text_now'''
+        print(f'正在流式润色文本: {text}')
+        return StreamPrefetch(
+            lambda: self.api.stream_response(self.decorate_messages(text)),
+            stall_timeout=self.decorate_stream_stall if self.decorate_stream_stall > 0 else None,
+        )
+
+    def send_text_now(self, text: str, receiver: str, decorate_stream: bool = False, pacing: str | None = None) -> int:
+        return self.submit_send_text_now(text, receiver, decorate_stream, pacing).result()
+
+    def submit_send_text_now(self, text: str, receiver: str, decorate_stream=False, pacing: str | None = None) -> Future:
+        '''
+        提交“切换到 receiver 并键入 text”的 UI 命令，返回 Future[int]。
+        decorate_stream=True（或 start_decorate_stream 返回的 StreamPrefetch）时边接收模型的流式润色结果边键入，
+        流出错时改为发送原文 text；UI 命令在模型吐出第一块内容后才提交，等首包的时间不占用 UI 线程
+        '''
+        receiver = clean_name(receiver)
+        stream = self.start_decorate_stream(text) if decorate_stream is True else (decorate_stream or None)
+
+        def submit() -> Future:
+            return self.ui_actor.submit(
+                lambda: self._send_text_ui(text, receiver, stream, pacing),
+                kind='send_text', priority=PRIORITY_SEND, chat=receiver, coalesce=True,
+            )
+        if stream is None or stream.first.done():
+            return submit()
+        fut = Future()
+
+        def on_first(_):
+            if fut.cancelled():
+                return
+            try:
+                chain_future(submit(), fut)
+            except Exception as e:
+                fut.set_exception(e)
+        stream.first.add_done_callback(on_first)
+        return fut
+
+    def _send_text_ui(self, text: str, receiver: str, stream: StreamPrefetch | None, pacing: str | None) -> int:
+        with self.send_lock_stat.timer(), self.pacer.session('send_text', pacing, receiver):
             self.stay_focus()
-            receiver = clean_name(receiver)
             try:
-                if need_decorate:
-                    decorated = self.decorate_text(text)
-                    if decorated is not None:
-                        text = decorated
                 self.switch_to_sb(receiver)
-                type_text_humanlike(
-                    text, 
-                    with_enter=True, 
-                    min_interval=self.type_min_interval, 
-                    max_interval=self.type_max_interval
-                )
+                if stream is not None:
+                    low, high = self.pacer.type_intervals()
+                    text = type_text_stream(
+                        stream.chunks(),
+                        with_enter=True,
+                        min_interval=low,
+                        max_interval=high,
+                        fallback_text=text,
+                    )
+                    # 流式键入的耗时里混有等模型的时间（每次停顿最多 decorate_stream_stall 秒），这里只按字数估算刻意的键入间隔
+                    self.pacer.account((len(text) + 1) * (low + high) / 2)
+                    print(f'润色后: {text}')
+                else:
+                    self.type_text(text, with_enter=True, paste_threshold=self.type_paste_threshold)
                 self.wait_a_little_while()
-                self.add_new_msg(receiver, WxMsg(
+                self.commit_sent_msg(receiver, lambda echo: WxMsg(
                     type=0,
                     sender=self.wx_name,
                     roomid=self.current_chat_name if self.is_room else None,
                     content=text,
                     is_meaningful=True,
-                ))
+                ), lambda msg: msg.type == 0 and msg.content == text)
+                self.msg_store.flush()
+                self.conv_differ.expect_move(receiver)
+                self.poll_governor.notify_activity()
                 return 0
             except Exception as e:
+                self.ui_actor.note_chat(None)
                 print(f"发送文字时报错：{e}")
                 return 1
 
-    def send_image(self, path: str, receiver: str) -> int:
-        with self.wx_lock:
+    def send_image(self, path: str, receiver: str, pacing: str | None = None) -> int:
+        return self.submit_send_image(path, receiver, pacing).result()
+
+    def submit_send_image(self, path: str, receiver: str, pacing: str | None = None) -> Future:
+        '''提交发送图片的 UI 命令，返回 Future[int]'''
+        receiver = clean_name(receiver)
+        return self.ui_actor.submit(
+            lambda: self._send_image_ui(path, receiver, pacing),
+            kind='send_image', priority=PRIORITY_SEND, chat=receiver, coalesce=True,
+        )
+
+    def _send_image_ui(self, path: str, receiver: str, pacing: str | None) -> int:
+        with self.pacer.session('send_image', pacing, receiver):
             self.stay_focus()
-            receiver = clean_name(receiver)
             try:
                 if not os.path.exists(path):
                     print('发送的图片路径不存在')
@@ -615,43 +944,76 @@ Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地
                 self.switch_to_sb(receiver)
                 paste_image(path, with_enter=True)
                 self.wait_a_little_while()
-                if self.enable_image_parse:
-                    img_msg = self.message_parser.get_msg_from_image(None)
-                    if img_msg:
-                        img_msg.sender = self.wx_name
-                        img_msg.roomid = self.current_chat_name if self.is_room else None
-                        self.add_new_msg(receiver, img_msg)
-                else:
-                    self.add_new_msg(receiver, WxMsg(
-                        type=1,
-                        sender=self.wx_name,
-                        roomid=self.current_chat_name if self.is_room else None,
-                        content="这是一张图片，用户未开启图片解析功能，所以无法解析。",
-                        is_meaningful=False,
-                    ))
-
+                self.commit_sent_msg(receiver, self._sent_image_msg, lambda msg: msg.type == 1)
+                self.msg_store.flush()
+                self.conv_differ.expect_move(receiver)
+                self.poll_governor.notify_activity()
                 return 0
             except Exception as e:
+                self.ui_actor.note_chat(None)
                 print(f"发送图片时报错：{e}")
                 return 1
 
+    def _sent_image_msg(self, echo):
+        '''刚发出的图片对应的消息：读到了回显就直接用它（已经解析过），否则按旧逻辑解析剪贴板里的图片'''
+        if echo is not None:
+            return echo
+        if self.enable_image_parse:
+            img_msg = self.message_parser.get_msg_from_image(None)
+            if img_msg:
+                img_msg.sender = self.wx_name
+                img_msg.roomid = self.current_chat_name if self.is_room else None
+            return img_msg
+        return WxMsg(
+            type=1,
+            sender=self.wx_name,
+            roomid=self.current_chat_name if self.is_room else None,
+            content="这是一张图片，用户未开启图片解析功能，所以无法解析。",
+            is_meaningful=False,
+        )
+
+    def prepare_image(self, path: str) -> int:
+        '''预先把图片转成可粘贴的 DIB 并缓存，之后 send_image 同一张图时不再在 UI 锁内解码/编码；返回 DIB 字节数'''
+        return prepare_image(path)
+
+    def notice_msgs(self, notice) -> list[WxMsg]:
+        '''一条通知对应的新消息（按 seq 范围取，而不是取通知时缓存里的最新消息）'''
+        return [msg for _, msg in self.msg_store.range(notice.chat, notice.first_seq, notice.last_seq)]
+
     def get_msg(self, timeout=1.0):
-        '''获取来信者的最新一条消息'''
-        try:
-            new_msg_name = self.new_msg_queue.get(timeout=timeout)
-        except queue.Empty:
+        '''获取来信者触发这次通知的最新一条消息（范围内最后一条不是自己发的消息）'''
+        notice = self.new_msg_queue.get(timeout=timeout)
+        if notice is None:
+            return None, None
+        msgs = self.notice_msgs(notice)
+        msg = next((m for m in reversed(msgs) if not self.is_msg_from_me(m)), None)
+        return notice.chat, msg if msg is not None else self.msg_store.latest(notice.chat)
+
+    def get_new_msgs(self, timeout=1.0):
+        '''获取来信者自上次通知以来的全部新消息，返回 (chat_name, [WxMsg...])，同一聊天多次到达的消息合并在一起'''
+        notice = self.new_msg_queue.get(timeout=timeout)
+        if notice is None:
             return None, None
-        with self.new_msg_queue_lock:
-            return new_msg_name, self.msg_cache.get(new_msg_name, [None])[-1]
+        return notice.chat, self.notice_msgs(notice)
 
     def get_msg_list(self, timeout=1.0):
         '''获取与来信者的最新 memory_len 条聊天记录，不区分哪些是新消息'''
-        try:
-            new_msg_name = self.new_msg_queue.get(timeout=timeout)
-        except queue.Empty:
+        notice = self.new_msg_queue.get(timeout=timeout)
+        if notice is None:
             return None, None
-        with self.new_msg_queue_lock:
-            return new_msg_name, list(self.msg_cache.get(new_msg_name, []))
+        return notice.chat, self.msg_store.snapshot(notice.chat)
+
+    def get_msgs_batch(self, max_items=16, max_wait=1.0, consumer='default'):
+        '''
+        阻塞直到至少有一个聊天有新消息（最多 max_wait 秒），然后一次取出最多 max_items 个聊天的新消息，
+        返回 [(chat_name, [WxMsg...]), ...]，超时返回 []。
+        每个 consumer 对每个聊天有独立的游标，只返回还没交付给它的消息（见 MsgBatcher）
+        '''
+        return self.msg_batcher.get_batch(max_items=max_items, max_wait=max_wait, consumer=consumer)
+
+    def get_notify_stats(self) -> dict:
+        '''通知队列的深度、高水位、合并/丢弃/溢出到磁盘的次数，以及 block 策略下收消息线程被阻塞的总时长'''
+        return self.new_msg_queue.stats()
 
     def is_msg_from_me(self, msg: WxMsg) -> bool:
         if msg is None:
@@ -721,76 +1083,369 @@ Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地
         msgs.reverse()
         return msgs
 
-    def is_new_msg(self, name, msg):
-        if name not in self.msg_cache:
-            self.msg_cache[name] = []
-            return True
-        if msg not in self.msg_cache[name]:
-            return True
-        return False
-
-    def add_new_msg(self, name, msg):
-        if name not in self.msg_cache:
-            self.msg_cache[name] = []
-        self.msg_cache[name].append(msg)
-
-    def check_memory_len(self, name):
-        if name not in self.msg_cache:
-            self.msg_cache[name] = []
-        while len(self.msg_cache[name]) > self.memory_len:
-            self.msg_cache[name].pop(0)
-
-    def get_latest_msg_in_cache(self, name):
-        if name not in self.msg_cache:
-            self.msg_cache[name] = []
-        if len(self.msg_cache[name]) == 0:
-            return None
-        return self.msg_cache[name][-1]
+    def msg_item_keys(self, items):
+        '''返回带缓存的 key_at(i) -> (runtime_id, signature)，只在用到时才跨进程读取'''
+        cache = {}
+
+        def key_at(i):
+            if i not in cache:
+                it = items[i]
+                try:
+                    rid = tuple(it.element_info.runtime_id or ()) or None
+                except Exception:
+                    rid = None
+                try:
+                    sig = it.window_text() or ""
+                except Exception:
+                    sig = ""
+                cache[i] = (rid, sig)
+            return cache[i]
+        return key_at
+
+    def get_msg_items(self):
+        msg_list = self.msg_list
+        if not msg_list.exists(timeout=self.eps):
+            return None, []
+        msg_list = msg_list.wrapper_object()
+        return msg_list, msg_list.children(control_type="ListItem")
+
+    def scroll_msg_list(self, msg_list, notches: int) -> None:
+        '''在消息列表上滚动鼠标滚轮，notches > 0 向上翻（更早的消息）'''
+        self.mouse_move(self.resolve_click_center(msg_list))
+        for _ in range(abs(notches)):
+            win32api.mouse_event(win32con.MOUSEEVENTF_WHEEL, 0, 0, 120 if notches > 0 else -120, 0)
+            self.wait_a_little_while()
+
+    def refresh_anchor(self, name):
+        '''把 name 的锚点设为当前消息列表的最后一条（需要当前就在该会话中）'''
+        _, items = self.get_msg_items()
+        if not items:
+            return
+        self.msg_anchors[name] = make_anchor(self.msg_item_keys(items), len(items) - 1)
+
+    def commit_sent_msg(self, name, make_sent, is_echo):
+        '''
+        发送完成后调用（仍停留在 name 会话中）：不直接把锚点移到末尾，而是读出锚点之后的全部条目，
+        这样上次读取之后、发送前后对方发来的消息不会被跳过。
+        其中从后往前第一条满足 is_echo 的自己的消息是刚发出的那条，换成 make_sent(echo) 静默写入，其余条目照常写入并通知；
+        找不到回显（例如解析结果与发送内容不一致）时，把读到的自己的消息都当作回显丢掉。
+        没有锚点（首次给 name 发消息）时无法区分，只能直接写入并把锚点设为末尾，与首次读取一样
+        '''
+        if name not in self.msg_anchors:
+            sent = make_sent(None)
+            if sent is not None:
+                self.commit_new_msgs(name, [sent], notify=False)
+            self.refresh_anchor(name)
+            return
+        msgs, anchored = self.read_msgs_after_anchor(name, 1)
+        echo = None
+        if anchored:
+            echo = next((i for i in range(len(msgs) - 1, -1, -1)
+                         if self.is_msg_from_me(msgs[i]) and is_echo(msgs[i])), None)
+        if echo is None:
+            before = [msg for msg in msgs if not self.is_msg_from_me(msg)
+                      and (anchored or not self.msg_store.contains(name, msg))]
+            after = []
+        else:
+            before, after = msgs[:echo], msgs[echo + 1:]
+        sent = make_sent(None if echo is None else msgs[echo])
+        self.commit_new_msgs(name, before, dedup_pending=not anchored)
+        if sent is not None:
+            self.commit_new_msgs(name, [sent], notify=False)
+        self.commit_new_msgs(name, after)
+
+    def read_msgs_after_anchor(self, name, possible_new_msg_cnt):
+        '''
+        读取 name 当前会话中锚点之后的全部消息，返回 (msgs, anchored)
+        - 锚点不在可见范围时向上滚动最多 anchor_max_scroll 次，再逐页滚回底部
+        - 没有锚点（首次读取）或锚点丢失时退回旧逻辑：取最后 min(possible_new_msg_cnt, max_new_msg_cnt) 条，anchored=False
+        '''
+        msg_list, items = self.get_msg_items()
+        if not items:
+            return [], False
+        anchor = self.msg_anchors.get(name)
+        key_at = self.msg_item_keys(items)
+        idx = None if anchor is None else locate_anchor(len(items), key_at, anchor)
+
+        pages = 0
+        while anchor is not None and idx is None and pages < self.anchor_max_scroll:
+            self.scroll_msg_list(msg_list, 3)
+            pages += 1
+            items = msg_list.children(control_type="ListItem")
+            key_at = self.msg_item_keys(items)
+            idx = locate_anchor(len(items), key_at, anchor)
+
+        if idx is None:
+            if anchor is not None:
+                print(f'[{name}] 向上翻了 {pages} 页仍未找到上次读到的位置，可能有消息遗漏')
+                if pages:
+                    self.scroll_msg_list(msg_list, -3 * pages)
+            msgs = self.get_latest_n_msg(n=min(possible_new_msg_cnt, self.max_new_msg_cnt)) or []
+            self.refresh_anchor(name)
+            return msgs, False
+
+        msgs = []
+        while True:
+            for i in range(idx + 1, len(items)):
+                it = items[i]
+                try:
+                    if not it.is_visible():
+                        break  # 滚动时边缘的半条消息，留到下一页再读
+                    res = self.parse_single_msg(it)
+                except Exception as e:
+                    print(e)
+                    res = None
+                if res:
+                    msgs.append(res)
+                anchor = make_anchor(key_at, i)
+            if pages == 0:
+                break
+            self.scroll_msg_list(msg_list, -3)
+            pages -= 1
+            items = msg_list.children(control_type="ListItem")
+            key_at = self.msg_item_keys(items)
+            idx = locate_anchor(len(items), key_at, anchor)
+            if idx is None:
+                print(f'[{name}] 滚回底部时丢失位置，剩余消息可能遗漏')
+                if pages:
+                    self.scroll_msg_list(msg_list, -3 * pages)
+                self.refresh_anchor(name)
+                return msgs, True
+        self.msg_anchors[name] = anchor
+        return msgs, True
+
+    def store_new_msgs(self, name, msgs, notify=True):
+        seqs = []
+        for msg in msgs:
+            if notify:
+                print("新消息！！！")
+                msg.show()
+            seqs.append(self.msg_store.add(name, msg))
+        if notify and seqs and any(not self.is_msg_from_me(msg) for msg in msgs):
+            print(f"{name}传来新消息！！！")
+            self.new_msg_queue.put(name, seqs[0], seqs[-1])
+        if notify and msgs:
+            for fn in list(self.msg_listeners):
+                try:
+                    fn(name, msgs)
+                except Exception as e:
+                    print(f"新消息回调报错：{e}")
+
+    def on_message(self, filter=None, handler=None, *, timeout=..., include_self=False, name=None):
+        '''
+        注册新消息处理函数 handler(chat, msg)，由 Dispatcher 的线程池调用：不同聊天并行，同一聊天严格按顺序。
+        filter: None 全部消息；str 某个聊天；list/set 其中任一聊天；或 fn(chat, msg) -> bool
+        timeout: 单次处理超时（秒），省略时用配置 handler_timeout，None 不限
+        include_self: 是否也处理自己发出的消息
+        也可以作为装饰器使用：@wcf.on_message('文件传输助手')
+        return: 注册得到的 Handler（可传给 remove_handler），装饰器用法时返回原函数
+        '''
+        def register(fn):
+            if self.dispatch not in self.msg_listeners:
+                self.add_msg_listener(self.dispatch)
+            return self.dispatcher.add(filter, fn, timeout=timeout, include_self=include_self, name=name)
+        if handler is None:
+            def decorator(fn):
+                register(fn)
+                return fn
+            return decorator
+        return register(handler)
+
+    def remove_handler(self, handler) -> None:
+        self.dispatcher.remove(handler)
+
+    def dispatch(self, name, msgs) -> None:
+        '''把一批新消息交给 Dispatcher（不阻塞；积压时由收消息循环在下一轮前等待）'''
+        self.dispatcher.dispatch(name, msgs)
+
+    def get_dispatch_stats(self) -> dict:
+        '''在途消息数与高水位、排队时间，以及每个处理函数的调用/出错/超时次数与耗时'''
+        return self.dispatcher.snapshot()
+
+    def add_msg_listener(self, fn) -> None:
+        '''
+        注册新消息回调 fn(name, msgs)：每批新消息（包括自己在其他设备上发的）写入缓存后调用，
+        运行在收消息线程或图片编码线程中，应尽快返回（例如只把消息转交给别的线程或事件循环）
+        '''
+        self.msg_listeners.append(fn)
+
+    def remove_msg_listener(self, fn) -> None:
+        if fn in self.msg_listeners:
+            self.msg_listeners.remove(fn)
+
+    def commit_new_msgs(self, name, msgs, notify=True, dedup_pending=False):
+        '''
+        按顺序把 msgs 写入缓存并通知消费者。
+        其中有图片还在后台编码时，整批推迟到编码完成后再写入（在线程池回调中执行），
+        同一聊天后续的批次也排在它后面，保证顺序不乱。
+        dedup_pending: 读取时还在编码、没能按内容判重的图片，编码完成后写入前再判一次重
+        '''
+        if not msgs:
+            return
+        unchecked = {id(msg) for msg in msgs if not msg.is_ready()}
+        waits = [msg.pending for msg in msgs if not msg.is_ready()]
+        with self.commit_lock:
+            prev = self.commit_tails.get(name)
+            if prev is not None and not prev.done():
+                waits.append(prev)
+            if waits:
+                tail = self.commit_tails[name] = Future()
+        if not waits:
+            self.store_new_msgs(name, msgs, notify)
+            return
+
+        remaining = [len(waits)]
+        remaining_lock = Lock()
+
+        def on_done(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            try:
+                ready = msgs
+                if dedup_pending and unchecked:
+                    ready = [msg for msg in msgs
+                             if id(msg) not in unchecked or not self.msg_store.contains(name, msg)]
+                if ready:
+                    self.store_new_msgs(name, ready, notify)
+            except Exception as e:
+                print(f"写入新消息时报错：{e}")
+            finally:
+                with self.commit_lock:
+                    if self.commit_tails.get(name) is tail:
+                        del self.commit_tails[name]
+                tail.set_result(None)
+
+        for w in waits:
+            w.add_done_callback(on_done)
 
     def get_new_msgs_from_person(self, new_msg_name, possible_new_msg_cnt):
-        self.switch_to_sb(new_msg_name)
-        possible_new_msgs = self.get_latest_n_msg(n=min(possible_new_msg_cnt, self.max_new_msg_cnt))
+        with self.pacer.session('read_chat', receiver=new_msg_name):
+            self.switch_to_sb(new_msg_name)
+            possible_new_msgs, anchored = self.read_msgs_after_anchor(new_msg_name, possible_new_msg_cnt)
         if not possible_new_msgs:
             return
-        is_new_msg = False
-        latest_cached_msg = self.get_latest_msg_in_cache(new_msg_name)
+        new_msgs = []
+        latest_cached_msg = self.msg_store.latest(new_msg_name)
         for possible_new_msg in possible_new_msgs:
             if possible_new_msg == None:
                 continue
-            if latest_cached_msg and latest_cached_msg == possible_new_msg:
-                break
-            if not self.is_new_msg(new_msg_name, possible_new_msg):
-                continue
-            print("新消息！！！")
-            possible_new_msg.show()
-            self.add_new_msg(new_msg_name, possible_new_msg)
-            self.check_memory_len(new_msg_name)
+            # 有锚点时读到的都是之前没见过的条目，连续两条相同内容也是两条消息
+            # 还在后台编码的图片现在无法按内容判重，先收下，编码完成后写入前再判重（见 commit_new_msgs）
+            if not anchored and possible_new_msg.is_ready():
+                if latest_cached_msg and latest_cached_msg == possible_new_msg:
+                    break
+                if self.msg_store.contains(new_msg_name, possible_new_msg):
+                    continue
+            new_msgs.append(possible_new_msg)
             latest_cached_msg = possible_new_msg
-            is_new_msg = True
-        latest_msg = self.get_latest_msg_in_cache(new_msg_name)
-        if is_new_msg and latest_msg and not self.is_msg_from_me(latest_msg):
-            with self.new_msg_queue_lock:
-                print(f"{new_msg_name}传来新消息！！！")
-                self.new_msg_queue.put(new_msg_name)
+        self.commit_new_msgs(new_msg_name, new_msgs, dedup_pending=not anchored)
 
 
+    def get_total_unread_cnt(self) -> int | None:
+        '''
+        读取左侧“聊天”按钮上的未读总数角标，只需要一次跨进程 UIA 调用
+        return: 未读总数；读取失败、无法解析时返回 None（调用方应退回完整扫描）。
+        值为空时只有在完整扫描确认过“角标为空 = 没有未读”之后才当作 0，否则同样返回 None，
+        避免某个版本的微信不在这里暴露角标时把扫描永远跳过
+        '''
+        self.badge_empty = False
+        try:
+            value = self.chat.legacy_properties().get('Value')
+        except Exception:
+            return None
+        value = str(value or '').strip()
+        if not value:
+            self.badge_empty = True
+            return 0 if self.empty_badge_is_zero else None
+        m = re.search(r"\d+", value)
+        if not m:
+            return None
+        return int(m.group(0))
+
+    def conv_list_top_changed(self) -> bool:
+        '''
+        只读会话列表最前面 listen_top_check 条标题，与上一轮快照比较。
+        新消息所在的会话角标已被清掉（例如正打开着、或在手机上读过）时未读总数不变，但它会被顶到前面
+        '''
+        if self.listen_top_check <= 0:
+            return False
+        items = self.conv_list.children(control_type="ListItem")[:self.listen_top_check]
+        return self.conv_differ.top_changed([it.window_text() for it in items])
+
+    def fetch_chat(self, name, possible_new_msg_cnt):
+        '''sweep 中读取单个会话；失败时记入 retry，下一轮重试，不影响本轮其他会话'''
+        try:
+            self.get_new_msgs_from_person(name, possible_new_msg_cnt)
+        except Exception as e:
+            traceback.print_exc()
+            print(f'[{name}] 读取新消息失败：{e}，稍后重试')
+            self.conv_differ.retry(name, possible_new_msg_cnt)
+            self.ui_actor.note_chat(None)
+        else:
+            self.conv_differ.fetched(name)
+
     def get_new_msg(self):
+        return self.submit_get_new_msg().result()
+
+    def submit_get_new_msg(self) -> Future:
+        '''提交一轮收消息的 UI 命令（最高优先级，不会被连续发送饿死），返回 Future[int]'''
+        return self.ui_actor.submit(self._get_new_msg_ui, kind='get_new_msg', priority=PRIORITY_RECV)
+
+    def _get_new_msg_ui(self):
         '''
-        获取一个未读消息的人，直接放到队列里，不返回新消息，只返回错误码
-        TODO: 处理这个消息需要时间，所以目前想法只能一个一个处理，不然可能会读取过时的消息列表？
+        扫描一次会话列表快照，与上一轮快照对比（见 ConvListDiffer），
+        处理其中所有有变化的未读会话（顺序与单次最长占锁时间见 SweepPlanner），
+        新消息直接放到队列里，不返回新消息，只返回错误码
+        未读总数角标为 0 或与上一轮相同（且上一轮没有遗留会话）时，跳过会话列表扫描，一轮只有一次 UIA 调用；
+        角标相同只是一个提示（一个会话在别的设备上被读掉、另一个会话恰好来了同样多的新消息时总数也不变），
+        所以角标不变时每 listen_top_check_ticks 轮看一眼列表最前面的标题，连续跳过 listen_full_scan_ticks 轮后强制完整扫描一次；
+        角标读不到、为空（未经确认）或无法解析时都做完整扫描
+        return: 1 有未读会话被处理; 0 无未读; -1 出错
         '''
-        with self.wx_lock:
+        with self.pacer.session('get_new_msg'):
             try:
+                total = self.get_total_unread_cnt()
+                if total is not None and not self.conv_differ.has_retry:
+                    unchanged = total == self.last_unread_total
+                    self.last_unread_total = total
+                    force = self.listen_full_scan_ticks > 0 and self.skipped_scans >= self.listen_full_scan_ticks
+                    if (total == 0 or unchanged) and not force:
+                        # 空闲轮只读一次角标；角标没变时每 listen_top_check_ticks 轮再看一眼列表最前面的标题
+                        top_due = (unchanged and self.listen_top_check_ticks > 0
+                                   and (self.skipped_scans + 1) % self.listen_top_check_ticks == 0)
+                        if not (top_due and self.conv_list_top_changed()):
+                            self.skipped_scans += 1
+                            return 0
+                self.skipped_scans = 0
+                badge_empty = self.badge_empty
                 # 当前聊天似乎没必要特殊处理，因为当前发来也会有未读消息显示，只要不移动鼠标的话
                 self.stay_focus()
                 self.jump_to_top_of_chatlist()
                 names = self.conv_list.children(control_type="ListItem")[:self.listen_cnt]
-                for name in names:
-                    parsed_name, _, new_msg_cnt = analysis_name(name.window_text())
-                    if new_msg_cnt > 0:
-                        self.get_new_msgs_from_person(parsed_name, new_msg_cnt)
-                        return 1
+                titles = [name.window_text() for name in names]
+                if badge_empty:
+                    # 用这次完整扫描校验空角标的含义
+                    listed = sum(analysis_name(title)[2] for title in titles)
+                    if listed and self.empty_badge_is_zero:
+                        print(f'未读总数角标为空，但会话列表中有 {listed} 条未读，之后不再信任空角标')
+                    self.empty_badge_is_zero = listed == 0
+                changes = self.conv_differ.diff(titles)
+                unread = self.conv_differ.pending_fetch(changes)
+                served = self.sweep_planner.sweep(unread, self.fetch_chat)
+                cnts = dict(unread)
+                for name in self.sweep_planner.last_pending:
+                    self.conv_differ.retry(name, cnts[name], failed=False)
+                self.msg_store.flush()
+                # 处理完后角标会变化，记录处理后的总数，避免下一轮重复扫描
+                self.last_unread_total = self.get_total_unread_cnt()
+                if served > 0:
+                    return 1
             except Exception as e:
+                self.last_unread_total = None
+                self.conv_differ.reset()
+                self.ui_actor.note_chat(None)
                 traceback.print_exc()
                 print(f"获取新消息出现错误：{e}")
                 return -1
@@ -798,11 +1453,49 @@ Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地
 
     def listening_to_new_msg(self):
         while not self.recv_stop_event.is_set():
+            # 处理函数积压到 dispatch_max_inflight 时先不轮询，把压力传回收消息
+            if not self.dispatcher.wait_capacity(timeout=0.5):
+                continue
+            # notify_overflow=block 时通知队列满了也先不轮询；store_new_msgs 在 UI 线程里登记通知，从不等待
+            if not self.new_msg_queue.wait_capacity(timeout=0.5):
+                continue
             res = self.get_new_msg()
             # if res == 0:
             #     if self.current_chat_name != self.default_chat_name:
             #         self.switch_to_sb(self.default_chat_name)
-            self.recv_stop_event.wait(self.listen_msg_interval)
+            self.recv_stop_event.wait(self.poll_governor.on_tick(res))
+
+    def get_image_data_url(self, msg: WxMsg) -> str:
+        '''图片消息的 data URL（按需从 blob 存储生成）；内联 data URL 或非图片消息原样返回 content'''
+        if self.blob_store is None or msg.type != 1:
+            return msg.content
+        return self.blob_store.data_url(msg.content)
+
+    def get_image_stats(self) -> dict:
+        '''图片解析耗时：grab 为 UI 锁内读取剪贴板的时间，encode 为解码/编码/落盘时间（image_workers=0 时也在锁内）'''
+        return {
+            'grab': self.message_parser.image_grab_stat.snapshot(),
+            'encode': self.message_parser.image_encode_stat.snapshot(),
+        }
+
+    def get_send_stats(self) -> dict:
+        '''每次发送文本占用 UI 线程的时间（只包含切换会话与键入，不含润色）'''
+        return self.send_lock_stat.snapshot()
+
+    def get_ui_stats(self) -> dict:
+        '''UI 线程的队列深度与高水位、合并执行的命令数，以及每类命令的排队与执行耗时'''
+        return self.ui_actor.snapshot()
+
+    def get_pacing_stats(self) -> dict:
+        '''
+        各操作（send_text / send_image / get_friends / get_new_msg / read_chat，按节奏配置区分）的
+        刻意等待总时长与总耗时统计，以及最近若干次操作的明细（delay 刻意等待、saved 因预算少等、wall 总耗时）
+        '''
+        return self.pacer.snapshot()
+
+    def get_poll_interval(self) -> float:
+        '''当前接收线程的轮询间隔（秒）'''
+        return self.poll_governor.current_interval
 
     def enable_receive_msg(self):
         if self.recv_thread is not None and self.recv_thread.is_alive():
@@ -821,10 +1514,60 @@ Emoji 表情：可以根据文本内容和语气，在句末或句中恰当地
             return False
         self.recv_stop_event.set()
         self.recv_thread.join(timeout=timeout)
+        self.msg_store.flush()
         return True
 
+    def shutdown(self, timeout=5.0):
+        '''停止收消息线程与 UI 线程（尚未执行的 UI 命令会被取消），并写入缓存中的消息'''
+        self.new_msg_queue.close() # 先唤醒可能阻塞在通知队列上的收消息线程
+        self.disable_receive_msg(timeout=timeout)
+        self.ui_actor.stop(timeout=timeout)
+        self.dispatcher.shutdown()
+        self.send_prepare_executor.shutdown(wait=False, cancel_futures=True)
+        self.msg_store.flush()
+        if self.msg_log is not None:
+            self.msg_log.close()
+
 
 if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ['bench_decorate']:
+        # 基准：python Wcf.py bench_decorate，不连接微信。在本地假模型服务（首包 0.4s、每个输出字符 5ms）上对比
+        # send_texts 的批量润色（decorate_many，一次请求）与逐条润色（每条一次 decorate_text）的请求数、token 用量与耗时
+        import contextlib
+        import io
+        try:
+            from .bench.StubLLM import StubLLMServer
+        except ImportError:
+            from bench.StubLLM import StubLLMServer
+
+        def stub_decorate(messages):
+            content = messages[-1]['content']
+            if content.startswith('下面是一个包含'):
+                return json.dumps([t + '～' for t in json.loads(content.rsplit('\n\n', 1)[1])], ensure_ascii=False)
+            return content + '～'
+
+        texts = ['今晚的会议改到八点', '记得带上周的报表', '明天早上九点出发', '快递已经放在门口了',
+                 '周末一起去爬山吗', '文件我发你邮箱了', '下午三点电话会议', '收到请回复一下']
+        with StubLLMServer(stub_decorate, ttft=0.4, per_char=0.005) as server:
+            bench = Wcf.__new__(Wcf)  # 只用到润色相关的属性
+            bench.api = API({'provider': {'api_key': 'stub', 'url': server.url, 'model': 'stub'}})
+            bench.decorate_pool = None
+            for n in (2, 4, 8):
+                batch = texts[:n]
+                for label, run in (('逐条', lambda: [bench.decorate_text(t) for t in batch]),
+                                   ('批量', lambda: bench.decorate_many(batch))):
+                    server.reset_stats()
+                    t0 = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        out = run()
+                    cost = time.perf_counter() - t0
+                    print(f'{n} 条 {label}：{server.requests} 次请求，prompt {server.prompt_tokens:5d} + '
+                          f'completion {server.completion_tokens:4d} token（按字数估算），'
+                          f'耗时 {cost:.2f}s，成功 {sum(1 for d in out if d)}/{n}')
+        sys.exit(0)
+
     wcf = Wcf()
 
     friends = wcf.get_friends()
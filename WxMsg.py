@@ -6,6 +6,8 @@ except ImportError:
     from utils import zip_text
 
 class WxMsg:
+    __slots__ = ("type", "sender", "roomid", "content", "is_meaningful", "_hash_id", "_content_digest", "_pending")
+
     def __init__(
             self,
             type = 5,
@@ -19,7 +21,27 @@ class WxMsg:
         self.roomid = roomid
         self.content = content
         self.is_meaningful = is_meaningful
-        self.hash_id = self._build_hash_id()
+        object.__setattr__(self, "_pending", None)
+
+    def __setattr__(self, key, value):
+        # 任何字段变化都会让 hash_id 失效；content 变化还要重算正文摘要
+        object.__setattr__(self, key, value)
+        if key == "content":
+            object.__setattr__(self, "_content_digest", None)
+            object.__setattr__(self, "_hash_id", None)
+        elif key[0] != "_":
+            object.__setattr__(self, "_hash_id", None)
+
+    def set_pending(self, future) -> None:
+        """content 由后台任务补全（例如图片编码），future 完成前消息还不完整"""
+        object.__setattr__(self, "_pending", future)
+
+    def is_ready(self) -> bool:
+        return self._pending is None or self._pending.done()
+
+    @property
+    def pending(self):
+        return self._pending
 
     def _signature(self):
         return (
@@ -30,9 +52,23 @@ class WxMsg:
             self.is_meaningful,
         )
 
-    def _build_hash_id(self) -> str:
-        raw = "|".join(str(part) for part in self._signature())
-        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    @property
+    def content_digest(self) -> str:
+        """正文摘要：图片的 data URL 可能有几 MB，只在第一次需要时计算一次；大块数据上 sha1 有硬件加速，比 blake2b 快"""
+        if self._content_digest is None:
+            raw = str(self.content).encode("utf-8")
+            object.__setattr__(self, "_content_digest", hashlib.sha1(raw).hexdigest())
+        return self._content_digest
+
+    @property
+    def hash_id(self) -> str:
+        """type|sender|roomid|正文摘要|is_meaningful 的摘要，惰性计算并缓存，字段变化后自动失效"""
+        if self._hash_id is None:
+            raw = "|".join(str(part) for part in (
+                self.type, self.sender, self.roomid, self.content_digest, self.is_meaningful
+            ))
+            object.__setattr__(self, "_hash_id", hashlib.blake2b(raw.encode("utf-8"), digest_size=20).hexdigest())
+        return self._hash_id
 
     def __eq__(self, other):
         if isinstance(other, WxMsg):
@@ -50,4 +86,56 @@ class WxMsg:
         raise NotImplementedError()
 
     def show(self):
-        print(f'type: {self.type} | sender: {self.sender} | roomid: {self.roomid} | content: {zip_text(self.content)} | hash_id: {self.hash_id}')
\ No newline at end of file
+        print(f'type: {self.type} | sender: {self.sender} | roomid: {self.roomid} | content: {zip_text(self.content)} | hash_id: {self.hash_id}')
+
+
+if __name__ == "__main__":
+    # 基准：单条文本消息的内存占用与构造耗时，以及大图片消息的构造耗时；
+    # _BaselineWxMsg 是改用 __slots__ / 惰性 hash_id 之前的实现（普通 __dict__，构造时即用 sha1 计算 hash_id），作为对照
+    import time
+    import tracemalloc
+
+    class _BaselineWxMsg:
+        def __init__(self, type=5, sender="", roomid="", content="", is_meaningful=True) -> None:
+            self.type = type
+            self.sender = sender
+            self.roomid = roomid
+            self.content = content
+            self.is_meaningful = is_meaningful
+            self.hash_id = self._build_hash_id()
+
+        def _signature(self):
+            return self.type, self.sender, self.roomid, self.content, self.is_meaningful
+
+        def _build_hash_id(self) -> str:
+            raw = "|".join(str(part) for part in self._signature())
+            return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    n = 100000
+    texts = [f'第 {i} 条测试消息，今天晚上一起吃饭吗' for i in range(n)]
+    big = 'data:image/png;base64,' + 'A' * (4 * 1024 * 1024)
+    for label, cls in (('baseline', _BaselineWxMsg), ('WxMsg', WxMsg)):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        msgs = [cls(type=0, sender='bench', roomid=None, content=text) for text in texts]
+        cost = time.perf_counter() - t0
+        mem, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del msgs
+        print(f'{label:<9} 文本消息：构造 {cost / n * 1e6:.2f} us/条，内存 {mem / n:.0f} B/条（不含正文字符串）')
+
+        t0 = time.perf_counter()
+        for _ in range(20):
+            msg = cls(type=1, content=big)
+            msg.sender = 'bench'
+            msg.roomid = None
+        cost = time.perf_counter() - t0
+        print(f'{label:<9} 4MB 图片消息：构造并修改 sender/roomid {cost / 20 * 1e3:.3f} ms/条')
+        # 两者都算一次 hash_id 后的总耗时；基准实现构造时已算过（且不会随 sender/roomid 更新）
+        t0 = time.perf_counter()
+        for _ in range(20):
+            msg = cls(type=1, content=big)
+            msg.sender = 'bench'
+            msg.hash_id
+        cost = time.perf_counter() - t0
+        print(f'{label:<9} 4MB 图片消息：构造、修改 sender 并取 hash_id {cost / 20 * 1e3:.3f} ms/条')
@@ -2,14 +2,71 @@ import base64
 import io
 import os
 import re
+import time
+from concurrent.futures import Executor, Future
 from dataclasses import dataclass
 from typing import Optional, List
 from PIL import Image, ImageGrab
 
 try:
     from .WxMsg import WxMsg
+    from .BlobStore import BlobStore, sniff_mime
+    from .Metrics import LatencyStat
 except ImportError:
     from WxMsg import WxMsg
+    from BlobStore import BlobStore, sniff_mime
+    from Metrics import LatencyStat
+
+
+@dataclass
+class ImagePipeline:
+    """
+    收到图片后的缩放与重新压缩：
+      max_side: 长边像素上限，0 表示不缩放
+      format: original（保持原格式与原字节）/ jpeg / webp / png
+      quality: jpeg / webp 的压缩质量（1-100）
+      keep_original: 转换后是否把原图也存入 BlobStore（需要 blob_store）
+    动图（GIF 等多帧图片）不经过转换，原样保留，否则只剩第一帧
+    """
+    max_side: int = 0
+    format: str = "original"
+    quality: int = 85
+    keep_original: bool = False
+
+    FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp"), "png": ("PNG", "image/png")}
+
+    @property
+    def passthrough(self) -> bool:
+        return self.max_side <= 0 and self.format == "original"
+
+    @staticmethod
+    def is_animated(im: "Image.Image") -> bool:
+        return bool(getattr(im, "is_animated", False)) or getattr(im, "n_frames", 1) > 1
+
+    def needs_transform(self, im: "Image.Image") -> bool:
+        """im 只需读过文件头（Image.open 之后、load 之前即可判断）"""
+        if self.passthrough or self.is_animated(im):
+            return False
+        if self.format != "original":
+            return True
+        return self.max_side > 0 and max(im.size) > self.max_side
+
+    def apply(self, im: "Image.Image", src_mime: str) -> tuple[bytes, str]:
+        if self.max_side > 0 and max(im.size) > self.max_side:
+            im = im.copy()
+            im.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+        fmt = self.format
+        if fmt == "original":
+            fmt = {"image/jpeg": "jpeg", "image/webp": "webp"}.get(src_mime, "png")
+        pil_format, mime = self.FORMATS[fmt]
+        if pil_format == "JPEG" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        buf = io.BytesIO()
+        if pil_format == "PNG":
+            im.save(buf, format=pil_format, optimize=False)
+        else:
+            im.save(buf, format=pil_format, quality=int(self.quality))
+        return buf.getvalue(), mime
 
 
 class WxMsgParser:
@@ -23,7 +80,21 @@ class WxMsgParser:
       -2 = 假消息
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            blob_store: Optional[BlobStore] = None,
+            executor: Optional[Executor] = None,
+            image_pipeline: Optional[ImagePipeline] = None,
+    ):
+        # 有 blob_store 时图片存到磁盘，WxMsg.content 只保存 blob 引用；否则内联为 data URL
+        self.blob_store = blob_store
+        self.image_pipeline = image_pipeline or ImagePipeline()
+        if self.image_pipeline.format not in ("original", *ImagePipeline.FORMATS):
+            raise ValueError(f'unsupported image format: {self.image_pipeline.format!r}')
+        # 有 executor 时图片的解码/编码/落盘在线程池中完成，UI 锁内只做剪贴板读取
+        self.executor = executor
+        self.image_grab_stat = LatencyStat("image_grab")      # 锁内：读取剪贴板
+        self.image_encode_stat = LatencyStat("image_encode")  # 解码、编码、落盘
         self.BRACKET = re.compile(r"^\[[^\]]+\]$")
         self.TIME_ONLY = re.compile(r"^\d{1,2}:\d{2}$")
         self.DATE_ONLY = re.compile(
@@ -91,14 +162,41 @@ class WxMsgParser:
         )
 
     def get_msg_from_image(self, item) -> Optional[WxMsg]:
-        data_url = self._image_from_clipboard_to_data_url()
-        if not data_url:
+        """
+        调用方需要在 UI 锁内调用（依赖剪贴板）；配置了 executor 时返回的 WxMsg 尚未完成，
+        content 会在后台补全，可通过 msg.pending / msg.is_ready() 判断
+        """
+        with self.image_grab_stat.timer():
+            raw = self._grab_clipboard_image()
+        if raw is None:
             print("[消息解析失败] get_msg_from_image：图片不在剪切板")
             return None
-        return WxMsg(
-            type=1,
-            content=data_url
-        )
+        if self.executor is None:
+            content = self._image_to_content(raw)
+            if not content:
+                print("[消息解析失败] get_msg_from_image：图片编码失败")
+                return None
+            return WxMsg(type=1, content=content)
+
+        msg = WxMsg(type=1, content="图片解析中")
+        done = Future()
+
+        def finish(f):
+            try:
+                content = f.result()
+            except Exception:
+                content = None
+            if content:
+                msg.content = content
+            else:
+                print("[消息解析失败] get_msg_from_image：图片编码失败")
+                msg.content = "这是一张图片，解析失败。"
+                msg.is_meaningful = False
+            done.set_result(msg)
+
+        msg.set_pending(done)
+        self.executor.submit(self._image_to_content, raw).add_done_callback(finish)
+        return msg
 
     def get_msg_from_video(self, item) -> Optional[WxMsg]:
         # TODO: 暂时忽略视频
@@ -173,7 +271,8 @@ class WxMsgParser:
 
         return "\n".join(filtered).strip()
 
-    def _image_from_clipboard_to_data_url(self) -> Optional[str]:
+    def _grab_clipboard_image(self):
+        """UI 部分：取出剪贴板对象，返回文件路径（str）或 PIL Image，失败返回 None"""
         if ImageGrab is None:
             return None
         try:
@@ -187,13 +286,94 @@ class WxMsgParser:
                 path = clip[0]
                 if not isinstance(path, str) or not os.path.isfile(path):
                     return None
-                im = Image.open(path)
+                return path
+            return clip
+        except Exception:
+            return None
+
+    def _encode_image(self, raw) -> Optional[tuple[bytes, str, Optional[tuple[bytes, str]]]]:
+        """
+        CPU 部分：返回 (图片字节, mime, 原图)
+        - 不需要转换时（见 ImagePipeline.needs_transform），文件路径原样读取、不重新编码，原图为 None
+        - 经过 image_pipeline 转换时，原图为转换前的 (字节, mime)
+        """
+        try:
+            pipeline = self.image_pipeline
+            if isinstance(raw, str):
+                with open(raw, "rb") as f:
+                    data = f.read()
+                mime = sniff_mime(data, default="")
+                if mime and pipeline.passthrough:
+                    return data, mime, None
+                im = Image.open(io.BytesIO(data))
+                # 不用转换（原格式且不超过 max_side，或是动图）时原字节直接返回，不解码
+                if mime and not pipeline.needs_transform(im):
+                    return data, mime, None
                 im.load()
+                original = (data, mime or "application/octet-stream")
             else:
-                im = clip
-            buf = io.BytesIO()
-            im.save(buf, format="PNG")
-            b64 = base64.b64encode(buf.getvalue()).decode("ascii")
-            return f"data:image/png;base64,{b64}"
+                im = raw
+                im.load()
+                original = None
+            if not pipeline.needs_transform(im):
+                buf = io.BytesIO()
+                im.save(buf, format="PNG")
+                return buf.getvalue(), "image/png", None
+            out, out_mime = pipeline.apply(im, original[1] if original else "image/png")
+            if original is None and pipeline.keep_original:
+                buf = io.BytesIO()
+                im.save(buf, format="PNG")
+                original = (buf.getvalue(), "image/png")
+            return out, out_mime, original
         except Exception:
             return None
+
+    def _image_to_content(self, raw) -> Optional[str]:
+        t0 = time.perf_counter()
+        try:
+            got = self._encode_image(raw)
+            if got is None:
+                return None
+            data, mime, original = got
+            try:
+                if self.blob_store is not None:
+                    uri = self.blob_store.put_bytes(data, mime)
+                    if original is not None and self.image_pipeline.keep_original:
+                        self.blob_store.link_original(uri, self.blob_store.put_bytes(*original))
+                    return uri
+            except Exception as e:
+                print(f"[图片保存失败]：{e}，改为内联 data URL")
+            b64 = base64.b64encode(data).decode("ascii")
+            return f"data:{mime};base64,{b64}"
+        finally:
+            self.image_encode_stat.record(time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    # 基准：不同缩放/压缩设置下单张图片的字节数与编码耗时
+    # 用法：python WxMsgParser.py [图片路径]，不给路径时生成一张 3000x2000 的测试图
+    import sys
+
+    if len(sys.argv) > 1:
+        src = Image.open(sys.argv[1])
+        src.load()
+    else:
+        src = Image.effect_mandelbrot((3000, 2000), (-2.0, -1.0, 1.0, 1.0), 100).convert("RGB")
+    settings = [
+        ImagePipeline(),
+        ImagePipeline(max_side=2048, format="png"),
+        ImagePipeline(max_side=1024, format="png"),
+        ImagePipeline(max_side=1024, format="jpeg", quality=85),
+        ImagePipeline(max_side=1024, format="jpeg", quality=70),
+        ImagePipeline(max_side=1024, format="webp", quality=80),
+    ]
+    print(f'源图 {src.size[0]}x{src.size[1]} {src.mode}')
+    for pipeline in settings:
+        parser = WxMsgParser(image_pipeline=pipeline)
+        rounds = 3
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            data, mime, _ = parser._encode_image(src.copy())
+        cost = (time.perf_counter() - t0) / rounds
+        print(f'max_side={pipeline.max_side:<5} format={pipeline.format:<8} quality={pipeline.quality:<3} '
+              f'-> {mime:<10} {len(data) / 1024:9.1f} KB  {cost * 1000:8.1f} ms')
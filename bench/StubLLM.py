@@ -0,0 +1,151 @@
+import json
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Optional
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # 客户端超时后主动断开连接属于预期情况
+
+
+class StubLLMServer:
+    """
+    本地的 OpenAI 兼容假服务（POST /v1/chat/completions），只供各模块 __main__ 中的基准与演示使用，不需要真实的模型：
+      - reply(messages) -> str 决定回复内容，默认原样回显最后一条消息
+      - ttft 首包延迟（秒），per_char 每个输出字符的生成耗时，模拟模型的生成速度
+      - failures 前几次请求依次返回的 HTTP 状态码（例如 [503, 429]），用完之后正常回复
+      - stall 请求处理前先睡眠的秒数，用来触发客户端超时
+      - disconnect_after 流式输出这么多块之后不发结束块、直接断开连接，模拟中途断流；None 表示正常结束
+      - 按字符数粗略估算 token，累计 requests / prompt_tokens / completion_tokens，并在响应的 usage 中返回
+      - finished 记录每次回复完整发送完毕的时刻（perf_counter），中途断开的不计
+    支持 stream=True 的 SSE 流式输出。只放在 bench/ 下供各模块 __main__ 使用，不随包发布。用法：
+        with StubLLMServer(ttft=0.3) as server:
+            api = API({'provider': {'api_key': 'stub', 'url': server.url, 'model': 'stub'}})
+    """
+
+    def __init__(
+            self,
+            reply: Optional[Callable[[list], str]] = None,
+            ttft: float = 0.0,
+            per_char: float = 0.0,
+            failures: Optional[list[int]] = None,
+            stall: float = 0.0,
+            disconnect_after: Optional[int] = None,
+    ) -> None:
+        self.reply = reply or (lambda messages: str(messages[-1]['content']))
+        self.ttft = ttft
+        self.per_char = per_char
+        self.failures = list(failures or [])
+        self.stall = stall
+        self.disconnect_after = disconnect_after
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.arrivals: list[float] = []  # 每次请求到达的时刻（perf_counter），用来观察重试间隔
+        self.finished: list[float] = []
+        self._lock = Lock()
+        self._server = _QuietServer(('127.0.0.1', 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}/v1'
+
+    def start(self) -> "StubLLMServer":
+        Thread(target=self._server.serve_forever, name="StubLLM", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = self.prompt_tokens = self.completion_tokens = 0
+            self.arrivals = []
+            self.finished = []
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, obj) -> None:
+                data = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, text: str) -> None:
+                data = text.encode('utf-8')
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                with stub._lock:
+                    stub.arrivals.append(time.perf_counter())
+                    status = stub.failures.pop(0) if stub.failures else 200
+                if stub.stall:
+                    time.sleep(stub.stall)
+                if status != 200:
+                    self._send_json(status, {'error': {'message': f'stub error {status}', 'type': 'stub'}})
+                    return
+                messages = body.get('messages', [])
+                text = stub.reply(messages)
+                prompt = sum(len(str(m.get('content', ''))) for m in messages)
+                with stub._lock:
+                    stub.requests += 1
+                    stub.prompt_tokens += prompt
+                    stub.completion_tokens += len(text)
+                usage = {'prompt_tokens': prompt, 'completion_tokens': len(text), 'total_tokens': prompt + len(text)}
+                time.sleep(stub.ttft)
+                if not body.get('stream'):
+                    time.sleep(stub.per_char * len(text))
+                    self._send_json(200, {
+                        'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': body.get('model', ''),
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': text}}],
+                        'usage': usage,
+                    })
+                    with stub._lock:
+                        stub.finished.append(time.perf_counter())
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                step = 4
+                for n, i in enumerate(range(0, len(text), step)):
+                    if stub.disconnect_after is not None and n >= stub.disconnect_after:
+                        self.close_connection = True
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                        return
+                    piece = text[i:i + step]
+                    event = {'id': 'stub', 'object': 'chat.completion.chunk', 'created': 0, 'model': body.get('model', ''),
+                             'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+                    self._chunk(f'data: {json.dumps(event, ensure_ascii=False)}\n\n')
+                    time.sleep(stub.per_char * len(piece))
+                with stub._lock:
+                    stub.finished.append(time.perf_counter())
+                self._chunk('data: [DONE]\n\n')
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,113 @@
+import threading
+import time
+
+from Dispatcher import Dispatcher, make_filter
+
+
+def wait_idle(d, timeout=5.0):
+    with d._cv:
+        assert d._cv.wait_for(lambda: d.inflight == 0, timeout)
+
+
+def test_make_filter():
+    assert make_filter(None)("x", 1)
+    assert make_filter("x")("x", 1) and not make_filter("x")("y", 1)
+    assert make_filter(["x", "y"])("y", 1)
+    assert make_filter(lambda chat, msg: msg > 1)("x", 2)
+
+
+def test_per_chat_order_and_self_filter():
+    d = Dispatcher(workers=3, default_timeout=None, is_self=lambda msg: msg < 0)
+    seen = {}
+    lock = threading.Lock()
+
+    def record(chat, msg):
+        time.sleep(0.001)
+        with lock:
+            seen.setdefault(chat, []).append(msg)
+
+    d.add(None, record)
+    for i in range(20):
+        for chat in ("a", "b", "c"):
+            d.dispatch(chat, [i, -1])
+    wait_idle(d)
+    assert all(v == list(range(20)) for v in seen.values())
+    d.shutdown()
+
+
+def test_timeout_pauses_chat_until_stuck_call_returns():
+    d = Dispatcher(workers=2, default_timeout=0.05, spare_workers=2)
+    order = []
+    release = threading.Event()
+
+    def handler(chat, msg):
+        if msg == 1:
+            release.wait(2.0)
+        order.append((chat, msg))
+
+    d.add(None, handler)
+    d.dispatch("a", [1, 2])
+    time.sleep(0.2)
+    # 1 已超时但仍在执行：a 的下一条不能抢先开始，别的聊天照常处理
+    d.dispatch("b", [9])
+    time.sleep(0.1)
+    assert order == [("b", 9)]
+    assert d.snapshot()["stuck"] == 1
+    release.set()
+    wait_idle(d)
+    assert order == [("b", 9), ("a", 1), ("a", 2)]
+    snap = d.snapshot()
+    assert snap["stuck"] == 0
+    assert snap["handlers"]["handler"]["timeouts"] == 1
+    d.shutdown()
+
+
+def test_stuck_handler_is_refused_once_spare_workers_are_used():
+    d = Dispatcher(workers=2, default_timeout=0.05, spare_workers=1)
+    release = threading.Event()
+    calls = []
+
+    def hang(chat, msg):
+        calls.append((chat, msg))
+        release.wait(2.0)
+
+    d.add(None, hang)
+    d.dispatch("a", [1])
+    time.sleep(0.2)
+    assert d.snapshot()["stuck"] == 1
+    d.dispatch("b", [1])
+    with d._cv:
+        assert d._cv.wait_for(lambda: "b" not in d._chats, 2.0)
+    assert calls == [("a", 1)]
+    assert d.snapshot()["handlers"]["hang"]["refused"] == 1
+    release.set()
+    wait_idle(d)
+    d.shutdown()
+
+
+def test_errors_are_counted_and_do_not_stop_the_chat():
+    d = Dispatcher(workers=1, default_timeout=None)
+    done = []
+
+    def flaky(chat, msg):
+        if msg == 0:
+            raise ValueError("boom")
+        done.append(msg)
+
+    d.add(None, flaky)
+    d.dispatch("a", [0, 1])
+    wait_idle(d)
+    assert done == [1]
+    assert d.snapshot()["handlers"]["flaky"]["errors"] == 1
+    d.shutdown()
+
+
+def test_wait_capacity():
+    d = Dispatcher(workers=1, max_inflight=1, default_timeout=None)
+    release = threading.Event()
+    d.add(None, lambda chat, msg: release.wait(2.0))
+    d.dispatch("a", [1])
+    assert not d.wait_capacity(timeout=0.05)
+    release.set()
+    assert d.wait_capacity(timeout=2.0)
+    d.shutdown()
@@ -0,0 +1,26 @@
+import random
+
+from utils import plan_keystrokes
+
+
+def test_special_characters_are_escaped():
+    seqs = [seq for _, seq in plan_keystrokes("a+{b}\n\r(", 0.0, 0.0)]
+    assert seqs == ["a", "{+}", "{{}", "b", "{}}", "^{ENTER}", "{(}"]
+
+
+def test_enter_appended_after_last_interval():
+    plan = plan_keystrokes("ab", 0.1, 0.1, with_enter=True)
+    assert [seq for _, seq in plan] == ["a", "b", "{ENTER}"]
+    assert [round(t, 6) for t, _ in plan] == [0.0, 0.1, 0.2]
+
+
+def test_intervals_within_bounds_and_monotonic():
+    random.seed(0)
+    plan = plan_keystrokes("今晚七点见，不见不散" * 5, 0.02, 0.12)
+    gaps = [b - a for (a, _), (b, _) in zip(plan, plan[1:])]
+    assert all(0.02 <= g <= 0.12 for g in gaps)
+
+
+def test_empty_text():
+    assert plan_keystrokes("", 0.01, 0.02) == []
+    assert plan_keystrokes("", 0.01, 0.02, with_enter=True) == [(0.0, "{ENTER}")]
@@ -0,0 +1,62 @@
+from MsgBatcher import MsgBatcher
+from MsgLog import MsgLog
+from MsgStore import MsgStore
+from NotifyQueue import NotifyQueue
+from WxMsg import WxMsg
+
+
+def add(store, queue, chat, *contents, notify=True):
+    seqs = [store.add(chat, WxMsg(type=0, sender="a", content=c)) for c in contents]
+    if notify:
+        queue.put(chat, seqs[0], seqs[-1])
+    return seqs
+
+
+def contents(batch):
+    return {chat: [m.content for m in msgs] for chat, msgs in batch}
+
+
+def test_batch_groups_by_chat_and_advances_cursor():
+    store, queue = MsgStore(10), NotifyQueue()
+    batcher = MsgBatcher(store, queue)
+    add(store, queue, "x", "1", "2")
+    add(store, queue, "y", "a")
+    assert contents(batcher.get_batch(max_wait=0)) == {"x": ["1", "2"], "y": ["a"]}
+    assert batcher.cursor("default", "x") == 2
+    assert batcher.get_batch(max_wait=0) == []
+
+
+def test_consumers_have_independent_cursors():
+    store, queue = MsgStore(10), NotifyQueue()
+    batcher = MsgBatcher(store, queue)
+    add(store, queue, "x", "1")
+    assert contents(batcher.get_batch(max_wait=0, consumer="c1")) == {"x": ["1"]}
+    add(store, queue, "x", "2")
+    # c2 第一次看到 x：从通知范围开始
+    assert contents(batcher.get_batch(max_wait=0, consumer="c2")) == {"x": ["2"]}
+    add(store, queue, "x", "3")
+    # c1 的游标落后于通知范围，把中间那条一起补上
+    assert contents(batcher.get_batch(max_wait=0, consumer="c1")) == {"x": ["2", "3"]}
+
+
+def test_lagging_cursor_backfills_evicted_messages_from_log(tmp_path):
+    log = MsgLog(tmp_path / "msgs.db")
+    store, queue = MsgStore(2, log=log), NotifyQueue()
+    batcher = MsgBatcher(store, queue)
+    add(store, queue, "x", "1")
+    batcher.get_batch(max_wait=0)
+    add(store, queue, "x", "2", "3", "4", notify=False)
+    add(store, queue, "x", "5")
+    assert contents(batcher.get_batch(max_wait=0)) == {"x": ["2", "3", "4", "5"]}
+    log.close()
+
+
+def test_reset_restarts_from_notice_range():
+    store, queue = MsgStore(10), NotifyQueue()
+    batcher = MsgBatcher(store, queue)
+    add(store, queue, "x", "1")
+    batcher.get_batch(max_wait=0)
+    batcher.reset("default")
+    assert batcher.cursor("default", "x") == 0
+    add(store, queue, "x", "2")
+    assert contents(batcher.get_batch(max_wait=0)) == {"x": ["2"]}
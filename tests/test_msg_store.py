@@ -0,0 +1,90 @@
+from MsgLog import MsgLog
+from MsgStore import MsgStore
+from WxMsg import WxMsg
+
+
+def text(content, sender="a"):
+    return WxMsg(type=0, sender=sender, content=content)
+
+
+def test_seq_is_per_chat_and_monotonic():
+    store = MsgStore(3)
+    assert [store.add("x", text(str(i))) for i in range(3)] == [1, 2, 3]
+    assert store.add("y", text("0")) == 1
+    assert store.last_seq("x") == 3
+
+
+def test_contains_follows_eviction():
+    store = MsgStore(2)
+    store.add("x", text("a"))
+    store.add("x", text("b"))
+    assert store.contains("x", text("a"))
+    store.add("x", text("c"))
+    assert not store.contains("x", text("a"))
+    assert store.contains("x", text("b"))
+    assert not store.contains("y", text("b"))
+
+
+def test_duplicate_hash_counted_until_last_copy_evicted():
+    store = MsgStore(2)
+    store.add("x", text("好的"))
+    store.add("x", text("好的"))
+    store.add("x", text("c"))
+    assert store.contains("x", text("好的"))
+    store.add("x", text("d"))
+    assert not store.contains("x", text("好的"))
+
+
+def test_log_fallback_is_limited_to_recent_window(tmp_path):
+    log = MsgLog(tmp_path / "msgs.db")
+    store = MsgStore(2, log=log, dedup_window=5)
+    store.add("x", text("好的"))
+    for i in range(3):
+        store.add("x", text(str(i)))
+    # 被挤出缓存，但还在最近 5 条内
+    assert store.contains("x", text("好的"))
+    for i in range(3, 8):
+        store.add("x", text(str(i)))
+    store.flush()
+    # 很久以前出现过的短消息不算重复
+    assert not store.contains("x", text("好的"))
+    log.close()
+
+
+def test_log_has_sees_unflushed_rows(tmp_path):
+    log = MsgLog(tmp_path / "msgs.db", batch_size=100)
+    msg = text("a")
+    log.append("x", 1, msg)
+    assert log.has("x", msg.hash_id)
+    assert not log.has("x", msg.hash_id, min_seq=1)
+    log.flush()
+    assert log.has("x", msg.hash_id)
+    assert not log.has("y", msg.hash_id)
+    log.close()
+
+
+def test_since_and_range_backfill_from_log(tmp_path):
+    log = MsgLog(tmp_path / "msgs.db")
+    store = MsgStore(2, log=log)
+    for i in range(1, 6):
+        store.add("x", text(str(i)))
+    assert [seq for seq, _ in store.since("x", 1)] == [2, 3, 4, 5]
+    assert [msg.content for _, msg in store.range("x", 2, 4)] == ["2", "3", "4"]
+    log.close()
+
+
+def test_warm_load_restores_cache_and_seq(tmp_path):
+    path = tmp_path / "msgs.db"
+    log = MsgLog(path)
+    store = MsgStore(2, log=log)
+    for i in range(4):
+        store.add("x", text(str(i)))
+    store.flush()
+    log.close()
+
+    log = MsgLog(path)
+    store = MsgStore(2, log=log)
+    assert store.warm_load() == 2
+    assert [m.content for m in store.snapshot("x")] == ["2", "3"]
+    assert store.add("x", text("4")) == 5
+    log.close()
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from NotifyQueue import NotifyQueue
+
+
+def drain(q):
+    out = []
+    while True:
+        notice = q.get(timeout=0)
+        if notice is None:
+            return out
+        out.append((notice.chat, notice.first_seq, notice.last_seq))
+
+
+def test_same_chat_coalesces_in_place():
+    q = NotifyQueue()
+    q.put("a", 1, 1)
+    q.put("b", 1, 2)
+    q.put("a", 2, 3)
+    assert drain(q) == [("a", 1, 3), ("b", 1, 2)]
+    assert q.stats()["coalesced"] == 1
+
+
+def test_drop_oldest():
+    q = NotifyQueue(capacity=2, overflow="drop_oldest")
+    for chat in "abc":
+        assert q.put(chat, 1, 1)
+    assert drain(q) == [("b", 1, 1), ("c", 1, 1)]
+    assert q.dropped == 1
+
+
+def test_block_put_never_waits_and_wait_capacity_applies_backpressure():
+    q = NotifyQueue(capacity=1, overflow="block", block_timeout=None)
+    q.put("a", 1, 1)
+    t0 = time.monotonic()
+    q.put("b", 1, 1)  # 一轮里登记的通知可以暂时超出容量
+    assert time.monotonic() - t0 < 0.5
+    assert q.depth == 2
+    assert not q.wait_capacity(timeout=0.05)
+
+    threading.Timer(0.05, lambda: drain(q)).start()
+    assert q.wait_capacity(timeout=2.0)
+    assert q.dropped == 0
+
+
+def test_block_timeout_drops_oldest():
+    q = NotifyQueue(capacity=1, overflow="block", block_timeout=0.05)
+    q.put("a", 1, 1)
+    assert q.wait_capacity(timeout=1.0)
+    assert q.dropped == 1
+    assert q.depth == 0
+
+
+def test_wait_capacity_returns_when_closed():
+    q = NotifyQueue(capacity=1, overflow="block", block_timeout=None)
+    q.put("a", 1, 1)
+    threading.Timer(0.05, q.close).start()
+    assert q.wait_capacity(timeout=2.0)
+    assert not q.put("b", 1, 1)
+
+
+def test_other_policies_never_wait():
+    assert NotifyQueue(capacity=1, overflow="drop_oldest").wait_capacity(timeout=0)
+
+
+def test_spill_preserves_order_and_reads_back(tmp_path):
+    path = tmp_path / "notify.spill"
+    q = NotifyQueue(capacity=2, overflow="spill", spill_path=path)
+    q.put("a", 1, 1)
+    q.put("b", 1, 1)
+    q.put("c", 1, 1)  # 写到文件
+    q.put("a", 2, 2)  # 内存里的合并
+    q.put("c", 2, 2)  # 文件里还有 c，接在后面写
+    q.put("d", 1, 1)
+    assert q.stats()["on_disk"] == 2
+    assert drain(q) == [("a", 1, 2), ("b", 1, 1), ("c", 1, 2), ("d", 1, 1)]
+    assert path.read_bytes() == b""
+
+
+def test_spill_resume_across_restart(tmp_path):
+    path = tmp_path / "notify.spill"
+    q = NotifyQueue(capacity=1, overflow="spill", spill_path=path)
+    q.put("a", 1, 1)
+    q.put("b", 1, 3)
+    q2 = NotifyQueue(capacity=1, overflow="spill", spill_path=path, resume_spill=True)
+    assert drain(q2) == [("b", 1, 3)]
+    q3 = NotifyQueue(capacity=1, overflow="spill", spill_path=path, resume_spill=False)
+    assert q3.depth == 0
+
+
+def test_spill_file_only_for_spill_policy(tmp_path):
+    path = tmp_path / "sub" / "notify.spill"
+    NotifyQueue(capacity=1, overflow="drop_oldest", spill_path=path).put("a", 1, 1)
+    assert not path.parent.exists()
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        NotifyQueue(overflow="nope")
+    with pytest.raises(ValueError):
+        NotifyQueue(overflow="spill")
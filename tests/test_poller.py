@@ -0,0 +1,198 @@
+import pytest
+
+from Poller import ConvListDiffer, MsgAnchor, SweepPlanner, locate_anchor, make_anchor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def titles(*names):
+    return list(names)
+
+
+# ---- SweepPlanner ----
+
+def test_round_robin_rotates_start():
+    planner = SweepPlanner(order="round_robin")
+    unread = [("a", 1), ("b", 1), ("c", 1)]
+    assert [n for n, _ in planner.plan(unread)] == ["a", "b", "c"]
+    assert [n for n, _ in planner.plan(unread)] == ["b", "c", "a"]
+    assert [n for n, _ in planner.plan(unread)] == ["c", "a", "b"]
+
+
+def test_oldest_waiting_serves_longest_waiting_first():
+    clock = FakeClock()
+    planner = SweepPlanner(order="oldest_waiting", max_chats=1, clock=clock)
+    served = []
+    planner.sweep([("a", 1)], lambda name, cnt: served.append(name))
+    clock.now = 1.0
+    planner.sweep([("b", 1), ("c", 1)], lambda name, cnt: served.append(name))
+    clock.now = 2.0
+    planner.sweep([("d", 1), ("c", 1)], lambda name, cnt: served.append(name))
+    assert served == ["a", "b", "c"]
+
+
+def test_sweep_stops_at_max_hold_but_serves_at_least_one():
+    clock = FakeClock()
+    planner = SweepPlanner(order="top_first", max_hold=1.0, clock=clock)
+
+    def handle(name, cnt):
+        clock.now += 0.6
+
+    assert planner.sweep([("a", 1), ("b", 1), ("c", 1)], handle) == 2
+    assert planner.last_served == ["a", "b"]
+    assert planner.last_pending == ["c"]
+
+    planner = SweepPlanner(order="top_first", max_hold=0.0, clock=clock)
+    assert planner.sweep([("a", 1), ("b", 1)], handle) == 1
+
+
+def test_unknown_order_rejected():
+    with pytest.raises(ValueError):
+        SweepPlanner(order="random")
+
+
+# ---- ConvListDiffer ----
+
+def names_of(pending):
+    return [name for name, _ in pending]
+
+
+def test_first_snapshot_reports_only_unread():
+    differ = ConvListDiffer()
+    pending = differ.pending_fetch(differ.diff(titles("a", "b2条新消息", "c")))
+    assert pending == [("b", 2)]
+
+
+def test_unchanged_list_reports_nothing():
+    differ = ConvListDiffer()
+    differ.diff(titles("a", "b", "c"))
+    assert differ.diff(titles("a", "b", "c")) == []
+
+
+def test_mid_list_deletion_is_not_a_move():
+    differ = ConvListDiffer()
+    snapshot = [f"chat{i}" for i in range(10)]
+    differ.diff(snapshot)
+    # chat2 被删除（或隐藏），下面的会话整体上移一位，末尾补进来一个新会话
+    after = snapshot[:2] + snapshot[3:] + ["chat10"]
+    assert differ.pending_fetch(differ.diff(after)) == []
+
+
+def test_chat_jumping_to_top_is_reported_even_without_badge():
+    differ = ConvListDiffer()
+    differ.diff(titles("a", "b", "c", "d", "e"))
+    changes = differ.diff(titles("d", "a", "b", "c", "e"))
+    assert [c.name for c in changes if c.moved_up] == ["d"]
+    assert differ.pending_fetch(changes) == [("d", 1)]
+
+
+def test_new_chat_entering_at_top_is_reported():
+    differ = ConvListDiffer()
+    differ.diff(titles("a", "b", "c"))
+    assert names_of(differ.pending_fetch(differ.diff(titles("n", "a", "b")))) == ["n"]
+
+
+def test_unread_count_change_is_reported():
+    differ = ConvListDiffer()
+    differ.diff(titles("a", "b1条新消息", "c"))
+    assert differ.pending_fetch(differ.diff(titles("a", "b3条新消息", "c"))) == [("b", 3)]
+
+
+def test_expected_move_is_ignored_once():
+    differ = ConvListDiffer()
+    differ.diff(titles("a", "b", "c"))
+    differ.expect_move("c")
+    assert differ.pending_fetch(differ.diff(titles("c", "a", "b"))) == []
+    differ.diff(titles("a", "b", "c"))
+    assert names_of(differ.pending_fetch(differ.diff(titles("c", "a", "b")))) == ["c"]
+
+
+def test_parse_cache_limits_reparsing():
+    differ = ConvListDiffer()
+    differ.diff(titles("a", "b", "c", "d"))
+    parsed = differ.parse_cnt
+    differ.diff(titles("d", "a", "b", "c"))
+    assert differ.parse_cnt == parsed
+
+
+def test_retry_backs_off_and_gives_up():
+    clock = FakeClock()
+    differ = ConvListDiffer(max_retries=3, retry_backoff=1.0, clock=clock)
+    differ.diff(titles("a"))
+
+    differ.retry("x", 2)
+    assert not differ.has_retry
+    assert differ.pending_fetch([]) == []
+    clock.now = 1.0
+    assert differ.has_retry
+    assert differ.pending_fetch([]) == [("x", 2)]
+
+    differ.retry("x")  # 第二次失败，等 2 秒
+    clock.now = 2.5
+    assert not differ.has_retry
+    clock.now = 3.0
+    assert differ.has_retry
+
+    differ.retry("x")  # 第三次失败，放弃
+    assert not differ.has_retry
+    assert differ.dropped == 1
+
+
+def test_unserved_retry_is_due_immediately_and_not_counted():
+    clock = FakeClock()
+    differ = ConvListDiffer(max_retries=1, clock=clock)
+    for _ in range(5):
+        differ.retry("x", 1, failed=False)
+    assert differ.has_retry
+    differ.fetched("x")
+    assert not differ.has_retry
+    assert differ.dropped == 0
+
+
+def test_top_changed():
+    differ = ConvListDiffer()
+    assert differ.top_changed(["a"])
+    differ.diff(titles("a", "b", "c"))
+    assert not differ.top_changed(["a", "b"])
+    assert differ.top_changed(["c", "a"])
+
+
+# ---- locate_anchor ----
+
+def keys(items):
+    """items: [(runtime_id, signature)...]"""
+    return lambda i: items[i]
+
+
+def test_locate_anchor_by_runtime_id():
+    items = [((1,), "x"), ((2,), "y"), ((3,), "z")]
+    anchor = make_anchor(keys(items), 1)
+    items.append(((4,), "w"))
+    assert locate_anchor(len(items), keys(items), anchor) == 1
+
+
+def test_locate_anchor_falls_back_to_tail_when_ids_change():
+    items = [((1,), "a"), ((2,), "b"), ((3,), "b"), ((4,), "c")]
+    anchor = make_anchor(keys(items), 2)
+    rebuilt = [((9,), "a"), ((10,), "b"), ((11,), "b"), ((12,), "c"), ((13,), "b")]
+    assert locate_anchor(len(rebuilt), keys(rebuilt), anchor) == 2
+
+
+def test_locate_anchor_distinguishes_repeated_messages_by_sequence():
+    # 签名都是 "好的"，只有序列能区分：锚点在第二条 "好的" 上
+    items = [(None, "在吗"), (None, "好的"), (None, "好的")]
+    anchor = make_anchor(keys(items), 2)
+    items += [(None, "好的")]
+    assert locate_anchor(len(items), keys(items), anchor) == 2
+
+
+def test_locate_anchor_missing():
+    items = [((1,), "x"), ((2,), "y")]
+    assert locate_anchor(len(items), keys(items), MsgAnchor(runtime_id=(7,), tail=("q",))) is None
+    assert locate_anchor(len(items), keys(items), MsgAnchor(runtime_id=None, tail=())) is None
@@ -3,9 +3,15 @@ import win32clipboard
 import win32con
 from PIL import Image
 import io
+import json
+import os
 import re
+import queue
 import random
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from threading import Lock, Thread
 
 
 def _escape_send_keys_char(ch: str) -> str:
@@ -24,14 +30,41 @@ def _escape_send_keys_char(ch: str) -> str:
     return ch
 
 
+def plan_keystrokes(text: str, low: float, high: float, *, with_enter: bool = False) -> list[tuple[float, str]]:
+    """
+    预先算好整段文本的按键序列与时间表：[(相对开始的时刻, send_keys 序列)...]
+    每个字符之后的间隔服从 uniform(low, high)，与逐字符键入的分布一致
+    """
+    plan = []
+    t = 0.0
+    for ch in str(text):
+        seq = _escape_send_keys_char(ch)
+        if seq:
+            plan.append((t, seq))
+        t += random.uniform(low, high)
+    if with_enter:
+        plan.append((t, "{ENTER}"))
+    return plan
+
+
 def type_text_humanlike(
     text: str,
     *,
     with_enter: bool = False,
     min_interval: float = 0.02,
     max_interval: float = 0.12,
+    burst_gap: float = 0.015,
+    paste_threshold: int = 0,
 ):
-    """模拟人类键入：逐字符输入 + 随机间隔，不使用剪贴板。"""
+    """
+    模拟人类键入：随机间隔，不使用剪贴板。
+    - 按键序列和时间表一次算好，按绝对时刻回放，send_keys 的调用开销不会累积成额外延迟
+    - 相邻按键间隔小于 burst_gap，或已经落后于时间表时，合并成一次 send_keys 调用
+    - paste_threshold > 0 且文本长度超过它时，改为整段粘贴
+    """
+    if paste_threshold and text and len(str(text)) > paste_threshold:
+        paste_text(str(text), with_enter=with_enter)
+        return
     if not text:
         if with_enter:
             send_keys("{ENTER}", pause=0, with_spaces=True)
@@ -39,15 +72,148 @@ def type_text_humanlike(
 
     low = max(0.0, float(min_interval))
     high = max(low, float(max_interval))
-    for ch in str(text):
-        seq = _escape_send_keys_char(ch)
-        if seq:
-            send_keys(seq, pause=0, with_spaces=True)
+    # 原来最后一个字符后还会等一下再回车，这里体现为 {ENTER} 的时刻在最后一个间隔之后
+    plan = plan_keystrokes(text, low, high, with_enter=with_enter)
+    start = time.perf_counter()
+    i = 0
+    while i < len(plan):
+        at, seq = plan[i]
+        delay = start + at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        burst = [seq]
+        i += 1
+        now = time.perf_counter() - start
+        while i < len(plan) and (plan[i][0] <= now or plan[i][0] - at < burst_gap):
+            burst.append(plan[i][1])
+            i += 1
+        send_keys("".join(burst), pause=0, with_spaces=True)
+    # 与逐字符版本一致：最后一个字符后同样有一次随机停顿
+    if not with_enter:
         time.sleep(random.uniform(low, high))
 
+def _stream_safe_len(buf: str) -> int:
+    """
+    buf 中可以立即键入的前缀长度：
+      - 末尾未闭合的 [表情代码 先不打，等它完整
+      - 末尾的空白先不打，流结束时整体 strip
+    """
+    n = len(buf)
+    open_at = buf.rfind("[")
+    if open_at >= 0 and "]" not in buf[open_at:]:
+        n = open_at
+    while n > 0 and buf[n - 1].isspace():
+        n -= 1
+    return n
+
+
+def type_text_stream(
+    chunks,
+    *,
+    with_enter: bool = False,
+    min_interval: float = 0.02,
+    max_interval: float = 0.12,
+    fallback_text: str = "",
+) -> str:
+    """
+    边接收边键入：chunks 为模型流式输出的文本增量，第一块可安全键入的内容到达后就开始按人类速度输入，
+    流结束后才按回车。流中途出错时清空输入框，改为键入 fallback_text。
+    return: 实际发送（或留在输入框中）的文本
+    """
+    low = max(0.0, float(min_interval))
+    high = max(low, float(max_interval))
+    buf = ""
+    typed = 0
+
+    def type_chars(s: str) -> None:
+        for ch in s:
+            seq = _escape_send_keys_char(ch)
+            if seq:
+                send_keys(seq, pause=0, with_spaces=True)
+            time.sleep(random.uniform(low, high))
+
+    try:
+        for chunk in chunks:
+            buf += chunk
+            if typed == 0:
+                stripped = buf.lstrip()
+                if not stripped:
+                    continue
+                buf = stripped
+            safe = _stream_safe_len(buf)
+            if safe > typed:
+                type_chars(buf[typed:safe])
+                typed = safe
+        final = buf.strip()
+        if not final:
+            raise ValueError("模型返回为空")
+        type_chars(final[typed:])
+    except Exception as e:
+        print(f'流式键入中断：{e}，改为发送原文')
+        if typed:
+            send_keys("^a{BACKSPACE}", pause=0, with_spaces=True)
+            time.sleep(random.uniform(low, high))
+        final = str(fallback_text or "")
+        type_chars(final)
+
     if with_enter:
         time.sleep(random.uniform(low, high))
         send_keys("{ENTER}", pause=0, with_spaces=True)
+    return final
+
+
+class StreamPrefetch:
+    """
+    在后台线程消费模型的流式输出并缓存：调用方先等 first（第一块非空内容到达、流结束或出错）再去占用 UI 线程，
+    模型的首包延迟不计入 UI 锁；之后把 chunks() 交给 type_text_stream 边收边键入。
+    键入过程中流停顿超过 stall_timeout 秒视为出错（type_text_stream 会改发原文），UI 线程最多被空等这么久。
+    """
+
+    _END = object()
+
+    def __init__(self, open_stream, stall_timeout: float | None = None) -> None:
+        """open_stream: 无参函数，返回文本增量的迭代器（在后台线程中调用，建立连接的耗时也不落在调用方）"""
+        self.stall_timeout = stall_timeout
+        self.first = Future()  # 结果为 True 表示已有内容，False 表示流在产出内容前就结束或出错
+        self._q = queue.Queue()
+        Thread(target=self._pump, args=(open_stream,), name="StreamPrefetch", daemon=True).start()
+
+    def _pump(self, open_stream) -> None:
+        try:
+            for chunk in open_stream():
+                if not chunk:
+                    continue
+                self._q.put(chunk)
+                if not self.first.done() and chunk.strip():
+                    self.first.set_result(True)
+        except Exception as e:
+            self._q.put(e)
+        else:
+            self._q.put(self._END)
+        finally:
+            if not self.first.done():
+                self.first.set_result(False)
+
+    def wait_first(self, timeout: float | None = None) -> bool:
+        """阻塞到第一块内容到达（或流结束/出错）；超时返回 False"""
+        try:
+            self.first.result(timeout)
+        except FutureTimeout:
+            return False
+        return True
+
+    def chunks(self):
+        while True:
+            try:
+                item = self._q.get(timeout=self.stall_timeout)
+            except queue.Empty:
+                raise TimeoutError(f'模型流式输出停顿超过 {self.stall_timeout}s') from None
+            if item is self._END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
 
 def set_clipboard_text(text: str) -> None:
     win32clipboard.OpenClipboard()
@@ -59,7 +225,65 @@ def set_clipboard_text(text: str) -> None:
     finally:
         win32clipboard.CloseClipboard()
 
-def set_clipboard_image(image_path: str) -> None:
+class DibCache:
+    """
+    可直接放入剪贴板的 DIB 字节的 LRU 缓存，键为 (绝对路径, mtime, 文件大小)，
+    文件被修改后键自然失效；总字节数超过 budget 时淘汰最久未用的条目。
+    """
+
+    def __init__(self, budget: int = 64 * 1024 * 1024) -> None:
+        self.budget = int(budget)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> bytes
+        self._lock = Lock()
+
+    @staticmethod
+    def key_of(image_path: str) -> tuple:
+        path = os.path.abspath(image_path)
+        st = os.stat(path)
+        return path, st.st_mtime_ns, st.st_size
+
+    def get(self, image_path: str) -> bytes:
+        key = self.key_of(image_path)
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = image_to_dib(image_path)
+        self.put(key, data)
+        return data
+
+    def put(self, key: tuple, data: bytes) -> None:
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            if len(data) > self.budget:
+                return
+            # 同一路径的旧版本（文件被改过）不会再命中，一并清掉
+            for stale in [k for k in self._items if k[0] == key[0]]:
+                self.size -= len(self._items.pop(stale))
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.budget and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+dib_cache = DibCache()
+
+
+def image_to_dib(image_path: str) -> bytes:
     image = Image.open(image_path)
     if image.mode != "RGB":
         image = image.convert("RGB")
@@ -67,6 +291,16 @@ def set_clipboard_image(image_path: str) -> None:
     image.save(output, "BMP")
     data = output.getvalue()[14:]
     output.close()
+    return data
+
+
+def prepare_image(image_path: str) -> int:
+    """提前把图片转成 DIB 放进缓存（例如群发前预热），返回 DIB 字节数"""
+    return len(dib_cache.get(image_path))
+
+
+def set_clipboard_image(image_path: str) -> None:
+    data = dib_cache.get(image_path)
     win32clipboard.OpenClipboard()
     try:
         win32clipboard.EmptyClipboard()
@@ -90,6 +324,20 @@ def paste_image(image_path, with_enter=False, pause=0):
     else:
         send_keys("^v", pause=pause, with_spaces=True)
 
+def parse_json_array(text: str):
+    """从模型回复中解析 JSON 数组（容忍 ```json 代码块或前后多余文字），失败返回 None"""
+    if not text:
+        return None
+    s = str(text)
+    start, end = s.find("["), s.rfind("]")
+    if start < 0 or end <= start:
+        return None
+    try:
+        value = json.loads(s[start:end + 1])
+    except ValueError:
+        return None
+    return value if isinstance(value, list) else None
+
 def zip_text(text: str, max_len: int=40) -> str:
     s = "".join(c for c in text if c != "\n")
     return s if len(s) < max_len else f"“{s[:10]}......{s[-10:]}”"
@@ -157,4 +405,34 @@ def flash_rect(rect, color=0x0000FF, width=3, times=3, on_ms=120, off_ms=80):
             win32gui.SelectObject(hdc, old_brush)
             win32gui.DeleteObject(pen)
     finally:
-        win32gui.ReleaseDC(0, hdc)
\ No newline at end of file
+        win32gui.ReleaseDC(0, hdc)
+
+if __name__ == "__main__":
+    # 演示：本地假模型服务（bench/StubLLM.py，首包 0.8s，之后每 0.1s 一块）上，流式润色的第一次按键早于生成结束；
+    # 第二个请求输出两块后连接中途断开，已键入的内容被清空并改发原文。这里只记录按键时间，不真正按键
+    from API import API
+    from bench.StubLLM import StubLLMServer
+
+    keys = []
+
+    def send_keys(seq, **kwargs):
+        keys.append((time.perf_counter(), seq))
+
+    original = '今晚七点见'
+    reply = '好的，今晚七点见，不见不散[微笑]'
+    for label, disconnect_after in (('ok', None), ('broken', 2)):
+        with StubLLMServer(lambda messages: reply, ttft=0.8, per_char=0.025, disconnect_after=disconnect_after) as server:
+            api = API({'provider': {'api_key': 'stub', 'url': server.url, 'model': 'stub'}, 'http': {'max_retries': 0}})
+            keys.clear()
+            t0 = time.perf_counter()
+            stream = StreamPrefetch(lambda: api.stream_response([{'role': 'user', 'content': original}]), stall_timeout=2.0)
+            stream.wait_first()
+            ready = time.perf_counter()
+            sent = type_text_stream(stream.chunks(), with_enter=True, min_interval=0.01, max_interval=0.03,
+                                    fallback_text=original)
+            end = time.perf_counter()
+            first_key = keys[0][0] - t0
+            done = f'{server.finished[0] - t0:.2f}s' if server.finished else '未完成（中途断开）'
+            cleared = any(seq.startswith('^a') for _, seq in keys)
+            print(f'{label:<7} 首包 {ready - t0:.2f}s（之前不占 UI 线程），第一次按键 {first_key:.2f}s，生成结束 {done}，'
+                  f'键入完成 {end - t0:.2f}s，清空重打：{cleared}，发送：{sent}')